@@ -0,0 +1,230 @@
+"""
+Columnar (NumPy) analytics over pesadas.
+
+A Frame holds one typed array per field instead of a list of dicts: the
+date as datetime64[D], neto/bruto/tara/importe as float64 (NaN when empty),
+and tipo, mercadería and contraparte as integer category codes. Filters,
+group-bys and time bucketing are then single vectorized operations over
+the whole range. Frames are built from entries (one row per pesada) or
+from the daily rollup (one row per fecha/tipo/mercadería/contraparte, see
+daily_totals), whose `count` column says how many pesadas each row sums.
+
+NumPy is optional: without it NUMPY_AVAILABLE is False and callers keep
+their plain-Python loops.
+"""
+
+import math
+from typing import List, Any, Optional, Dict, Iterable, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+TIPOS = ("Compra", "Venta")
+_TIPO_CODES = {tipo: code for code, tipo in enumerate(TIPOS)}
+PERIODS = ("day", "week", "month", "year")
+
+
+class Categories:
+    """Interns labels into integer codes (None is -1). Codes follow order of first appearance."""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value: Any) -> int:
+        if value is None or value == "":
+            return -1
+        value = str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def label(self, code: int) -> Optional[str]:
+        return None if code < 0 else self.values[code]
+
+
+def _number(value: Any) -> float:
+    if value is None or value == "":
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _dates(values: List[str]) -> "np.ndarray":
+    """YYYY-MM-DD strings to datetime64[D]; unparseable ones become NaT."""
+    try:
+        return np.array(values, dtype="datetime64[D]")
+    except ValueError:
+        parsed = []
+        for value in values:
+            try:
+                parsed.append(np.datetime64(value, "D"))
+            except ValueError:
+                parsed.append(np.datetime64("NaT", "D"))
+        return np.array(parsed, dtype="datetime64[D]")
+
+
+class Frame:
+    """Equal-length column arrays, one row per pesada (or per rollup row)."""
+
+    NUMERIC = ("count", "neto", "bruto", "tara", "importe")
+
+    def __init__(self, columns: Dict[str, "np.ndarray"], mercaderias: Categories, contrapartes: Categories):
+        self.columns = columns
+        self.categories = {"tipo": Categories(TIPOS), "mercaderia": mercaderias, "contraparte": contrapartes}
+
+    def __len__(self) -> int:
+        return len(self.columns["fecha"])
+
+    def __getitem__(self, name: str) -> "np.ndarray":
+        return self.columns[name]
+
+    @classmethod
+    def from_entries(cls, items: Iterable[Tuple[str, str, Dict[str, Any]]]) -> "Frame":
+        """Builds a frame from (date, tipo, entry) items such as daily_excel_logger.load_range yields."""
+        items = list(items)
+        count = len(items)
+        mercaderias, contrapartes = Categories(), Categories()
+        columns = {
+            "fecha": _dates([date_str for date_str, _, _ in items]),
+            "tipo": np.fromiter((_TIPO_CODES.get(tipo, -1) for _, tipo, _ in items), np.int8, count),
+            "mercaderia": np.fromiter((mercaderias.code(e.get("mercaderia")) for _, _, e in items), np.int32, count),
+            "contraparte": np.fromiter(
+                (contrapartes.code(e.get("proveedor") or e.get("cliente")) for _, _, e in items), np.int32, count
+            ),
+            "count": np.ones(count, np.int64),
+        }
+        for name in ("neto", "bruto", "tara", "importe"):
+            columns[name] = np.fromiter((_number(e.get(name)) for _, _, e in items), np.float64, count)
+        return cls(columns, mercaderias, contrapartes)
+
+    @classmethod
+    def from_totals(cls, totals: Iterable[Tuple[Any, ...]], like: Optional["Frame"] = None) -> "Frame":
+        """
+        Builds a frame from daily rollup rows (daily_totals.DailyTotal or load_rows tuples); bruto and
+        tara are unknown there. Pass `like` to share another frame's categories, so both can be concat()ed.
+        """
+        totals = list(totals)
+        count = len(totals)
+        mercaderias = Categories() if like is None else like.categories["mercaderia"]
+        contrapartes = Categories() if like is None else like.categories["contraparte"]
+        columns = {
+            "fecha": _dates([t[0] for t in totals]),
+            "tipo": np.fromiter((_TIPO_CODES.get(t[1], -1) for t in totals), np.int8, count),
+            "mercaderia": np.fromiter((mercaderias.code(t[2]) for t in totals), np.int32, count),
+            "contraparte": np.fromiter((contrapartes.code(t[3]) for t in totals), np.int32, count),
+            "count": np.fromiter((t[4] for t in totals), np.int64, count),
+            "neto": np.fromiter((t[5] for t in totals), np.float64, count),
+            "bruto": np.full(count, math.nan),
+            "tara": np.full(count, math.nan),
+            "importe": np.fromiter((t[6] for t in totals), np.float64, count),
+        }
+        return cls(columns, mercaderias, contrapartes)
+
+    def take(self, mask) -> "Frame":
+        """The masked rows as a new frame sharing this frame's categories."""
+        return Frame({name: values[mask] for name, values in self.columns.items()},
+                     self.categories["mercaderia"], self.categories["contraparte"])
+
+    @staticmethod
+    def concat(frames: List["Frame"]) -> "Frame":
+        """Stacks frames that share their categories (see from_totals/take)."""
+        first = frames[0]
+        if any(f.categories["mercaderia"] is not first.categories["mercaderia"]
+               or f.categories["contraparte"] is not first.categories["contraparte"] for f in frames):
+            raise ValueError("Frames to concat must share their categories")
+        return Frame({name: np.concatenate([f.columns[name] for f in frames]) for name in first.columns},
+                     first.categories["mercaderia"], first.categories["contraparte"])
+
+    def date_mask(self, dates: Iterable[str]) -> "np.ndarray":
+        """Rows whose date is one of `dates` (YYYY-MM-DD)."""
+        return np.isin(self.columns["fecha"], _dates(sorted(set(dates))))
+
+    def mask(self, start_date: Optional[str] = None, end_date: Optional[str] = None, entry_type: Optional[str] = None,
+             mercaderia: Optional[str] = None, contraparte: Optional[str] = None) -> "np.ndarray":
+        """Boolean row mask; every given condition must hold (dates YYYY-MM-DD, inclusive)."""
+        fecha = self.columns["fecha"]
+        keep = ~np.isnat(fecha)
+        if start_date:
+            keep &= fecha >= np.datetime64(start_date, "D")
+        if end_date:
+            keep &= fecha <= np.datetime64(end_date, "D")
+        for name, label in (("tipo", entry_type), ("mercaderia", mercaderia), ("contraparte", contraparte)):
+            if label is not None:
+                code = self.categories[name].codes.get(label)
+                keep &= self.columns[name] == (-2 if code is None else code)
+        return keep
+
+    def _values(self, column: str, mask) -> "np.ndarray":
+        values = self.columns[column]
+        values = values if mask is None else values[mask]
+        return np.nan_to_num(values.astype(np.float64, copy=False), nan=0.0)
+
+    def sum(self, column: str, mask=None) -> float:
+        """Sum of a numeric column over the masked rows; empty values count as 0."""
+        return float(self._values(column, mask).sum())
+
+    def group_sum(self, by: str, column: str, mask=None) -> Dict[Optional[str], float]:
+        """{label of `by`: sum of `column`} for the masked rows, labels in order of first appearance."""
+        codes = self.columns[by] if mask is None else self.columns[by][mask]
+        if not len(codes):
+            return {}
+        shifted = codes.astype(np.int64) + 1  # -1 (no label) -> 0
+        sums = np.bincount(shifted, weights=self._values(column, mask))
+        present = np.flatnonzero(np.bincount(shifted))
+        # Row of each code's first appearance: with repeated indices the last assignment wins, so assign reversed
+        first = np.empty(len(sums), np.int64)
+        first[shifted[::-1]] = np.arange(len(shifted) - 1, -1, -1)
+        categories = self.categories[by]
+        return {categories.label(int(code) - 1): float(sums[code]) for code in present[np.argsort(first[present])]}
+
+    def buckets(self, period: str) -> "np.ndarray":
+        """First day of each row's day/week (Monday)/month/year, as datetime64[D]."""
+        fecha = self.columns["fecha"]
+        if period == "day":
+            return fecha
+        if period == "week":
+            # 1970-01-01 was a Thursday: +3 makes Monday weekday 0
+            weekday = (fecha.astype(np.int64) + 3) % 7
+            return fecha - weekday.astype("timedelta64[D]")
+        if period == "month":
+            return fecha.astype("datetime64[M]").astype("datetime64[D]")
+        if period == "year":
+            return fecha.astype("datetime64[Y]").astype("datetime64[D]")
+        raise ValueError(f"Unknown period: {period}")
+
+    def bucket_sum(self, period: str, column: str, mask=None, by: Optional[str] = None) -> Dict[Any, float]:
+        """
+        {bucket start 'YYYY-MM-DD': sum} for the masked rows, oldest first; with `by`, keys are
+        (bucket start, label) pairs. Rows without a valid date are left out.
+        """
+        keep = ~np.isnat(self.columns["fecha"])
+        if mask is not None:
+            keep &= mask
+        starts = self.buckets(period)[keep]
+        if not len(starts):
+            return {}
+        values = self._values(column, keep)
+        bucket_values, bucket_index = np.unique(starts, return_inverse=True)
+        if by is None:
+            sums = np.bincount(bucket_index, weights=values, minlength=len(bucket_values))
+            return {str(bucket_values[i]): float(sums[i]) for i in range(len(bucket_values))}
+        categories = self.categories[by]
+        width = len(categories.values) + 1
+        keys = bucket_index.astype(np.int64) * width + (self.columns[by][keep].astype(np.int64) + 1)
+        present, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=values, minlength=len(present))
+        return {
+            (str(bucket_values[key // width]), categories.label(int(key % width) - 1)): float(total)
+            for key, total in zip(present, sums)
+        }
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los cálculos del dashboard.
+
+Genera en memoria varios años de pesadas sintéticas y compara, para el
+cálculo de /api/dashboard/data (kilos comprados, vendidos y comprados por
+material) sobre todo el rango:
+- "bucle": el recorrido en Python de la lista de diccionarios, como se
+  calculaba antes;
+- "vectorizado": el mismo cálculo con analytics.Frame (arrays de NumPy),
+  sin contar la construcción del Frame, que se informa aparte;
+- "resumen diario": analytics.Frame sobre las filas del resumen diario
+  (una por fecha, tipo, mercadería y contraparte), que es lo que el endpoint mantiene
+  en memoria.
+
+Uso:
+    python bench_analytics.py [--years 3] [--rows 40] [--repeats 5]
+"""
+
+import argparse
+import itertools
+import math
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+import analytics
+import daily_totals
+
+MATERIALES = ["Cobre", "Bronce", "Aluminio", "Hierro", "Plomo", "Acero inoxidable", "Baterías", "Cable"]
+
+
+def build_entries(years, rows_per_day):
+    """(fecha, tipo, entry) de `years` años con `rows_per_day` pesadas por día."""
+    rnd = random.Random(0)
+    start = date.today() - timedelta(days=365 * years)
+    items = []
+    next_id = 1
+    for offset in range(365 * years):
+        date_str = (start + timedelta(days=offset)).isoformat()
+        for _ in range(rows_per_day):
+            tipo = "Compra" if rnd.random() < 0.7 else "Venta"
+            neto = float(rnd.randint(50, 5000))
+            entry = {"id": next_id, "mercaderia": rnd.choice(MATERIALES), "neto": neto, "importe": neto * 1.5,
+                     "proveedor" if tipo == "Compra" else "cliente": f"Contraparte {rnd.randint(1, 60)}"}
+            items.append((date_str, tipo, entry))
+            next_id += 1
+    return items
+
+
+def loop_totals(items):
+    """Cálculo anterior: un recorrido de Python por pesada."""
+    total_comprados = 0
+    total_vendidos = 0
+    material_summary = {}
+    for _, tipo, item in items:
+        kilos = item.get("neto", 0) or 0
+        if tipo == "Venta":
+            total_vendidos += kilos
+            continue
+        total_comprados += kilos
+        material = item.get("mercaderia", "Desconocido")
+        material_summary[material] = material_summary.get(material, 0) + kilos
+    return total_comprados, total_vendidos, material_summary
+
+
+def frame_totals(frame, start, end):
+    compras = frame.mask(start, end, "Compra")
+    ventas = frame.mask(start, end, "Venta")
+    return frame.sum("neto", compras), frame.sum("neto", ventas), frame.group_sum("mercaderia", "neto", compras)
+
+
+def best(func, *args, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - started)
+    return min(times), statistics.median(times), result
+
+
+def same(a, b):
+    return (math.isclose(a[0], b[0]) and math.isclose(a[1], b[1]) and list(a[2]) == list(b[2])
+            and all(math.isclose(a[2][k], b[2][k]) for k in a[2]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara el cálculo del dashboard en bucle y vectorizado")
+    parser.add_argument("--years", type=int, default=3, help="Años de historial sintético")
+    parser.add_argument("--rows", type=int, default=40, help="Pesadas por día")
+    parser.add_argument("--repeats", type=int, default=5, help="Repeticiones de cada cálculo")
+    args = parser.parse_args(argv)
+
+    if not analytics.NUMPY_AVAILABLE:
+        print("✗ NumPy no está instalado (pip install numpy)")
+        return 1
+
+    print(f"Generando {args.years} años x {args.rows} pesadas por día...")
+    items = build_entries(args.years, args.rows)
+    print(f"  {len(items)} pesadas")
+
+    start, end = items[0][0], items[-1][0]
+    _, build_time, frame = best(analytics.Frame.from_entries, items, repeats=1)
+    totals = [total for date_str, group in itertools.groupby(items, key=lambda item: item[0])
+              for total in daily_totals.rollup(date_str, ((t, e["mercaderia"], e.get("proveedor") or e.get("cliente"), e["neto"], e["importe"])
+                                                  for _, t, e in group))]
+    _, rollup_build_time, rollup_frame = best(analytics.Frame.from_totals, totals, repeats=1)
+
+    loop_best, loop_median, expected = best(loop_totals, items, repeats=args.repeats)
+    vec_best, vec_median, vectorized = best(frame_totals, frame, start, end, repeats=args.repeats)
+    roll_best, roll_median, rolled = best(frame_totals, rollup_frame, start, end, repeats=args.repeats)
+    for name, result in (("vectorizado", vectorized), ("resumen diario", rolled)):
+        if not same(expected, result):
+            print(f"✗ El resultado {name} difiere del bucle")
+            return 1
+
+    print(f"Totales del dashboard sobre todo el rango (mejor / mediana de {args.repeats}):")
+    print(f"  bucle:          {loop_best * 1000:8.1f} / {loop_median * 1000:8.1f} ms")
+    print(f"  vectorizado:    {vec_best * 1000:8.1f} / {vec_median * 1000:8.1f} ms  (+ {build_time * 1000:.0f} ms una vez para armar el Frame)")
+    print(f"  resumen diario: {roll_best * 1000:8.1f} / {roll_median * 1000:8.1f} ms  ({len(rollup_frame)} filas; + {rollup_build_time * 1000:.0f} ms una vez)")
+    print(f"✓ Vectorizado {loop_median / vec_median:.0f}x y resumen diario {loop_median / roll_median:.0f}x más rápidos que el bucle, mismos resultados")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
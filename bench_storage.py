@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark de lectura de hojas históricas.
+
+Genera un libro sintético (por defecto 365 hojas, una por día) y compara,
+para varias fechas al azar, dos formas de leer una hoja:
+- "libro completo": openpyxl.load_workbook con estilos y todas las hojas,
+  como se leía antes cualquier fecha;
+- "solo lectura": la lectura rápida de daily_excel_logger, que abre el libro
+  en modo read_only/values_only y parsea únicamente la hoja pedida.
+
+Uso:
+    python bench_storage.py [--days 365] [--rows 40] [--reads 10]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import openpyxl
+from openpyxl import Workbook
+
+import daily_excel_logger
+
+
+def build_workbook(path, days, rows_per_day):
+    """Crea un libro con `days` hojas de fecha y `rows_per_day` pesadas por hoja."""
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    start = date.today() - timedelta(days=days)
+    next_id = {"Compra": 1, "Venta": 1}
+    dates = []
+    for offset in range(days):
+        date_str = (start + timedelta(days=offset)).isoformat()
+        dates.append(date_str)
+        sheet = workbook.create_sheet(title=date_str)
+        sheet.append(daily_excel_logger.HEADERS)
+        daily_excel_logger._apply_sheet_formatting(sheet)
+        for i in range(rows_per_day):
+            tipo = "Compra" if i % 3 else "Venta"
+            bruto = 1000 + i * 10
+            tara = 200 + i
+            sheet.append([
+                next_id[tipo], tipo, f"Contraparte {i % 7}", "Cobre", bruto, tara, 0, bruto - tara,
+                1.5, (bruto - tara) * 1.5, "Transporte", "AB123CD", "FOB" if tipo == "Venta" else "",
+                date_str, "08:00:00", "08:30:00", "", "",
+            ])
+            next_id[tipo] += 1
+    workbook.save(path)
+    return dates
+
+
+def read_full(path, date_str):
+    """Lectura anterior: carga el libro entero (con estilos) y recorre la hoja."""
+    workbook = openpyxl.load_workbook(path)
+    sheet = workbook[date_str]
+    headers = [cell.value for cell in sheet[1]]
+    return daily_excel_logger._rows_to_data(headers, sheet.iter_rows(min_row=2, values_only=True), date_str)
+
+
+def read_fast(path, date_str):
+    """Lectura rápida: solo la hoja pedida, en modo solo lectura."""
+    return daily_excel_logger._load_sheet_readonly(path, date_str)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara la lectura completa y la de solo lectura de hojas históricas")
+    parser.add_argument("--days", type=int, default=365, help="Hojas (días) del libro sintético")
+    parser.add_argument("--rows", type=int, default=40, help="Pesadas por hoja")
+    parser.add_argument("--reads", type=int, default=10, help="Fechas a leer con cada método")
+    args = parser.parse_args(argv)
+
+    daily_excel_logger.logger.setLevel("WARNING")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench_log.xlsx")
+        print(f"Generando libro sintético: {args.days} hojas x {args.rows} pesadas...")
+        dates = build_workbook(path, args.days, args.rows)
+        print(f"  {os.path.getsize(path) / 1024:.0f} KB")
+
+        sample = random.Random(0).sample(dates, min(args.reads, len(dates)))
+        full_times, fast_times = [], []
+        for date_str in sample:
+            full_time, full_data = timed(read_full, path, date_str)
+            fast_time, fast_data = timed(read_fast, path, date_str)
+            if full_data != fast_data:
+                print(f"✗ Los resultados difieren para {date_str}")
+                return 1
+            full_times.append(full_time)
+            fast_times.append(fast_time)
+
+    full_median = statistics.median(full_times)
+    fast_median = statistics.median(fast_times)
+    print(f"Lectura de {len(sample)} fechas (mediana por fecha):")
+    print(f"  libro completo: {full_median * 1000:8.1f} ms")
+    print(f"  solo lectura:   {fast_median * 1000:8.1f} ms")
+    print(f"✓ {full_median / fast_median:.1f}x más rápida, mismos datos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Shared fixtures for the storage tests: an isolated store per test, in tmp_path.
+"""
+
+import logging
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+import daily_excel_logger
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _log_to_tmp(tmp_path_factory):
+    """Sends the storage log to a temporary file instead of the tracked api.log."""
+    logger = daily_excel_logger.logger
+    handler = logging.FileHandler(tmp_path_factory.mktemp("logs") / "api.log")
+    handler.setLevel(logging.DEBUG)
+    handler.setFormatter(daily_excel_logger.formatter)
+    logger.removeHandler(daily_excel_logger.file_handler)
+    logger.addHandler(handler)
+    yield
+    logger.removeHandler(handler)
+    handler.close()
+    logger.addHandler(daily_excel_logger.file_handler)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """
+    Workbook path of an empty Excel store. Writes stay in memory (and the journal) until the
+    test flushes, so a test decides when the workbook reaches disk.
+    """
+    monkeypatch.setattr(daily_excel_logger, "STORAGE_ENGINE", "excel")
+    monkeypatch.setattr(daily_excel_logger, "JOURNAL_ENABLED", True)
+    monkeypatch.setattr(daily_excel_logger, "EXCEL_SHARDING", "none")
+    monkeypatch.setattr(daily_excel_logger, "WRITE_BEHIND_DELAY", 3600.0)
+    monkeypatch.setattr(daily_excel_logger, "WRITE_BEHIND_MAX_PENDING", 100000)
+    filename = str(tmp_path / "daily_log.xlsx")
+    yield filename
+    daily_excel_logger.flush(filename)
+
+
+@pytest.fixture
+def sqlite_store_file(tmp_path, monkeypatch):
+    """
+    Workbook path of an empty SQLite store; the pesadas live in the .db next to it and the
+    workbook is only written by exports (scheduled far enough ahead that tests export by hand).
+    """
+    monkeypatch.setattr(daily_excel_logger, "STORAGE_ENGINE", "sqlite")
+    monkeypatch.setattr(daily_excel_logger, "EXCEL_EXPORT_INTERVAL", 3600.0)
+    filename = str(tmp_path / "daily_log.xlsx")
+    yield filename
+    with daily_excel_logger._export_lock:
+        timer = daily_excel_logger._export_timers.pop(filename, None)
+    if timer is not None:
+        timer.cancel()
+    daily_excel_logger.clear_cache()
+
+
+@pytest.fixture
+def today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+@pytest.fixture
+def make_row():
+    """Builds a HEADERS-ordered row: make_row(id, tipo, contraparte, producto, neto, importe=None, patente=None)."""
+    def build(entry_id, entry_type, party=None, material=None, neto=None, importe=None, plate=None):
+        row = [None] * len(daily_excel_logger.HEADERS)
+        row[0], row[1], row[2], row[3] = entry_id, entry_type, party, material
+        row[7], row[9], row[11] = neto, importe, plate
+        return row
+    return build
+
+
+@pytest.fixture
+def write_workbook():
+    """Writes {date: [rows]} to a workbook file directly, like sheets saved by an earlier run."""
+    def write(filename, sheets):
+        workbook = openpyxl.Workbook()
+        workbook.remove(workbook.active)
+        for date_str in sorted(sheets):
+            sheet = workbook.create_sheet(title=date_str)
+            sheet.append(daily_excel_logger.HEADERS)
+            for row in sheets[date_str]:
+                sheet.append(row)
+        workbook.save(filename)
+    return write
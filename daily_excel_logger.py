@@ -2,10 +2,30 @@ import openpyxl
 from openpyxl import Workbook
 from openpyxl.utils.exceptions import InvalidFileException
 from openpyxl.styles import Font, PatternFill, Alignment
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import os
+import re
 import logging
-from typing import List, Any, Optional, Dict
+import threading
+import atexit
+import contextlib
+import functools
+import io
+import shutil
+import tempfile
+import itertools
+import heapq
+import hashlib
+import time
+from collections import OrderedDict
+from typing import List, Any, Optional, Dict, Iterator, Tuple, NamedTuple
+
+import sqlite_store
+import id_index
+import journal
+import search_index
+import daily_totals
+import analytics
 
 # Configure logging for this module
 # Create a logger
@@ -39,6 +59,31 @@ HEADERS = [
     "Precio x Kg", "Importe", "Chofer/Transporte", "Patente", "Incoterm",
     "Fecha Operacion", "Hora Ingreso", "Hora Salida", "Remito", "Observaciones"
 ]
+# Storage engine: "excel" keeps EXCEL_FILENAME as the live store; "sqlite" keeps the
+# pesadas in sqlite_store (WAL) and regenerates the workbook as an export.
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "excel").strip().lower()
+if STORAGE_ENGINE not in ("excel", "sqlite"):
+    logger.warning(f"Unknown STORAGE_ENGINE '{STORAGE_ENGINE}', falling back to 'excel'.")
+    STORAGE_ENGINE = "excel"
+# Seconds between a write and the scheduled workbook export (sqlite engine only)
+EXCEL_EXPORT_INTERVAL = float(os.getenv("EXCEL_EXPORT_INTERVAL", "60"))
+# Write-behind: pending upserts/deletes are saved together once WRITE_BEHIND_DELAY
+# seconds have passed since the first of them, or as soon as WRITE_BEHIND_MAX_PENDING pile up
+WRITE_BEHIND_DELAY = float(os.getenv("WRITE_BEHIND_DELAY", "0.5"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "20"))
+# Excel engine sharding: "none" keeps every day in EXCEL_FILENAME; "monthly" keeps each month
+# in its own workbook (daily_log_YYYY-MM.xlsx), so a save only rewrites the current month
+EXCEL_SHARDING = os.getenv("EXCEL_SHARDING", "none").strip().lower()
+if EXCEL_SHARDING not in ("none", "monthly"):
+    logger.warning(f"Unknown EXCEL_SHARDING '{EXCEL_SHARDING}', falling back to 'none'.")
+    EXCEL_SHARDING = "none"
+# Write-ahead journal (Excel engine): every change is fsync'd to it before being acknowledged
+JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "true").strip().lower() == "true"
+# Parsed sheet cache bounds (number of sheets / total cached rows)
+SHEET_CACHE_MAX_SHEETS = int(os.getenv("SHEET_CACHE_MAX_SHEETS", "128"))
+SHEET_CACHE_MAX_ROWS = int(os.getenv("SHEET_CACHE_MAX_ROWS", "50000"))
+# Closed buckets (day/week/month) of analytics series kept in memory
+SERIES_CACHE_MAX_BUCKETS = int(os.getenv("SERIES_CACHE_MAX_BUCKETS", "20000"))
 # Column indices (1-based)
 ID_COLUMN_INDEX = 1
 TYPE_COLUMN_INDEX = 2 # Index for "Tipo Operación"
@@ -113,58 +158,140 @@ def _load_or_create_workbook(filename):
             workbook.remove(workbook['Sheet'])
     return workbook
 
-def _get_or_create_daily_sheet(workbook):
-    """Gets or creates the sheet for the current day (YYYY-MM-DD)."""
-    today_str = datetime.now().strftime("%Y-%m-%d")
+# Sheet schema versions: 0 = original layout, 1 = 'Incoterm' added, 2 = 'Remito' added (current HEADERS)
+SHEET_SCHEMA_VERSION = 2
+
+def _get_or_create_daily_sheet(workbook, state=None, date_str=None):
+    """
+    Gets or creates the sheet for the current day (or `date_str`, YYYY-MM-DD).
+    An existing sheet is migrated to the current HEADERS layout the first time a live workbook
+    (`state`) touches it; after that the write path takes the layout for granted.
+    """
+    today_str = date_str or datetime.now().strftime("%Y-%m-%d")
     logger.debug(f"Getting or creating sheet for today: {today_str}")
     if today_str not in workbook.sheetnames:
         sheet = workbook.create_sheet(title=today_str)
         sheet.append(HEADERS)
         _apply_sheet_formatting(sheet)
         logger.info(f"Created new sheet for {today_str} and applied formatting.")
-    else:
-        sheet = workbook[today_str]
-        logger.debug(f"Using existing sheet for today: {today_str}")
-        # MIGRATION: ensure 'Incoterm' column exists after 'Patente'
+        if state is not None:
+            state.sheet_schemas[today_str] = SHEET_SCHEMA_VERSION
+        return sheet
+
+    sheet = workbook[today_str]
+    logger.debug(f"Using existing sheet for today: {today_str}")
+    if state is None or state.sheet_schemas.get(today_str) != SHEET_SCHEMA_VERSION:
+        version = _migrate_sheet(sheet, state)
+        if state is not None:
+            state.sheet_schemas[today_str] = version
+    return sheet
+
+def _migrate_add_incoterm(sheet, headers, state):
+    """MIGRATION 1: 'Incoterm' column after 'Patente'."""
+    # Find position of 'Patente' header (1-based index); default to 12 (column L)
+    try:
+        patente_idx = headers.index("Patente") + 1
+    except ValueError:
+        patente_idx = 12
+    insert_at = patente_idx + 1
+    sheet.insert_cols(insert_at)
+    sheet.cell(row=1, column=insert_at, value="Incoterm")
+    _index_columns_inserted(state, sheet, insert_at)
+    logger.info(f"Inserted missing 'Incoterm' column at position {insert_at} in sheet '{sheet.title}'.")
+
+def _migrate_add_remito(sheet, headers, state):
+    """MIGRATION 2: 'Remito' column before 'Observaciones'."""
+    # Find position of 'Observaciones' header (1-based index); default to len(headers)+1
+    try:
+        insert_at = headers.index("Observaciones") + 1
+    except ValueError:
+        insert_at = len(headers) + 1
+    sheet.insert_cols(insert_at)
+    sheet.cell(row=1, column=insert_at, value="Remito")
+    _index_columns_inserted(state, sheet, insert_at)
+    logger.info(f"Inserted missing 'Remito' column at position {insert_at} in sheet '{sheet.title}'.")
+
+# (version reached, column it adds, migration); applied in order to sheets that lack the column
+_SHEET_MIGRATIONS = (
+    (1, "Incoterm", _migrate_add_incoterm),
+    (2, "Remito", _migrate_add_remito),
+)
+
+def _migrate_sheet(sheet, state=None) -> int:
+    """Applies the pending schema migrations to an existing sheet. Returns the schema version it reached."""
+    version = 0
+    for step_version, column, migrate in _SHEET_MIGRATIONS:
         try:
-            existing_headers = [cell.value for cell in sheet[1]] if sheet.max_row >= 1 else []
-            if existing_headers and "Incoterm" not in existing_headers:
-                # Find position of 'Patente' header (1-based index); default to 12 (column L)
-                try:
-                    patente_idx = existing_headers.index("Patente") + 1
-                except ValueError:
-                    patente_idx = 12
-                insert_at = patente_idx + 1
-                sheet.insert_cols(insert_at)
-                sheet.cell(row=1, column=insert_at, value="Incoterm")
-                logger.info(f"Inserted missing 'Incoterm' column at position {insert_at} in sheet '{sheet.title}'.")
+            headers = [cell.value for cell in sheet[1]] if sheet.max_row >= 1 else []
+            if headers and column not in headers:
+                migrate(sheet, headers, state)
                 # Re-apply header styling and widths (best-effort)
                 _apply_sheet_formatting(sheet)
         except Exception as e:
-            logger.warning(f"Could not migrate sheet '{sheet.title}' to include 'Incoterm' column: {e}")
-        # MIGRATION: ensure 'Remito' column exists before 'Observaciones'
+            logger.warning(f"Could not migrate sheet '{sheet.title}' to include '{column}' column: {e}")
+            break  # Retried the next time the sheet is touched
+        version = step_version
+    if version == SHEET_SCHEMA_VERSION and sheet.max_row >= 1:
+        headers = [cell.value for cell in sheet[1]][:len(HEADERS)]
+        if headers != HEADERS:
+            logger.warning(f"Sheet '{sheet.title}' headers differ from the current layout: {headers}")
+    return version
+
+def _index_columns_inserted(state, sheet, insert_at):
+    """Row positions survive insert_cols; the index is only stale if the ID/Type columns moved."""
+    if state is not None and insert_at <= TYPE_COLUMN_INDEX:
+        state.row_indexes.pop(sheet.title, None)
+
+def _fsync_directory(directory):
+    """Makes a rename inside `directory` durable (POSIX only; Windows has no directory handles)."""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _atomic_write(filename, data: bytes):
+    """
+    Replaces filename with `data` through a temp file in the same folder, fsync'd before an atomic
+    rename: readers and copies see the old file or the new one, never a half-written zip.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, filename)
+    except BaseException:
         try:
-            existing_headers = [cell.value for cell in sheet[1]] if sheet.max_row >= 1 else []
-            if existing_headers and "Remito" not in existing_headers:
-                # Find position of 'Observaciones' header (1-based index); default to len(existing_headers)+1
-                try:
-                    obs_idx = existing_headers.index("Observaciones") + 1
-                except ValueError:
-                    obs_idx = len(existing_headers) + 1
-                insert_at = obs_idx  # insert before Observaciones
-                sheet.insert_cols(insert_at)
-                sheet.cell(row=1, column=insert_at, value="Remito")
-                logger.info(f"Inserted missing 'Remito' column at position {insert_at} in sheet '{sheet.title}'.")
-                _apply_sheet_formatting(sheet)
-        except Exception as e:
-            logger.warning(f"Could not migrate sheet '{sheet.title}' to include 'Remito' column: {e}")
-    return sheet
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+def _serialize_workbook(workbook) -> bytes:
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
 
-def _save_workbook(workbook, filename):
-    """Saves the workbook and uploads to Google Drive if enabled."""
+def _save_workbook(workbook, filename, data: Optional[bytes] = None) -> bool:
+    """
+    Saves the workbook atomically and uploads to Google Drive if enabled. Returns True if it was written.
+    `data` is the workbook already serialized (see _serialize_workbook); `workbook` is not touched then.
+    """
     logger.debug(f"Attempting to save workbook: {filename}")
+    saved = False
     try:
-        workbook.save(filename)
+        _atomic_write(filename, data if data is not None else _serialize_workbook(workbook))
+        saved = True
         logger.info(f"Workbook saved successfully: {filename}")
         
         # **NUEVO: Subir a Google Drive después de guardar**
@@ -184,104 +311,525 @@ def _save_workbook(workbook, filename):
             
     except Exception as e:
         logger.error(f"Error saving workbook '{filename}': {e}", exc_info=True)
+    return saved
 
-def _find_row_by_id_and_type(sheet, entry_id, entry_type):
-    """Finds the row index for a given ID and Type within the specific sheet."""
-    logger.debug(f"Searching for row with ID: {entry_id}, Type: {entry_type} in sheet: {sheet.title}")
-    if sheet.max_row <= 1:
-        logger.debug("Sheet is empty or only has headers. Row not found.")
-        return None
+# --- Monthly Shards (Excel engine) ---
+# With EXCEL_SHARDING=monthly, `filename` names the store and each month lives in its own
+# workbook next to it (daily_log.xlsx -> daily_log_2024-05.xlsx). Writes only ever touch today's
+# month; closed months are only read. Cache, ID index and public API keep using the store name.
 
-    # Normalize search entry_type for robust comparison
-    search_type = entry_type.strip() if isinstance(entry_type, str) else entry_type
+_SHARD_MONTH = re.compile(r"^\d{4}-\d{2}$")
+_shards_ready = set()
+_shards_lock = threading.RLock()
 
-    for row_idx in range(2, sheet.max_row + 1):
-        id_cell_value = sheet.cell(row=row_idx, column=ID_COLUMN_INDEX).value
-        type_cell_value = sheet.cell(row=row_idx, column=TYPE_COLUMN_INDEX).value
+def _sharded() -> bool:
+    return STORAGE_ENGINE == "excel" and EXCEL_SHARDING == "monthly"
 
-        # Normalize sheet type value for robust comparison
-        sheet_type = type_cell_value.strip() if isinstance(type_cell_value, str) else type_cell_value
+def _month_path(filename, month) -> str:
+    root, ext = os.path.splitext(filename)
+    return f"{root}_{month}{ext}"
 
-        # Check if type matches first
-        if sheet_type != search_type:
-            continue
+def _shard_months(filename, suffix) -> List[str]:
+    """Months (YYYY-MM) that have a '<root>_YYYY-MM<suffix>' file next to filename, oldest first."""
+    root = os.path.splitext(filename)[0]
+    directory = os.path.dirname(root) or "."
+    prefix = os.path.basename(root) + "_"
+    months = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return months
+    for name in names:
+        if name.startswith(prefix) and name.endswith(suffix):
+            month = name[len(prefix):len(name) - len(suffix)]
+            if _SHARD_MONTH.match(month):
+                months.append(month)
+    return sorted(months)
+
+def _shard_path(date_str, filename) -> str:
+    """Workbook file holding date_str: its month shard when sharding, otherwise filename itself."""
+    if not _sharded():
+        return filename
+    _ensure_shards_ready(filename)
+    return _month_path(filename, date_str[:7])
 
-        logger.debug(f"Comparing: Sheet ID='{id_cell_value}' (Type: {type(id_cell_value)}), Sheet Type='{type_cell_value}' (Type: {type(type_cell_value)}) with Search ID='{entry_id}' (Type: {type(entry_id)}), Search Type='{entry_type}' (Type: {type(entry_type)})")
+def _store_files(filename) -> List[str]:
+    """Workbook files making up the store (saved or live), oldest month first."""
+    if not _sharded():
+        return [filename] if os.path.exists(filename) or filename in _live_workbooks else []
+    ext = os.path.splitext(filename)[1]
+    files = {_month_path(filename, month) for month in _shard_months(filename, ext)}
+    with _live_lock:
+        files.update(st.filename for st in _live_workbooks.values() if st.store == filename and st.filename != filename)
+    return sorted(files)
 
-        # Then check ID (converting to int for comparison)
+def store_files(filename=EXCEL_FILENAME) -> List[str]:
+    """Returns the workbook files that hold the store's data (one per month when sharding)."""
+    if _sharded():
+        _ensure_shards_ready(filename)
+    return _store_files(filename)
+
+def _ensure_shards_ready(filename):
+    """On first use with monthly sharding, splits an existing single workbook into month shards."""
+    if filename in _shards_ready:
+        return
+    with _shards_lock:
+        if filename in _shards_ready:
+            return
+        if os.path.exists(filename):
+            logger.info(f"EXCEL_SHARDING=monthly and {filename} exists; splitting it into monthly workbooks")
+            split_workbook(filename)
+        _shards_ready.add(filename)
+
+def split_workbook(filename=EXCEL_FILENAME) -> Dict[str, int]:
+    """
+    Moves every dated sheet of a single workbook into its month shard (merging with shards that
+    already exist) and renames the source to '<name>.unsharded.xlsx'. Returns sheets copied per shard.
+    """
+    with _shards_lock:
+        if not os.path.exists(filename):
+            return {}
+        # Changes still buffered or journaled for the single workbook go into it first
+        legacy_journal = journal.journal_path(filename)
+        loaded = _live_workbooks.get(filename)
+        if (loaded is not None and loaded.workbook is not None) or (JOURNAL_ENABLED and os.path.exists(legacy_journal) and os.path.getsize(legacy_journal)):
+            state = _get_live_workbook(filename)
+            if not _flush_state(state):
+                raise RuntimeError(f"Could not save pending changes of {filename}; not splitting it")
+
+        source = openpyxl.load_workbook(filename, read_only=True)
+        shards: Dict[str, Any] = {}
+        copied: Dict[str, int] = {}
         try:
-            # Attempt strict integer comparison first
-            if id_cell_value is not None and isinstance(id_cell_value, (int, float)) and int(id_cell_value) == int(entry_id):
-                logger.debug(f"Match found by strict integer comparison at row {row_idx}")
-                return row_idx
-        except (ValueError, TypeError):
-            logger.debug(f"Strict integer comparison failed for ID '{id_cell_value}' vs '{entry_id}'. Trying string comparison.")
-            # Fallback to string comparison if integer conversion/comparison fails
-            try:
-                if str(id_cell_value).strip() == str(entry_id).strip(): # Use strip to handle potential spaces
-                     logger.debug(f"Match found by string comparison at row {row_idx}")
-                     return row_idx
-            except Exception as str_e:
-                 logger.warning(f"Error during string comparison for ID '{id_cell_value}' vs '{entry_id}': {str_e}")
+            for sheet_name in source.sheetnames:
+                if not sheet_name.startswith("20") or not _SHARD_MONTH.match(sheet_name[:7]):  # Hojas con formato YYYY-MM-DD
+                    logger.warning(f"Sheet '{sheet_name}' of {filename} is not a dated sheet; it stays in the unsharded copy.")
+                    continue
+                path = _month_path(filename, sheet_name[:7])
+                target = shards.get(path)
+                if target is None:
+                    target = shards[path] = _load_or_create_workbook(path)
+                if sheet_name in target.sheetnames:
+                    logger.warning(f"Sheet '{sheet_name}' already exists in {path}; keeping the shard's copy.")
+                    continue
+                sheet = target.create_sheet(title=sheet_name)
+                for row in source[sheet_name].iter_rows(values_only=True):
+                    sheet.append(row)
+                _apply_sheet_formatting(sheet)
+                copied[path] = copied.get(path, 0) + 1
+        finally:
+            source.close()
 
-    logger.debug(f"Row with ID: {entry_id}, Type: {entry_type} not found in sheet: {sheet.title}")
-    return None # Not found
+        for path, workbook in shards.items():
+            if path in copied and not _save_workbook(workbook, path):
+                raise RuntimeError(f"Could not save shard {path}; {filename} was left untouched")
 
-# --- Public Data Management Functions ---
+        unsharded = os.path.splitext(filename)[0] + ".unsharded" + os.path.splitext(filename)[1]
+        os.replace(filename, unsharded)
+        with _live_lock:
+            state = _live_workbooks.pop(filename, None)
+        if state is not None and state.journal is not None:
+            state.journal.close()
+        _id_index_verified.discard(filename)
+        clear_cache()
+        _shards_ready.add(filename)
+        logger.info(f"Split {filename} into {len(copied)} monthly workbook(s); original kept as {unsharded}")
+        return copied
+
+# --- Live Workbook (write-behind) ---
+# The Excel engine keeps one parsed workbook per file in memory. Upserts and deletes
+# are applied to it right away and saved to disk in batches by a debounce timer.
+
+class _LiveWorkbook:
+    def __init__(self, filename, store=None):
+        self.filename = filename  # Workbook file (a month shard when sharding)
+        self.store = store or filename  # Store name used by the cache and the ID index
+        self.workbook = None
+        self.sig = None  # File signature when last loaded or saved
+        self.pending = 0  # Changes not yet on disk
+        self.timer = None
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()  # One save at a time; taken before `lock`, never while holding it
+        self.saving = False  # A snapshot is being written; the file changing on disk is our own save
+        self.saved_version = 0  # Bumped on every successful save
+        self.row_indexes: Dict[str, "_RowIndex"] = {}  # Sheet title -> row index
+        self.sheet_schemas: Dict[str, int] = {}  # Sheet title -> schema version reached since loading
+        self.journal = journal.Journal(journal.journal_path(filename)) if JOURNAL_ENABLED else None
 
-def upsert_data(entry_id: int, entry_type: str, data_row: List[Any], filename=EXCEL_FILENAME):
+_live_workbooks: Dict[str, _LiveWorkbook] = {}
+_live_lock = threading.Lock()
+
+def _live_state(filename, store=None) -> _LiveWorkbook:
+    """Returns the live workbook state of filename without loading the workbook (state.workbook may be None)."""
+    with _live_lock:
+        state = _live_workbooks.get(filename)
+        if state is None:
+            state = _live_workbooks[filename] = _LiveWorkbook(filename, store)
+    return state
+
+def _get_live_workbook(filename, store=None) -> _LiveWorkbook:
+    """Returns the in-memory workbook for filename (a shard of `store`, if given), (re)loading it if needed."""
+    state = _live_state(filename, store)
+    with state.lock:
+        current_sig = _file_signature(filename)
+        if state.workbook is None or (state.pending == 0 and not state.saving and current_sig != state.sig):
+            if state.workbook is not None:
+                logger.info(f"{filename} changed on disk; reloading workbook.")
+                _id_index_verified.discard(state.store)
+            state.workbook = _load_or_create_workbook(filename)
+            state.row_indexes.clear()
+            state.sheet_schemas.clear()
+            state.sig = current_sig
+            _replay_journal(state)
+        elif state.pending and not state.saving and current_sig != state.sig:
+            logger.warning(f"{filename} changed on disk while {state.pending} changes are pending; the next save will overwrite it.")
+            state.sig = current_sig
+    return state
+
+def _mark_pending(state: _LiveWorkbook, changes: int = 1):
+    """Registers unsaved changes and schedules the next save (right away once too many pile up). Caller holds state.lock."""
+    state.pending += changes
+    if state.pending >= WRITE_BEHIND_MAX_PENDING:
+        _schedule_flush(state, 0)
+    elif state.timer is None:
+        _schedule_flush(state, WRITE_BEHIND_DELAY)
+
+def _schedule_flush(state: _LiveWorkbook, delay: float):
+    """Arms the background save of a live workbook (an earlier one is kept unless `delay` is 0). Caller holds state.lock."""
+    if state.timer is not None:
+        if delay > 0:
+            return
+        state.timer.cancel()
+    state.timer = threading.Timer(delay, _flush_state, args=(state,))
+    state.timer.daemon = True
+    state.timer.start()
+
+def _flush_state(state: _LiveWorkbook) -> bool:
+    """Saves pending changes of one live workbook. On failure they stay pending and are retried."""
+    with state.save_lock:
+        return _save_state(state)
+
+def _save_state(state: _LiveWorkbook) -> bool:
     """
-    Updates or inserts data in the current day's sheet based on the numeric entry_id and entry_type.
+    Snapshots the live workbook under its lock, then writes the snapshot (temp file + fsync + rename)
+    with the lock released. Serializing holds the lock, so writes to the file and reads that miss the
+    sheet cache wait for it; today's sheet is put in the cache first to keep the busiest reads off
+    the lock. Only the disk write runs alongside writers. Caller holds state.save_lock.
     """
-    logger.info(f"Attempting to upsert data for ID: {entry_id}, Type: {entry_type}")
+    with state.lock:
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        if state.pending == 0 or state.workbook is None:
+            return True
+        _refresh_stale_totals(state.store, lambda date_str: (
+            _iter_sheet_rows(state.workbook[date_str]) if date_str in state.workbook.sheetnames else None))
+        if state.filename == _shard_path(datetime.now().strftime("%Y-%m-%d"), state.store):
+            refresh_snapshot(state.store)
+        sig_before = state.sig
+        pending = state.pending
+        try:
+            data = _serialize_workbook(state.workbook)
+        except Exception as e:
+            logger.error(f"Error serializing workbook '{state.filename}': {e}", exc_info=True)
+            data = None
+        journal_mark = state.journal.mark() if state.journal is not None else None
+        state.saving = data is not None
+    saved = data is not None and _save_workbook(None, state.filename, data)
+    with state.lock:
+        state.saving = False
+        if not saved:
+            # Keep the changes in memory (e.g. the file is open in Excel) and retry later
+            _schedule_flush(state, max(WRITE_BEHIND_DELAY, 5.0))
+            return False
+        state.pending -= pending
+        if state.journal is not None:
+            state.journal.truncate(journal_mark)  # Records up to the snapshot are in the saved file
+        state.sig = _file_signature(state.filename)
+        state.saved_version += 1
+        _restamp_cache(state.store, state.filename, sig_before, state.sig)
+        _checkpoint_id_index(state.store)
+        logger.info(f"Flushed {pending} pending change(s) to {state.filename} (save #{state.saved_version})")
+        if state.pending and state.timer is None:
+            _schedule_flush(state, WRITE_BEHIND_DELAY)  # Changes that arrived during the write
+        return True
+
+def flush(filename=None) -> bool:
+    """
+    Writes pending changes to disk now (all files, or only `filename`).
+    With the sqlite engine it runs a pending scheduled export instead.
+    Returns False if some save failed.
+    """
+    if STORAGE_ENGINE == "sqlite":
+        with _export_lock:
+            pending = [name for name in _export_timers if filename is None or name == filename]
+            timers = [_export_timers[name] for name in pending]
+        for name, timer in zip(pending, timers):
+            timer.cancel()
+            _run_scheduled_export(name)
+        return True
+    with _live_lock:
+        states = [st for name, st in _live_workbooks.items() if filename is None or filename in (name, st.store)]
+    ok = True
+    for state in states:
+        ok = _flush_state(state) and ok
+    return ok
+
+atexit.register(flush)
+
+def _journal_append(state: _LiveWorkbook, op, entry_id, entry_type, date_str, data_row=None) -> Optional[int]:
+    """
+    Journals one change before it is applied and returns its record number (None without a journal).
+    Caller holds state.lock and calls _journal_sync afterwards.
+    """
+    if state.journal is None:
+        return None
+    record = {"op": op, "date": date_str, "id": entry_id, "tipo": entry_type}
+    if data_row is not None:
+        record["row"] = list(data_row)
+    return state.journal.append(record)
+
+def _journal_sync(state: _LiveWorkbook):
+    """Makes the journaled changes durable (fsync). Caller holds state.lock."""
+    if state.journal is not None:
+        state.journal.sync()
+
+def _replay_journal(state: _LiveWorkbook) -> int:
+    """Re-applies journaled changes that never reached a saved workbook. Caller holds state.lock."""
+    if state.journal is None:
+        return 0
+    records = state.journal.read()
+    if not records:
+        return 0
+    logger.warning(f"Replaying {len(records)} journaled change(s) into {state.filename}")
+    changes = 0
+    dates = set()
+    for record in records:
+        try:
+            if record["op"] == "upsert":
+                _upsert_in_workbook(state, record["id"], record["tipo"], record["row"], record["date"])
+                changes += 1
+            elif record["op"] == "delete":
+                changes += _delete_in_workbook(state, record["id"], record["tipo"], record["date"])
+            dates.add(record["date"])
+        except Exception as e:
+            logger.error(f"Could not replay journal record {record}: {e}", exc_info=True)
+    # The rollup may already hold changes that never reached the file: recompute the replayed dates
+    for date_str in dates:
+        if date_str in state.workbook.sheetnames:
+            _totals_replace(state.store, date_str, _iter_sheet_rows(state.workbook[date_str]))
+    if changes:
+        _mark_pending(state, changes)
+    return len(records)
+
+def recover(filename=EXCEL_FILENAME) -> int:
+    """
+    Replays the journaled changes a crash left behind into their live workbooks. Returns the replayed count.
+    Workbooks without journaled changes are not loaded here: the first write loads them.
+    """
+    if STORAGE_ENGINE != "excel" or not JOURNAL_ENABLED:
+        return 0
+    current = _shard_path(datetime.now().strftime("%Y-%m-%d"), filename)
+    paths = [current]
+    if _sharded():
+        # A crash right after a month change can leave the previous month's journal behind
+        paths += [p for p in (_month_path(filename, m) for m in _shard_months(filename, ".journal.jsonl")) if p != current]
+    pending_records = 0
+    for path in paths:
+        with _live_lock:
+            state = _live_workbooks.get(path)
+        if state is not None and state.workbook is not None:
+            continue
+        records = len(journal.Journal(journal.journal_path(path)).read())
+        if records:
+            _get_live_workbook(path, filename)
+        pending_records += records
+    return pending_records
+
+def _row_key(entry_id, entry_type):
+    """Normalizes an (ID, Type) pair the way _find_row_by_id_and_type compares them."""
+    search_type = entry_type.strip() if isinstance(entry_type, str) else entry_type
+    try:
+        key_id = int(entry_id)
+    except (ValueError, TypeError):
+        key_id = str(entry_id).strip()
+    return search_type, key_id
+
+class _RowIndex:
+    """(tipo, id) -> row_idx for one sheet of a live workbook."""
+    __slots__ = ("rows", "duplicates")
+
+    def __init__(self, sheet):
+        self.rows: Dict[Tuple[Any, Any], int] = {}
+        self.duplicates = set()  # Keys present in more than one row; the first row wins
+        for row_idx, row in enumerate(sheet.iter_rows(min_row=2, max_col=TYPE_COLUMN_INDEX, values_only=True), start=2):
+            if not row or row[0] is None:
+                continue
+            id_value = row[0]
+            if isinstance(id_value, float) and not id_value.is_integer():
+                continue
+            key = _row_key(id_value, row[1] if len(row) > 1 else None)
+            if key in self.rows:
+                self.duplicates.add(key)
+            else:
+                self.rows[key] = row_idx
+        logger.debug(f"Indexed {len(self.rows)} rows of sheet '{sheet.title}'")
+
+def _get_row_index(state, sheet) -> _RowIndex:
+    """Returns the row index of a live workbook sheet, building it on first use. Caller holds state.lock."""
+    index = state.row_indexes.get(sheet.title)
+    if index is None:
+        index = state.row_indexes[sheet.title] = _RowIndex(sheet)
+    return index
+
+def _index_appended(state, sheet, entry_id, entry_type):
+    """Records the row just appended to sheet. Caller holds state.lock."""
+    index = state.row_indexes.get(sheet.title)
+    if index is not None:
+        index.rows.setdefault(_row_key(entry_id, entry_type), sheet.max_row)
+
+def _index_deleted(state, sheet, entry_id, entry_type, row_idx):
+    """Removes a deleted row from the index and shifts the rows below it up. Caller holds state.lock."""
+    index = state.row_indexes.get(sheet.title)
+    if index is None:
+        return
+    key = _row_key(entry_id, entry_type)
+    if key in index.duplicates:
+        # Another row holds the same key further down; rebuild on next use
+        state.row_indexes.pop(sheet.title, None)
+        return
+    index.rows.pop(key, None)
+    for other_key, other_idx in index.rows.items():
+        if other_idx > row_idx:
+            index.rows[other_key] = other_idx - 1
+
+def _find_row_by_id_and_type(state, sheet, entry_id, entry_type):
+    """Finds the row index for a given ID and Type within the specific sheet of a live workbook."""
+    row_idx = _get_row_index(state, sheet).rows.get(_row_key(entry_id, entry_type))
+    if row_idx is None:
+        logger.debug(f"Row with ID: {entry_id}, Type: {entry_type} not found in sheet: {sheet.title}")
+    return row_idx
+
+def _sheet_row(sheet, row_idx) -> List[Any]:
+    """Values of one row of a live sheet (HEADERS order, which the write path keeps sheets in)."""
+    return list(next(sheet.iter_rows(min_row=row_idx, max_row=row_idx, max_col=len(HEADERS), values_only=True)))
+
+# --- Public Data Management Functions ---
+
+class CommitReceipt(NamedTuple):
+    """Where an upsert landed, read back from the store right after writing it."""
+    sheet: str  # Sheet date (YYYY-MM-DD)
+    row: int  # Worksheet row index (Excel) or rowid (SQLite)
+    version: int  # Write version of the sheet after this upsert
+    entry_id: Any  # Stored ID / Type at that row
+    entry_type: Any
+    journal: Optional["journal.Journal"] = None  # Journal holding the upsert (Excel engine with JOURNAL_ENABLED)
+    journal_record: Optional[int] = None  # Its record number there
+
+    def confirms(self, entry_id, entry_type) -> bool:
+        """
+        True if the stored row holds (entry_type, entry_id) and the upsert is committed: its journal
+        record is fsync'd (or saved into the workbook since). SQLite receipts are only issued after
+        the transaction commits; without the journal the row is committed to the live workbook and
+        reaches disk with the next save.
+        """
+        if _row_key(self.entry_id, self.entry_type) != _row_key(entry_id, entry_type):
+            return False
+        return self.journal is None or self.journal.is_synced(self.journal_record)
+
+def _valid_upsert(entry_id, entry_type, data_row) -> bool:
+    """Logs and rejects upserts without ID/type or with a row that does not match HEADERS."""
     if entry_id is None:
          logger.error("Cannot upsert data without a valid entry_id.")
-         return
+         return False
     if not entry_type:
          logger.error("Cannot upsert data without a valid entry_type.")
-         return
+         return False
 
     if len(data_row) != len(HEADERS):
          logger.error(f"Data row length ({len(data_row)}) != headers length ({len(HEADERS)}). ID: {entry_id}, Type: {entry_type}")
-         return
+         return False
+    return True
+
+def upsert_data(entry_id: int, entry_type: str, data_row: List[Any], filename=EXCEL_FILENAME) -> Optional[CommitReceipt]:
+    """
+    Updates or inserts data in the current day's sheet based on the numeric entry_id and entry_type.
+    Returns a CommitReceipt for the written row, or None if the upsert failed.
+    """
+    logger.info(f"Attempting to upsert data for ID: {entry_id}, Type: {entry_type}")
+    if not _valid_upsert(entry_id, entry_type, data_row):
+        return
+
+    if STORAGE_ENGINE == "sqlite":
+        return _sqlite_upsert(entry_id, entry_type, data_row, filename)
 
     try:
-        workbook = _load_or_create_workbook(filename)
-        if workbook is None: return
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        state = _get_live_workbook(_shard_path(today_str, filename), filename)
+        with state.lock:
+            record = _journal_append(state, "upsert", entry_id, entry_type, today_str, data_row)
+            receipt = _upsert_in_workbook(state, entry_id, entry_type, data_row, today_str, record)
+            _journal_sync(state)
+            _mark_pending(state)
+        return receipt
 
-        sheet = _get_or_create_daily_sheet(workbook)
+    except Exception as e:
+        logger.error(f"Failed to upsert data for ID {entry_id} (Type: {entry_type}): {e}", exc_info=True)
+        return None
 
-        # Find row using both ID and Type
-        row_idx_to_update = _find_row_by_id_and_type(sheet, entry_id, entry_type) 
 
-        if row_idx_to_update:
-            logger.debug(f"Found existing row for ID {entry_id} (Type: {entry_type}) at row {row_idx_to_update}. Updating.")
-            for col_idx, value in enumerate(data_row, start=1):
-                # Check if it's a numeric column and value is None or empty string
-                # Use 0-based index for checking against numeric column indices
-                if (col_idx - 1) in [4, 5, 6, 7] and (value is None or value == ""):
-                    cell_value_to_write = None # Write None for empty numeric fields
-                else:
-                    cell_value_to_write = value # Otherwise, use the provided value
+def _upsert_in_workbook(state: _LiveWorkbook, entry_id, entry_type, data_row, date_str=None, journal_record=None) -> CommitReceipt:
+    """
+    Applies one upsert to today's (or date_str's) sheet of the live workbook and returns its receipt,
+    tied to journal_record when the upsert was journaled. Caller holds state.lock.
+    """
+    sheet = _get_or_create_daily_sheet(state.workbook, state, date_str)
 
-                sheet.cell(row=row_idx_to_update, column=col_idx, value=cell_value_to_write)
-            logger.info(f"Updated row for ID {entry_id} (Type: {entry_type}) in sheet {sheet.title}")
-        else:
-            logger.debug(f"No existing row found for ID {entry_id} (Type: {entry_type}). Appending new row.")
-            # When appending, also handle numeric None/empty strings
-            cleaned_data_row = []
-            for i, value in enumerate(data_row):
-                 if i in [4, 5, 6, 7] and (value is None or value == ""):
-                      cleaned_data_row.append(None)
-                 else:
-                      cleaned_data_row.append(value)
-            sheet.append(cleaned_data_row)
-            logger.info(f"Appended new row for ID {entry_id} (Type: {entry_type}) to sheet {sheet.title}")
-
-        _save_workbook(workbook, filename)
+    # Find row using both ID and Type
+    row_idx_to_update = _find_row_by_id_and_type(state, sheet, entry_id, entry_type)
 
-    except Exception as e:
-        logger.error(f"Failed to upsert data for ID {entry_id} (Type: {entry_type}): {e}", exc_info=True)
+    previous_row = None
+    if row_idx_to_update:
+        logger.debug(f"Found existing row for ID {entry_id} (Type: {entry_type}) at row {row_idx_to_update}. Updating.")
+        previous_row = _sheet_row(sheet, row_idx_to_update)
+        for col_idx, value in enumerate(data_row, start=1):
+            # Check if it's a numeric column and value is None or empty string
+            # Use 0-based index for checking against numeric column indices
+            if (col_idx - 1) in [4, 5, 6, 7] and (value is None or value == ""):
+                cell_value_to_write = None # Write None for empty numeric fields
+            else:
+                cell_value_to_write = value # Otherwise, use the provided value
+
+            # Assign through .value: sheet.cell(value=None) leaves the old value in place
+            sheet.cell(row=row_idx_to_update, column=col_idx).value = cell_value_to_write
+        logger.info(f"Updated row for ID {entry_id} (Type: {entry_type}) in sheet {sheet.title}")
+    else:
+        logger.debug(f"No existing row found for ID {entry_id} (Type: {entry_type}). Appending new row.")
+        # When appending, also handle numeric None/empty strings
+        cleaned_data_row = []
+        for i, value in enumerate(data_row):
+             if i in [4, 5, 6, 7] and (value is None or value == ""):
+                  cleaned_data_row.append(None)
+             else:
+                  cleaned_data_row.append(value)
+        sheet.append(cleaned_data_row)
+        row_idx_to_update = sheet.max_row
+        _index_appended(state, sheet, entry_id, entry_type)
+        _id_index_update(state.store, entry_id, entry_type, sheet.title, present=True)
+        logger.info(f"Appended new row for ID {entry_id} (Type: {entry_type}) to sheet {sheet.title}")
+
+    _search_update(state.store, entry_id, entry_type, sheet.title, data_row)
+    _totals_change(state.store, sheet.title, previous_row, data_row)
+    version = _note_write(state.store, sheet.title)
+    return CommitReceipt(
+        sheet=sheet.title,
+        row=row_idx_to_update,
+        version=version,
+        entry_id=sheet.cell(row=row_idx_to_update, column=ID_COLUMN_INDEX).value,
+        entry_type=sheet.cell(row=row_idx_to_update, column=TYPE_COLUMN_INDEX).value,
+        journal=state.journal if journal_record is not None else None,
+        journal_record=journal_record,
+    )
 
 
 def delete_data(entry_id: int, entry_type: str, filename=EXCEL_FILENAME):
@@ -296,45 +844,393 @@ def delete_data(entry_id: int, entry_type: str, filename=EXCEL_FILENAME):
          logger.error("Cannot delete data without a valid entry_type.")
          return
 
-    try:
-        workbook = _load_or_create_workbook(filename)
-        if workbook is None: return
+    if STORAGE_ENGINE == "sqlite":
+        return _sqlite_delete(entry_id, entry_type, filename)
 
+    try:
         today_str = datetime.now().strftime("%Y-%m-%d")
-        if today_str not in workbook.sheetnames:
-             logger.warning(f"Sheet for today '{today_str}' not found. Cannot delete ID {entry_id} (Type: {entry_type}).")
-             return
-
-        sheet = workbook[today_str]
-        # Find row using both ID and Type
-        row_idx_to_delete = _find_row_by_id_and_type(sheet, entry_id, entry_type) 
-
-        if row_idx_to_delete:
-            logger.debug(f"Found row to delete for ID {entry_id} (Type: {entry_type}) at row {row_idx_to_delete}.")
-            sheet.delete_rows(row_idx_to_delete)
-            logger.info(f"Deleted row for ID {entry_id} (Type: {entry_type}) from sheet {sheet.title}")
-            _save_workbook(workbook, filename)
-        else:
-            logger.warning(f"Could not find row with ID {entry_id} (Type: {entry_type}) in sheet {sheet.title} to delete.")
+        state = _get_live_workbook(_shard_path(today_str, filename), filename)
+        with state.lock:
+            _journal_append(state, "delete", entry_id, entry_type, today_str)
+            deleted = _delete_in_workbook(state, entry_id, entry_type, today_str)
+            _journal_sync(state)
+            if deleted:
+                _mark_pending(state)
 
     except Exception as e:
         logger.error(f"Failed to delete data for ID {entry_id} (Type: {entry_type}): {e}", exc_info=True)
 
-# --- Data Loading Function ---
 
-def load_data_by_date(date_str: str, filename=EXCEL_FILENAME) -> Dict[str, List[Dict[str, Any]]]:
+def _delete_in_workbook(state: _LiveWorkbook, entry_id, entry_type, date_str=None) -> bool:
+    """Removes one row from today's (or date_str's) sheet of the live workbook. Returns True if it existed. Caller holds state.lock."""
+    workbook = state.workbook
+    today_str = date_str or datetime.now().strftime("%Y-%m-%d")
+    if today_str not in workbook.sheetnames:
+         logger.warning(f"Sheet for today '{today_str}' not found. Cannot delete ID {entry_id} (Type: {entry_type}).")
+         return False
+
+    sheet = workbook[today_str]
+    # Find row using both ID and Type
+    row_idx_to_delete = _find_row_by_id_and_type(state, sheet, entry_id, entry_type)
+
+    if not row_idx_to_delete:
+        logger.warning(f"Could not find row with ID {entry_id} (Type: {entry_type}) in sheet {sheet.title} to delete.")
+        return False
+
+    logger.debug(f"Found row to delete for ID {entry_id} (Type: {entry_type}) at row {row_idx_to_delete}.")
+    deleted_row = _sheet_row(sheet, row_idx_to_delete)
+    sheet.delete_rows(row_idx_to_delete)
+    _index_deleted(state, sheet, entry_id, entry_type, row_idx_to_delete)
+    _id_index_update(state.store, entry_id, entry_type, today_str, present=False)
+    _search_update(state.store, entry_id, entry_type, today_str)
+    _totals_change(state.store, today_str, deleted_row, None)
+    logger.info(f"Deleted row for ID {entry_id} (Type: {entry_type}) from sheet {sheet.title}")
+    _note_write(state.store, today_str)
+    return True
+
+
+def apply_batch(ops: List[Tuple[Any, ...]], filename=EXCEL_FILENAME) -> List[Any]:
     """
-    Loads data from a specific sheet identified by date_str (YYYY-MM-DD)
-    into a dictionary of lists, separated by entry type ('Compra' or 'Venta').
+    Applies ("upsert", entry_id, entry_type, data_row) and ("delete", entry_id, entry_type)
+    operations in order. Returns one result per op: a CommitReceipt for upserts, True/False for
+    deletes (row existed), or the Exception that op raised.
+    With the Excel engine the whole batch is journaled with a single fsync, applied under one lock
+    and counts as a single pending save.
     """
-    logger.info(f"Attempting to load data for date: {date_str} from: {filename}")
-    data = {"Compra": [], "Venta": []}
+    if STORAGE_ENGINE == "sqlite":
+        results = []
+        for op in ops:
+            try:
+                if op[0] == "upsert":
+                    if not _valid_upsert(op[1], op[2], op[3]):
+                        raise ValueError(f"Invalid upsert for ID {op[1]} (Type: {op[2]})")
+                    receipt = _sqlite_upsert(op[1], op[2], op[3], filename)
+                    if receipt is None:
+                        raise RuntimeError(f"Failed to upsert ID {op[1]} (Type: {op[2]}) in SQLite store")
+                    results.append(receipt)
+                elif op[0] == "delete":
+                    results.append(_sqlite_delete(op[1], op[2], filename))
+                else:
+                    raise ValueError(f"Unknown storage operation '{op[0]}'")
+            except Exception as e:
+                results.append(e)
+        return results
+
+    results = []
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    state = _get_live_workbook(_shard_path(today_str, filename), filename)
+    with state.lock:
+        changes = 0
+        for op in ops:
+            try:
+                if op[0] == "upsert":
+                    logger.info(f"Attempting to upsert data for ID: {op[1]}, Type: {op[2]}")
+                    if not _valid_upsert(op[1], op[2], op[3]):
+                        raise ValueError(f"Invalid upsert for ID {op[1]} (Type: {op[2]})")
+                    record = _journal_append(state, "upsert", op[1], op[2], today_str, op[3])
+                    results.append(_upsert_in_workbook(state, op[1], op[2], op[3], today_str, record))
+                    changes += 1
+                elif op[0] == "delete":
+                    logger.info(f"Attempting to delete data for ID: {op[1]}, Type: {op[2]}")
+                    _journal_append(state, "delete", op[1], op[2], today_str)
+                    deleted = _delete_in_workbook(state, op[1], op[2], today_str)
+                    changes += deleted
+                    results.append(deleted)
+                else:
+                    raise ValueError(f"Unknown storage operation '{op[0]}'")
+            except Exception as e:
+                logger.error(f"Failed to apply {op[0]} for ID {op[1]} (Type: {op[2]}): {e}", exc_info=True)
+                results.append(e)
+        # One fsync for the whole batch, before any caller is acknowledged
+        _journal_sync(state)
+        if changes:
+            _mark_pending(state, changes)
+    return results
+
+
+def refresh_snapshot(filename=EXCEL_FILENAME):
+    """Re-parses today's sheet into the sheet cache if a write dropped it, so readers find it ready."""
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    if STORAGE_ENGINE != "excel" or _cache_get(filename, today_str) is not None:
+        return
+    state = _get_live_workbook(_shard_path(today_str, filename), filename)
+    with state.lock:
+        sig, version = _cache_token(filename, today_str)
+        _cache_put(filename, today_str, sig, version, _load_date_uncached(today_str, filename))
+
+# --- Parsed Sheet Cache ---
+# Parsed entries per (filename, date), validated by the file signature (mtime/size)
+# and by an internal write version bumped on every upsert/delete of that date.
+
+class _CacheEntry:
+    __slots__ = ("sig", "version", "data", "rows")
+
+    def __init__(self, sig, version, data):
+        self.sig = sig
+        self.version = version
+        self.data = data
+        self.rows = len(data["Compra"]) + len(data["Venta"])
+
+_sheet_cache: "OrderedDict[Tuple[str, str], _CacheEntry]" = OrderedDict()
+_sheet_cache_rows = 0
+_cache_lock = threading.Lock()
+_write_versions: Dict[str, int] = {}
+_global_version = 0
+# Time of the last write per date and overall (data_version). Versions restart with the process,
+# so the epoch keeps versions handed out by an earlier run from matching
+_write_times: Dict[str, float] = {}
+_last_write_time = _BOOT_TIME = time.time()
+_VERSION_EPOCH = f"{os.getpid():x}.{time.time_ns():x}"
+# Workbook path -> [signature last seen, outside changes seen, time of the last one]; our own
+# saves move the signature along (_restamp_cache) without counting as a change
+_file_versions: Dict[str, List[Any]] = {}
+_outside_total = 0  # Sum of the outside changes seen over every file (read_generation)
+
+def _file_signature(filename):
+    """Returns (mtime_ns, size) of the file, or None if it does not exist."""
     try:
-        workbook = _load_or_create_workbook(filename)
-        if workbook is None:
-            logger.warning("Workbook could not be loaded or created. Returning empty data.")
-            return data
+        st = os.stat(filename)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _cache_token(filename, date_str):
+    """Returns the (file signature, write version) a cached sheet must match to be valid."""
+    sig = _file_signature(_shard_path(date_str, filename)) if STORAGE_ENGINE == "excel" else None
+    with _cache_lock:
+        return sig, _write_versions.get(date_str, 0)
+
+def _copy_data(data):
+    return {"Compra": [dict(e) for e in data["Compra"]], "Venta": [dict(e) for e in data["Venta"]]}
 
+def _cache_drop(key):
+    global _sheet_cache_rows
+    entry = _sheet_cache.pop(key, None)
+    if entry is not None:
+        _sheet_cache_rows -= entry.rows
+
+def _cache_get(filename, date_str, copy=True):
+    """Returns the cached parse of date_str if still valid. With copy=False it is the cached object itself: read only."""
+    sig, version = _cache_token(filename, date_str)
+    key = (filename, date_str)
+    with _cache_lock:
+        entry = _sheet_cache.get(key)
+        if entry is None:
+            return None
+        if entry.sig != sig or entry.version != version:
+            _cache_drop(key)
+            return None
+        _sheet_cache.move_to_end(key)
+        data = entry.data
+    return _copy_data(data) if copy else data
+
+def _cache_put(filename, date_str, sig, version, data):
+    global _sheet_cache_rows
+    entry = _CacheEntry(sig, version, _copy_data(data))
+    if entry.rows > SHEET_CACHE_MAX_ROWS:
+        return
+    key = (filename, date_str)
+    with _cache_lock:
+        if _write_versions.get(date_str, 0) != version:
+            return  # A write landed while parsing; the parsed copy may be stale
+        _cache_drop(key)
+        _sheet_cache[key] = entry
+        _sheet_cache_rows += entry.rows
+        while _sheet_cache and (len(_sheet_cache) > SHEET_CACHE_MAX_SHEETS or _sheet_cache_rows > SHEET_CACHE_MAX_ROWS):
+            _cache_drop(next(iter(_sheet_cache)))
+
+def _note_write(filename, date_str) -> int:
+    """Records a change to date_str: bumps its write version and drops its cached copy. Returns the new version."""
+    global _global_version, _last_write_time
+    with _cache_lock:
+        _global_version += 1
+        version = _write_versions[date_str] = _write_versions.get(date_str, 0) + 1
+        _write_times[date_str] = _last_write_time = time.time()
+        _cache_drop((filename, date_str))
+    return version
+
+def data_version(start_date: Optional[str] = None, end_date: Optional[str] = None, filename=EXCEL_FILENAME) -> Tuple[str, float]:
+    """
+    Returns (version, last modified as a Unix timestamp) of one date's entries (start_date alone),
+    of the dates in [start_date, end_date], or of the whole store, without reading any data.
+    The version changes on every write made through this process to one of those dates and, with
+    the Excel engine, whenever a workbook file holding them changes (outside edits included); it
+    never repeats across restarts. Before the first write of this process the last modified time
+    is the workbook's, or the process start.
+    """
+    if start_date and not end_date:
+        end_date = start_date
+    with _cache_lock:
+        if start_date:
+            written = sorted((day, _write_versions[day]) for day in _write_versions if start_date <= day <= end_date)
+            modified = max((_write_times[day] for day, _ in written), default=_BOOT_TIME)
+        else:
+            written = [("", _global_version)]
+            modified = _last_write_time
+    parts = [_VERSION_EPOCH, start_date or "", end_date or ""] + [f"{day}={version}" for day, version in written]
+    if STORAGE_ENGINE == "excel":
+        if start_date == end_date and start_date:
+            paths = [_shard_path(start_date, filename)]
+        elif start_date and _sharded():
+            paths = [path for path in store_files(filename) if start_date[:7] <= os.path.splitext(path)[0][-7:] <= end_date[:7]]
+        else:
+            paths = _store_files(filename)
+        outside = [(path, *_outside_changes(path)) for path in paths]
+        parts.extend(f"{path}={changes}" for path, changes, _ in outside)
+        if outside:
+            changed_at = max(changed_at for _, _, changed_at in outside)
+            modified = max(modified, changed_at) if any(version for _, version in written) else changed_at
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:20], modified
+
+def read_generation() -> Tuple[int, int]:
+    """
+    A cheap token that changes on every write through this process and every outside change that
+    data_version has noticed; results computed under one token are interchangeable for reads
+    started under the same token (executors.run_io_shared).
+    """
+    with _cache_lock:
+        return _global_version, _outside_total
+
+def _outside_changes(path) -> Tuple[int, float]:
+    """(outside changes seen, time of the last one or the file's mtime when first seen) of a workbook file."""
+    global _outside_total
+    sig = _file_signature(path)
+    with _cache_lock:
+        known = _file_versions.get(path)
+        if known is None:
+            known = _file_versions[path] = [sig, 0, sig[0] / 1e9 if sig else _BOOT_TIME]
+        elif known[0] != sig:
+            known[0] = sig
+            known[1] += 1
+            _outside_total += 1
+            known[2] = sig[0] / 1e9 if sig else time.time()
+        return known[1], known[2]
+
+def _restamp_cache(filename, path, old_sig, new_sig):
+    """
+    After our own save of `path`, sheets cached against old_sig are still valid under new_sig.
+    old_sig is None on the first save of a new file (or shard), which is not an outside change either.
+    """
+    with _cache_lock:
+        known = _file_versions.get(path)
+        if known is not None and known[0] == old_sig:
+            known[0] = new_sig
+        for (cached_file, date_str), entry in _sheet_cache.items():
+            if cached_file == filename and entry.sig == old_sig and path in (filename, _month_path(filename, date_str[:7])):
+                entry.sig = new_sig
+
+def clear_cache():
+    """Drops every parsed sheet held in memory."""
+    global _sheet_cache_rows
+    with _cache_lock:
+        _sheet_cache.clear()
+        _sheet_cache_rows = 0
+
+# --- Data Loading Function ---
+
+NUMERIC_KEYS = {"peso_bruto", "peso_tara", "merma", "peso_neto", "precio_x_kg", "importe"}
+
+def _header_keys(headers) -> List[Optional[str]]:
+    """Maps sheet header names to dictionary keys (lowercase, spaces to underscores, no '(kg)')."""
+    header_keys = []
+    for header in headers:
+        if header is None:
+            header_keys.append(None)
+            continue
+        header = str(header)
+        key = header.lower().replace(" ", "_").replace("(kg)", "").strip()
+        # Remove trailing underscore if the original header ended with "(kg)"
+        if header.endswith("(kg)") and key.endswith("_"):
+            key = key[:-1]
+        header_keys.append(key)
+    return header_keys
+
+def _row_to_entry(row_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Maps a row keyed by header keys to the Compra/Venta entry dict used by the API."""
+    entry_type = row_data.get("tipo_operación")
+    if entry_type == "Compra":
+        return {
+            "id": row_data.get("registro_id"),
+            "proveedor": row_data.get("contraparte"),
+            "mercaderia": row_data.get("producto"),
+            "bruto": row_data.get("peso_bruto"),
+            "tara": row_data.get("peso_tara"),
+            "merma": row_data.get("merma"),
+            "neto": row_data.get("peso_neto"),
+            "precio_kg": row_data.get("precio_x_kg"),
+            "importe": row_data.get("importe"),
+            "chofer": row_data.get("chofer/transporte"),
+            "patente": row_data.get("patente"),
+            "fecha": row_data.get("fecha_operacion"),
+            "hora_ingreso": row_data.get("hora_ingreso"),
+            "hora_salida": row_data.get("hora_salida"),
+            "observaciones": row_data.get("observaciones")
+        }
+    if entry_type == "Venta":
+        return {
+            "id": row_data.get("registro_id"),
+            "cliente": row_data.get("contraparte"),
+            "mercaderia": row_data.get("producto"),
+            "bruto": row_data.get("peso_bruto"),
+            "tara": row_data.get("peso_tara"),
+            "merma": row_data.get("merma"),
+            "neto": row_data.get("peso_neto"),
+            "precio_kg": row_data.get("precio_x_kg"),
+            "importe": row_data.get("importe"),
+            "transporte": row_data.get("chofer/transporte"), # Map Transporte from Chofer/Transporte
+            "patente": row_data.get("patente"),
+            "incoterm": row_data.get("incoterm"),
+            "fecha": row_data.get("fecha_operacion"),
+            "hora_ingreso": row_data.get("hora_ingreso"),
+            "hora_salida": row_data.get("hora_salida"),
+            "remito": row_data.get("remito"),
+            "observaciones": row_data.get("observaciones")
+        }
+    return None
+
+@functools.lru_cache(maxsize=64)
+def _column_plan(headers: Tuple[Any, ...]) -> Tuple[Tuple[Optional[str], bool, Any], ...]:
+    """(dict key, is numeric, header) per sheet column; computed once per distinct header row."""
+    return tuple((key, key in NUMERIC_KEYS, header) for key, header in zip(_header_keys(headers), headers))
+
+def _rows_to_data(headers, rows, source: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Converts value rows (without the header row) into {'Compra': [...], 'Venta': [...]}."""
+    data = {"Compra": [], "Venta": []}
+    plan = _column_plan(tuple(headers))
+    for row_idx, row in enumerate(rows, start=2):
+        row_data = {}
+        for (header_key, numeric, header), cell_value in zip(plan, row):
+            if numeric and cell_value.__class__ is not float:
+                try:
+                    # "" is what an unsaved empty cell holds in the live workbook
+                    cell_value = float(cell_value) if cell_value not in (None, "") else None
+                except (ValueError, TypeError):
+                    logger.warning(f"Could not convert value '{cell_value}' in column '{header}' to float in '{source}', row {row_idx}. Setting to None.")
+                    cell_value = None
+            row_data[header_key] = cell_value
+
+        entry = _row_to_entry(row_data)
+        if entry is not None:
+            data[row_data["tipo_operación"]].append(entry)
+    return data
+
+def _load_date_uncached(date_str: str, filename) -> Dict[str, List[Dict[str, Any]]]:
+    """Parses the entries of one date straight from the active storage engine."""
+    if STORAGE_ENGINE == "sqlite":
+        return _rows_to_data(HEADERS, sqlite_store.load_rows(date_str, _ensure_sqlite_ready(filename)), date_str)
+
+    data = {"Compra": [], "Venta": []}
+    path = _shard_path(date_str, filename)
+    if path != filename and (not _SHARD_MONTH.match(date_str[:7]) or (not os.path.exists(path) and path not in _live_workbooks)):
+        logger.info(f"No workbook for the month of '{date_str}'. Returning empty data.")
+        return data
+    state = _live_workbooks.get(path)
+    if state is None or state.workbook is None:
+        # Nothing of this file is held in memory (e.g. a closed month): stream just this sheet
+        return _load_sheet_readonly(path, date_str)
+    state = _get_live_workbook(path, filename)
+    with state.lock:
+        workbook = state.workbook
         if date_str not in workbook.sheetnames:
             logger.info(f"No sheet found for date '{date_str}'. Returning empty data.")
             return data
@@ -346,78 +1242,55 @@ def load_data_by_date(date_str: str, filename=EXCEL_FILENAME) -> Dict[str, List[
             logger.warning(f"Sheet '{sheet.title}' is empty or has no headers.")
             return data
 
-        header_keys = []
-        for header in headers:
-            key = header.lower().replace(" ", "_").replace("(kg)", "").strip()
-            if header.endswith("(kg)") and key.endswith("_"):
-                key = key[:-1]
-            header_keys.append(key)
-        
         logger.debug(f"Sheet headers: {headers}")
-        logger.debug(f"Mapped header keys: {header_keys}")
-
-        for row_idx in range(2, sheet.max_row + 1):
-            row_data = {}
-            for col_idx, cell in enumerate(sheet[row_idx]):
-                if col_idx < len(header_keys):
-                    header_key = header_keys[col_idx]
-                    cell_value = cell.value
-                    
-                    if header_key in ["peso_bruto", "peso_tara", "merma", "peso_neto", "precio_x_kg", "importe"]:
-                        try:
-                            cell_value = float(cell_value) if cell_value is not None else None
-                        except (ValueError, TypeError):
-                            logger.warning(f"Could not convert value '{cell_value}' in column '{headers[col_idx]}' to float in sheet '{sheet.title}', row {row_idx}. Setting to None.")
-                            cell_value = None
-                            
-                    row_data[header_key] = cell_value
-            
-            entry_type = row_data.get("tipo_operación")
-            if entry_type == "Compra":
-                compra_entry = {
-                    "id": row_data.get("registro_id"),
-                    "proveedor": row_data.get("contraparte"),
-                    "mercaderia": row_data.get("producto"),
-                    "bruto": row_data.get("peso_bruto"),
-                    "tara": row_data.get("peso_tara"),
-                    "merma": row_data.get("merma"),
-                    "neto": row_data.get("peso_neto"),
-                    "precio_kg": row_data.get("precio_x_kg"),
-                    "importe": row_data.get("importe"),
-                    "chofer": row_data.get("chofer/transporte"),
-                    "patente": row_data.get("patente"),
-                    "fecha": row_data.get("fecha_operacion"),
-                    "hora_ingreso": row_data.get("hora_ingreso"),
-                    "hora_salida": row_data.get("hora_salida"),
-                    "observaciones": row_data.get("observaciones")
-                }
-                data["Compra"].append(compra_entry)
-            elif entry_type == "Venta":
-                venta_entry = {
-                    "id": row_data.get("registro_id"),
-                    "cliente": row_data.get("contraparte"),
-                    "mercaderia": row_data.get("producto"),
-                    "bruto": row_data.get("peso_bruto"),
-                    "tara": row_data.get("peso_tara"),
-                    "merma": row_data.get("merma"),
-                    "neto": row_data.get("peso_neto"),
-                    "precio_kg": row_data.get("precio_x_kg"),
-                    "importe": row_data.get("importe"),
-                    "transporte": row_data.get("chofer/transporte"),
-                    "patente": row_data.get("patente"),
-                    "incoterm": row_data.get("incoterm"),
-                    "fecha": row_data.get("fecha_operacion"),
-                    "hora_ingreso": row_data.get("hora_ingreso"),
-                    "hora_salida": row_data.get("hora_salida"),
-                    "remito": row_data.get("remito"),
-                    "observaciones": row_data.get("observaciones")
-                }
-                data["Venta"].append(venta_entry)
+        return _rows_to_data(headers, sheet.iter_rows(min_row=2, values_only=True), sheet.title)
+
+def _load_sheet_readonly(path, date_str: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Parses one sheet from the saved file in read-only, values-only mode, without loading the other sheets or styles."""
+    if not os.path.exists(path):
+        logger.info(f"{path} does not exist. Returning empty data.")
+        return {"Compra": [], "Venta": []}
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return _parse_readonly_sheet(workbook, date_str)
+    finally:
+        workbook.close()
+
+def _parse_readonly_sheet(workbook, date_str: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Parses one sheet of a workbook opened with read_only=True."""
+    data = {"Compra": [], "Venta": []}
+    if date_str not in workbook.sheetnames:
+        logger.info(f"No sheet found for date '{date_str}'. Returning empty data.")
+        return data
+    rows = workbook[date_str].iter_rows(values_only=True)
+    headers = next(rows, None)
+    if not headers or all(h is None for h in headers):
+        logger.warning(f"Sheet '{date_str}' is empty or has no headers.")
+        return data
+    return _rows_to_data(headers, rows, date_str)
+
+def load_data_by_date(date_str: str, filename=EXCEL_FILENAME) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Loads data from a specific sheet identified by date_str (YYYY-MM-DD)
+    into a dictionary of lists, separated by entry type ('Compra' or 'Venta').
+    Repeat reads are served from the parsed sheet cache while the sheet is unchanged.
+    """
+    cached = _cache_get(filename, date_str)
+    if cached is not None:
+        logger.debug(f"Sheet cache hit for date {date_str}")
+        return cached
 
+    logger.info(f"Attempting to load data for date: {date_str} from: {filename}")
+    data = {"Compra": [], "Venta": []}
+    try:
+        sig, version = _cache_token(filename, date_str)
+        data = _load_date_uncached(date_str, filename)
+        _cache_put(filename, date_str, sig, version, data)
         logger.info(f"Successfully loaded {len(data['Compra'])} Compra entries and {len(data['Venta'])} Venta entries for date {date_str}.")
+        data = _copy_data(data)
 
     except Exception as e:
-        logger.error(f"Error loading data for date {date_str} from Excel: {e}", exc_info=True)
+        logger.error(f"Error loading data for date {date_str}: {e}", exc_info=True)
 
     return data
 
@@ -428,115 +1301,1024 @@ def load_daily_data(filename=EXCEL_FILENAME) -> Dict[str, List[Dict[str, Any]]]:
     separated by entry type ('Compra' or 'Venta').
     """
     logger.info(f"Attempting to load daily data from: {filename}")
-    data = {"Compra": [], "Venta": []}
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    return load_data_by_date(today_str, filename)
+
+
+def list_dates(filename=EXCEL_FILENAME) -> List[str]:
+    """Returns the dates (YYYY-MM-DD) that have stored data, in storage order."""
+    if STORAGE_ENGINE == "sqlite":
+        return sqlite_store.list_dates(_ensure_sqlite_ready(filename))
+    dates = []
+    for path in store_files(filename):
+        state = _live_workbooks.get(path)
+        if state is None or state.workbook is None:
+            # Workbooks not held in memory (closed months, or no write yet) are not loaded just to list their sheets
+            names = _saved_sheet_names(path) if os.path.exists(path) else []
+        else:
+            state = _get_live_workbook(path, filename)
+            with state.lock:
+                names = state.workbook.sheetnames
+        dates.extend(name for name in names if name.startswith("20"))
+    return dates
+
+
+# Sheet names of saved workbook files not held in memory, keyed by path and checked against the file signature
+_sheet_names_memo: Dict[str, Tuple[Any, List[str]]] = {}
+
+def _saved_sheet_names(path) -> List[str]:
+    sig = _file_signature(path)
+    memo = _sheet_names_memo.get(path)
+    if memo is not None and memo[0] == sig:
+        return memo[1]
+    workbook = openpyxl.load_workbook(path, read_only=True)
     try:
-        workbook = _load_or_create_workbook(filename)
-        if workbook is None:
-            logger.warning("Workbook could not be loaded or created. Returning empty data.")
-            return data
+        names = list(workbook.sheetnames)
+    finally:
+        workbook.close()
+    _sheet_names_memo[path] = (sig, names)
+    return names
 
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        if today_str not in workbook.sheetnames:
-            logger.info(f"No sheet found for today '{today_str}'. Returning empty data.")
-            return data
+def _range_data(start_date: str, end_date: str, filename, only=None) -> Iterator[Tuple[str, Dict[str, List[Dict[str, Any]]]]]:
+    """
+    Yields (date, parsed sheet) for the stored dates in [start_date, end_date], oldest first.
+    `only` (a set of dates) skips every other date before it is parsed.
+    """
+    if start_date > end_date:
+        return
+    wanted = (lambda date_str: True) if only is None else only.__contains__
+    if STORAGE_ENGINE == "sqlite":
+        for date_str in filter(wanted, sqlite_store.dates_between(start_date, end_date, _ensure_sqlite_ready(filename))):
+            data = _cache_get(filename, date_str, copy=False)
+            yield date_str, data if data is not None else load_data_by_date(date_str, filename)
+        return
+
+    for path in store_files(filename):
+        if path != filename and not (start_date[:7] <= os.path.splitext(path)[0][-7:] <= end_date[:7]):
+            continue  # Month shard outside the range
+        state = _live_workbooks.get(path)
+        if state is not None and state.workbook is not None:
+            state = _get_live_workbook(path, filename)
+            with state.lock:
+                names = list(state.workbook.sheetnames)
+            for date_str in sorted(n for n in names if n.startswith("20") and start_date <= n <= end_date and wanted(n)):
+                data = _cache_get(filename, date_str, copy=False)
+                yield date_str, data if data is not None else load_data_by_date(date_str, filename)
+            continue
+        if not os.path.exists(path):
+            continue
+        # Saved file: cached sheets come from the sheet cache, the rest from one read-only open
+        workbook = None
+        try:
+            for date_str in sorted(n for n in _saved_sheet_names(path) if n.startswith("20") and start_date <= n <= end_date and wanted(n)):
+                data = _cache_get(filename, date_str, copy=False)
+                if data is None:
+                    if workbook is None:
+                        workbook = openpyxl.load_workbook(path, read_only=True)
+                    sig, version = _cache_token(filename, date_str)
+                    data = _parse_readonly_sheet(workbook, date_str)
+                    _cache_put(filename, date_str, sig, version, data)
+                yield date_str, data
+        finally:
+            if workbook is not None:
+                workbook.close()
 
-        sheet = workbook[today_str]
-        headers = [cell.value for cell in sheet[1]] # Read headers from the sheet
+def load_range(start_date: str, end_date: str, entry_type: Optional[str] = None, filename=EXCEL_FILENAME) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Yields (date, entry type, entry) for every entry stored between start_date and end_date
+    (YYYY-MM-DD, inclusive), oldest date first; `entry_type` ('Compra'/'Venta') keeps only that type.
+    Only dates that have a sheet are read, each workbook file is opened at most once, and parsed
+    sheets go through the sheet cache. Entries may be the cached objects themselves: copy before mutating.
+    """
+    types = (entry_type,) if entry_type else ("Compra", "Venta")
+    for date_str, data in _range_data(start_date, end_date, filename):
+        for tipo in types:
+            for entry in data.get(tipo, []):
+                yield date_str, tipo, entry
 
-        if not headers:
-            logger.warning(f"Sheet '{sheet.title}' is empty or has no headers.")
-            return data
+# Sort keys of load_page ("fecha" orders by date, then hora de ingreso)
+PAGE_SORTS = ("fecha", "id", "neto", "contraparte")
 
-        # Map header names to dictionary keys (using lowercase and replacing spaces with underscores)
-        # Correctly handle keys for numeric columns by removing trailing underscore if present
-        header_keys = []
-        for header in headers:
-            key = header.lower().replace(" ", "_").replace("(kg)", "").strip()
-            # Remove trailing underscore if the original header ended with "(kg)"
-            if header.endswith("(kg)") and key.endswith("_"):
-                key = key[:-1]
-            header_keys.append(key)
-        logger.debug(f"Sheet headers: {headers}")
-        logger.debug(f"Mapped header keys: {header_keys}")
-
-
-        for row_idx in range(2, sheet.max_row + 1):
-            row_data = {}
-            for col_idx, cell in enumerate(sheet[row_idx]):
-                if col_idx < len(header_keys):  
-                    header_key = header_keys[col_idx]
-                    cell_value = cell.value
-                    
-                    # Attempt to convert numeric fields to float
-                    if header_key in ["peso_bruto", "peso_tara", "merma", "peso_neto", "precio_x_kg", "importe"]:
-                        original_value = cell_value # Store original value for logging
-                        try:
-                            cell_value = float(cell_value) if cell_value is not None else None
-                            if original_value is not None and cell_value is None:
-                                # Log if conversion failed for a non-None value
-                                logger.warning(f"Conversion to float failed for value '{original_value}' in column '{headers[col_idx]}' (key: {header_key}) in sheet '{sheet.title}', row {row_idx}. Setting to None.")
-                            elif original_value != cell_value:
-                                # Log if conversion changed the value (e.g., from int to float)
-                                logger.debug(f"Converted value '{original_value}' to float '{cell_value}' for column '{headers[col_idx]}' (key: {header_key}) in sheet '{sheet.title}', row {row_idx}.")
-                        except (ValueError, TypeError):
-                            logger.warning(f"Could not convert value '{original_value}' in column '{headers[col_idx]}' (key: {header_key}) to float in sheet '{sheet.title}', row {row_idx}. Setting to None.")
-                            cell_value = None # Set to None if conversion fails
-                            
-                    row_data[header_key] = cell_value
-            logger.debug(f"Read row {row_idx}: {row_data}")
-
-            # Determine entry type and add to appropriate list
-            entry_type = row_data.get("tipo_operación")
-            if entry_type == "Compra":
-                # Map Excel data to Compra model keys
-                compra_entry = {
-                    "id": row_data.get("registro_id"),
-                    "proveedor": row_data.get("contraparte"),
-                    "mercaderia": row_data.get("producto"),
-                    "bruto": row_data.get("peso_bruto"),
-                    "tara": row_data.get("peso_tara"),
-                    "merma": row_data.get("merma"),
-                    "neto": row_data.get("peso_neto"),
-                    "precio_kg": row_data.get("precio_x_kg"),
-                    "importe": row_data.get("importe"),
-                    "chofer": row_data.get("chofer/transporte"),
-                    "patente": row_data.get("patente"),
-                    "fecha": row_data.get("fecha_operacion"),
-                    "hora_ingreso": row_data.get("hora_ingreso"),
-                    "hora_salida": row_data.get("hora_salida"),
-                    "observaciones": row_data.get("observaciones") # Add observaciones
-                }
-                data["Compra"].append(compra_entry)
-                logger.debug(f"Added Compra entry: {compra_entry}")
-            elif entry_type == "Venta":
-                 # Map Excel data to Venta model keys
-                venta_entry = {
-                    "id": row_data.get("registro_id"),
-                    "cliente": row_data.get("contraparte"),
-                    "mercaderia": row_data.get("producto"),
-                    "bruto": row_data.get("peso_bruto"),
-                    "tara": row_data.get("peso_tara"),
-                    "merma": row_data.get("merma"),
-                    "neto": row_data.get("peso_neto"),
-                    "precio_kg": row_data.get("precio_x_kg"),
-                    "importe": row_data.get("importe"),
-                    "transporte": row_data.get("chofer/transporte"), # Map Transporte from Chofer/Transporte
-                    "patente": row_data.get("patente"),
-                    "incoterm": row_data.get("incoterm"),
-                    "fecha": row_data.get("fecha_operacion"),
-                    "hora_ingreso": row_data.get("hora_ingreso"),
-                    "hora_salida": row_data.get("hora_salida"),
-                    "remito": row_data.get("remito"),
-                    "observaciones": row_data.get("observaciones") # Add observaciones
-                }
-                data["Venta"].append(venta_entry)
-                logger.debug(f"Added Venta entry: {venta_entry}")
-
-        logger.info(f"Successfully loaded {len(data['Compra'])} Compra entries and {len(data['Venta'])} Venta entries.")
+def _sort_value(sort: str, entry: Dict[str, Any]):
+    if sort == "contraparte":
+        return search_index.fold(entry.get("proveedor") or entry.get("cliente")) or None
+    try:
+        return float(entry.get("id" if sort == "id" else "neto"))
+    except (TypeError, ValueError):
+        return None
+
+def _sort_entries(items: List[Tuple[str, str, Dict[str, Any]]], sort: str, descending: bool) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """Sorts (date, type, entry) items by `sort`, then date, hora de ingreso and ID; missing values go last."""
+    items.sort(key=lambda item: (item[0], str(item[2].get("hora_ingreso") or ""), _sort_value("id", item[2]) or 0), reverse=descending)
+    if sort == "fecha":
+        return items
+    keyed = [(_sort_value(sort, item[2]), item) for item in items]
+    present = [pair for pair in keyed if pair[0] is not None]
+    present.sort(key=lambda pair: pair[0], reverse=descending)
+    return [item for _, item in present] + [item for value, item in keyed if value is None]
 
+def _date_counts(types, start_date: str, end_date: str, filename) -> List[Tuple[str, int]]:
+    """(date, rows of `types`) for the stored dates in the range, from the SQLite table or the ID index."""
+    if STORAGE_ENGINE == "sqlite":
+        return sqlite_store.date_counts(types, start_date, end_date, _ensure_sqlite_ready(filename))
+    _ensure_id_index(filename)
+    return id_index.date_counts(id_index.index_path(filename), types, start_date, end_date)
+
+def _page_by_date(types, start_date, end_date, sort, descending, offset, limit, filename):
+    """Skips whole dates using their entry counts and parses only the dates the page falls on."""
+    counts = _date_counts(types, start_date, end_date, filename)
+    if descending:
+        counts.reverse()
+    skip, wanted, covered = offset, [], 0
+    for date_str, count in counts:
+        if not wanted and skip >= count:
+            skip -= count
+            continue
+        wanted.append(date_str)
+        covered += count
+        if limit is not None and covered >= skip + limit:
+            break
+    data_by_date = dict(_range_data(min(wanted), max(wanted), filename, set(wanted))) if wanted else {}
+    items = []
+    for date_str in wanted:
+        data = data_by_date.get(date_str, {})
+        day = [(date_str, tipo, entry) for tipo in types for entry in data.get(tipo, [])]
+        if sort == "fecha":
+            day = _sort_entries(day, "fecha", descending)
+        elif descending:
+            day.reverse()
+        items.extend(day)
+    return items[skip:None if limit is None else skip + limit], sum(count for _, count in counts)
+
+def _page_by_key(types, start_date, end_date, sort, descending, offset, limit, filename):
+    """
+    Reads the page's (date, type, ID) keys in order from the SQLite table or the ID index, then their dates.
+    Returns None when a sheet in the range repeats a key, which the ID index lists once: the caller scans.
+    """
+    total = sum(count for _, count in _date_counts(types, start_date, end_date, filename))
+    if STORAGE_ENGINE != "sqlite" and id_index.has_repeated_keys(id_index.index_path(filename), types, start_date, end_date):
+        return None
+    if STORAGE_ENGINE == "sqlite":
+        keys = sqlite_store.page_keys(types, start_date, end_date, sort, descending, offset, -1 if limit is None else limit,
+                                      path=_ensure_sqlite_ready(filename))
+    else:
+        keys = id_index.page_by_id(id_index.index_path(filename), types, start_date, end_date,
+                                   descending, offset, -1 if limit is None else limit)
+    dates = {date_str for date_str, _, _ in keys}
+    entries = {}
+    if dates:
+        for date_str, data in _range_data(min(dates), max(dates), filename, dates):
+            for tipo in types:
+                for entry in data.get(tipo, []):
+                    try:
+                        entries.setdefault((date_str, tipo, int(entry.get("id"))), entry)
+                    except (TypeError, ValueError):
+                        continue
+    return [(date_str, tipo, entries[(date_str, tipo, entry_id)]) for date_str, tipo, entry_id in keys
+            if (date_str, tipo, entry_id) in entries], total
+
+def load_page(start_date: str, end_date: str, entry_type: Optional[str] = None, sort: Optional[str] = None,
+              descending: bool = False, offset: int = 0, limit: Optional[int] = None, predicate=None,
+              filename=EXCEL_FILENAME) -> Tuple[List[Tuple[str, str, Dict[str, Any]]], int]:
+    """
+    Returns (page, total) for the entries between start_date and end_date (YYYY-MM-DD, inclusive):
+    up to `limit` (date, entry type, entry) items after skipping `offset`, and the count of all of them.
+    sort=None keeps storage order (date, then row); otherwise one of PAGE_SORTS, missing values last.
+    `predicate(entry)` keeps only matching entries.
+
+    Without a predicate the page is located through the per-date counts and keys of the SQLite table
+    or the ID index, so only the dates on the page are parsed; a predicate, or sorting by neto or
+    contraparte with the Excel engine, reads the whole range. Entries may be cached objects: copy before mutating.
+    """
+    if sort is not None and sort not in PAGE_SORTS:
+        raise ValueError(f"Unknown sort key: {sort}")
+    types = (entry_type,) if entry_type else ("Compra", "Venta")
+    offset = max(0, offset)
+    if predicate is None and start_date <= end_date:
+        try:
+            if sort in (None, "fecha"):
+                return _page_by_date(types, start_date, end_date, sort, descending, offset, limit, filename)
+            if sort == "id" or STORAGE_ENGINE == "sqlite":
+                page = _page_by_key(types, start_date, end_date, sort, descending, offset, limit, filename)
+                if page is not None:
+                    return page
+        except Exception as e:
+            logger.error(f"Paged read of {start_date}..{end_date} failed; scanning the range instead: {e}", exc_info=True)
+    items = [item for item in load_range(start_date, end_date, entry_type, filename) if predicate is None or predicate(item[2])]
+    if sort is not None:
+        items = _sort_entries(items, sort, descending)
+    elif descending:
+        items.reverse()
+    return items[offset:None if limit is None else offset + limit], len(items)
+
+def _move_time(entry: Dict[str, Any]) -> Tuple[int, int]:
+    """(hour, minute) of the hora de salida, else the hora de ingreso; (0, 0) when missing or invalid."""
+    hora = entry.get("hora_salida") or entry.get("hora_ingreso") or "00:00"
+    try:
+        hh, mm = (hora.split(":") + ["0"])[:2]
+        hh, mm = int(hh), int(mm)
+    except Exception:
+        return (0, 0)
+    return (hh, mm) if 0 <= hh < 24 and 0 <= mm < 60 else (0, 0)
+
+def _latest_of_date(date_str: str, data: Dict[str, List[Dict[str, Any]]]) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """One date's compras and ventas, newest first: each type sorted by time, then merged (compras first on ties)."""
+    per_type = [
+        sorted(((_move_time(entry), date_str, tipo, entry) for entry in data.get(tipo, [])), key=lambda item: item[0], reverse=True)
+        for tipo in ("Compra", "Venta")
+    ]
+    for _, date_str, tipo, entry in heapq.merge(*per_type, key=lambda item: item[0], reverse=True):
+        yield date_str, tipo, entry
+
+def load_latest(start_date: str, end_date: str, limit: int, filename=EXCEL_FILENAME) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Returns the `limit` most recent (date, entry type, entry) items between start_date and end_date
+    (YYYY-MM-DD, inclusive), ordered by date and hora de salida (else ingreso), newest first.
+    Walks the stored dates backwards from end_date through the per-date counts of the SQLite table
+    or the ID index and stops once `limit` items are found, so a year costs about the same as a day.
+    Entries may be cached objects: copy before mutating.
+    """
+    if limit <= 0 or start_date > end_date:
+        return []
+    try:
+        dates = [date_str for date_str, _ in _date_counts(("Compra", "Venta"), start_date, end_date, filename)]
     except Exception as e:
-        logger.error(f"Error loading daily data from Excel: {e}", exc_info=True)
+        logger.error(f"Date index unavailable for {start_date}..{end_date}; scanning the range instead: {e}", exc_info=True)
+        dates = None
+    if dates is None:
+        items = [item for date_str, data in _range_data(start_date, end_date, filename) for item in _latest_of_date(date_str, data)]
+        items.sort(key=lambda item: (item[0], _move_time(item[2])), reverse=True)
+        return items[:limit]
+    items = []
+    for date_str in reversed(dates):
+        data = dict(_range_data(date_str, date_str, filename)).get(date_str, {})
+        items.extend(itertools.islice(_latest_of_date(date_str, data), limit - len(items)))
+        if len(items) >= limit:
+            break
+    return items
 
-    return data
+def get_max_ids(filename=EXCEL_FILENAME) -> Dict[str, int]:
+    """
+    Returns the highest stored ID per entry type ('Compra' / 'Venta').
+    With the Excel engine it comes from the ID index, which only rescans sheets changed since its last sync.
+    """
+    if STORAGE_ENGINE == "sqlite":
+        return sqlite_store.max_ids(_ensure_sqlite_ready(filename))
+    try:
+        _ensure_id_index(filename)
+        return id_index.max_ids(id_index.index_path(filename))
+    except Exception as e:
+        logger.error(f"ID index unavailable for {filename}; scanning every sheet for max IDs: {e}", exc_info=True)
+    max_ids = {"Compra": 0, "Venta": 0}
+    for _, row in (item for path in store_files(filename) for item in _iter_workbook_rows(path)):
+        try:
+            entry_id = int(row[0])
+        except (ValueError, TypeError):
+            continue
+        if row[1] in max_ids and entry_id > max_ids[row[1]]:
+            max_ids[row[1]] = entry_id
+    return max_ids
+
+def find_entry_by_id(entry_id: int, entry_type: str, filename=EXCEL_FILENAME) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Finds a Compra/Venta entry by ID on any stored date through the persistent ID index.
+    Returns (entry_dict, date_str) or (None, None) if it is not stored.
+    """
+    try:
+        if STORAGE_ENGINE == "sqlite":
+            dates = sqlite_store.find_dates(entry_type, entry_id, _ensure_sqlite_ready(filename))
+        else:
+            _ensure_id_index(filename)
+            dates = id_index.find_dates(id_index.index_path(filename), entry_type, entry_id)
+    except Exception as e:
+        logger.error(f"ID index lookup failed for ID {entry_id} (Type: {entry_type}); scanning every date: {e}", exc_info=True)
+        dates = list_dates(filename)
+
+    for date_str in dates:
+        for entry in load_data_by_date(date_str, filename).get(entry_type, []):
+            try:
+                if int(entry.get("id", -1)) == int(entry_id):
+                    return entry, date_str
+            except (ValueError, TypeError):
+                continue
+    return None, None
+
+# --- ID Index (Excel engine) ---
+# id_index keeps (tipo, id) -> dates next to the workbook. It is trusted once per process
+# if the workbook still has the signature recorded at our last save; otherwise it is rebuilt.
+
+_id_index_verified = set()
+_id_index_lock = threading.Lock()
+
+def _sig_str(sig) -> Optional[str]:
+    return None if sig is None else f"{sig[0]}:{sig[1]}"
+
+def _store_sig(filename) -> Optional[str]:
+    """Signature of every workbook file of the store, as recorded in the ID index."""
+    if not _sharded():
+        return _sig_str(_file_signature(filename))
+    return ";".join(f"{os.path.basename(path)}={_sig_str(_file_signature(path))}" for path in _store_files(filename)) or None
+
+def _id_index_update(filename, entry_id, entry_type, date_str, present: bool):
+    """Adds or removes one entry of the ID index. Failures only log: the index can be rebuilt."""
+    try:
+        entry_type = entry_type.strip()
+        path = id_index.index_path(filename)
+        if present:
+            id_index.add_entry(path, entry_type, int(entry_id), date_str)
+        else:
+            id_index.remove_entry(path, entry_type, int(entry_id), date_str)
+    except Exception as e:
+        logger.warning(f"Could not update ID index for ID {entry_id} (Type: {entry_type}): {e}")
+        _id_index_verified.discard(filename)
+
+def _checkpoint_id_index(filename):
+    """Records the workbook signature the ID index matches after one of our saves."""
+    if filename not in _id_index_verified:
+        return
+    try:
+        id_index.set_meta(id_index.index_path(filename), "source_sig", _store_sig(filename))
+    except Exception as e:
+        logger.warning(f"Could not checkpoint ID index for {filename}: {e}")
+        _id_index_verified.discard(filename)
+
+def _ensure_id_index(filename):
+    """Resyncs the ID index if it was never built or the workbook changed outside this process."""
+    if filename in _id_index_verified:
+        return
+    with _id_index_lock:
+        if filename in _id_index_verified:
+            return
+        path = id_index.index_path(filename)
+        built = id_index.get_meta(path, "built") == "1"
+        derived_built = (search_index.is_built(search_index.index_path(filename))
+                         and daily_totals.is_built(daily_totals.index_path(filename)))
+        if not built or not derived_built or id_index.get_meta(path, "source_sig") != _store_sig(filename):
+            # A search index or rollup that is new or missed an update needs every sheet again
+            _sync_id_index(filename, full=not derived_built)
+        _id_index_verified.add(filename)
+
+def _sheet_fingerprint(workbook, sheet) -> Optional[str]:
+    """CRC and size of a read-only sheet's XML part: changes whenever the sheet's cells change."""
+    try:
+        info = workbook._archive.getinfo(sheet._worksheet_path)
+        return f"{info.CRC:08x}:{info.file_size}"
+    except (AttributeError, KeyError):
+        return None  # Unknown: always rescan
+
+def _sync_id_index(filename, full: bool) -> int:
+    """
+    Brings the ID index, search index and daily rollup in line with the saved workbook(s), rescanning
+    only sheets whose fingerprint changed since they were indexed (every sheet if `full`).
+    Returns the rescanned sheet count.
+    """
+    path = id_index.index_path(filename)
+    search_path = search_index.index_path(filename)
+    totals_path = daily_totals.index_path(filename)
+    files = store_files(filename)
+    if not files:
+        id_index.finish_sync(path, [], None)
+        search_index.finish_sync(search_path, [])
+        daily_totals.finish_sync(totals_path, [])
+        return 0
+    known = {} if full else id_index.sheet_fingerprints(path)
+    current = _shard_path(datetime.now().strftime("%Y-%m-%d"), filename)
+    present = []
+    rescanned = 0
+    for workbook_file in files:
+        # Writes only reach the current workbook; hold its lock so none lands mid-scan. Its state is
+        # created without parsing the workbook: the scan streams the saved file read-only
+        state = _live_state(workbook_file, filename) if workbook_file == current else _live_workbooks.get(workbook_file)
+        with contextlib.ExitStack() as held:
+            if state is not None:
+                held.enter_context(state.save_lock)
+                held.enter_context(state.lock)
+                # Pending changes must be on disk first, since the sync reads the saved file
+                _save_state(state)
+            if not os.path.exists(workbook_file):
+                continue
+            workbook = openpyxl.load_workbook(workbook_file, read_only=True)
+            try:
+                for sheet_name in workbook.sheetnames:
+                    if not sheet_name.startswith("20"):  # Hojas con formato YYYY-MM-DD
+                        continue
+                    present.append(sheet_name)
+                    sheet = workbook[sheet_name]
+                    fingerprint = _sheet_fingerprint(workbook, sheet)
+                    if fingerprint is not None and known.get(sheet_name) == fingerprint:
+                        continue
+                    rows = list(_iter_sheet_rows(sheet))
+                    id_index.replace_sheet(path, sheet_name, fingerprint, rows)
+                    search_index.replace_date(search_path, sheet_name, _search_docs(rows))
+                    daily_totals.replace_date(totals_path, sheet_name, _totals_items(rows))
+                    rescanned += 1
+            finally:
+                workbook.close()
+    id_index.finish_sync(path, present, _store_sig(filename))
+    search_index.finish_sync(search_path, present)
+    daily_totals.finish_sync(totals_path, present)
+    _totals_frame_changed(filename)
+    _id_index_verified.add(filename)
+    logger.info(f"ID index of {filename} synced: rescanned {rescanned} of {len(present)} sheets in {len(files)} workbook(s)")
+    return rescanned
+
+def rebuild_id_index(filename=EXCEL_FILENAME) -> int:
+    """Rescans every sheet of the workbook into the ID index, search index and daily rollup. Returns the sheet count."""
+    if STORAGE_ENGINE == "sqlite":
+        logger.info("The SQLite engine indexes IDs in its own table; rebuilding the search index and daily rollup only.")
+        with _id_index_lock:
+            return _rebuild_from_sqlite(filename)
+    with _id_index_lock:
+        return _sync_id_index(filename, full=True)
+
+# --- Search Index ---
+# search_index keeps the folded contraparte/patente/chofer/mercadería of every pesada. It is
+# updated on each write; with the Excel engine it is resynced together with the ID index.
+
+_sqlite_indexes_ready = set()  # SQLite engine: stores whose search index and rollup were checked this process
+
+def _search_fields(row) -> Dict[str, Any]:
+    """Indexed text fields of a HEADERS-ordered row."""
+    return {"contraparte": row[2], "mercaderia": row[3], "chofer": row[10], "patente": row[11]}
+
+def _search_docs(rows) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+    for row in rows:
+        try:
+            entry_id = int(row[0])
+        except (ValueError, TypeError):
+            continue
+        yield str(row[1]).strip(), entry_id, _search_fields(row)
+
+def _search_update(filename, entry_id, entry_type, date_str, data_row=None):
+    """Indexes one pesada (or drops it when data_row is None). A failure marks the index for a full rebuild."""
+    path = search_index.index_path(filename)
+    try:
+        entry_type = entry_type.strip()
+        if data_row is None:
+            search_index.remove(path, entry_type, int(entry_id), date_str)
+        else:
+            search_index.upsert(path, entry_type, int(entry_id), date_str, _search_fields(data_row))
+    except Exception as e:
+        logger.warning(f"Could not update search index for ID {entry_id} (Type: {entry_type}): {e}")
+        try:
+            search_index.invalidate(path)
+        except Exception:
+            pass
+        _id_index_verified.discard(filename)
+        _sqlite_indexes_ready.discard(filename)
+
+def _rebuild_from_sqlite(filename) -> int:
+    """Rebuilds the search index and daily rollup from every pesada of the SQLite store. Returns the date count."""
+    search_path = search_index.index_path(filename)
+    totals_path = daily_totals.index_path(filename)
+    dates = []
+    rows_by_date = sqlite_store.iter_all_rows(_ensure_sqlite_ready(filename))
+    for date_str, group in itertools.groupby(rows_by_date, key=lambda item: item[0]):
+        rows = [row for _, row in group]
+        search_index.replace_date(search_path, date_str, _search_docs(rows))
+        daily_totals.replace_date(totals_path, date_str, _totals_items(rows))
+        dates.append(date_str)
+    search_index.finish_sync(search_path, dates)
+    daily_totals.finish_sync(totals_path, dates)
+    _totals_frame_changed(filename)
+    logger.info(f"Search index and daily rollup of {filename} rebuilt from the SQLite store ({len(dates)} dates)")
+    return len(dates)
+
+def _ensure_derived_indexes(filename):
+    """Builds the search index and daily rollup on first use (Excel: through the ID index sync)."""
+    if STORAGE_ENGINE == "excel":
+        _ensure_id_index(filename)
+        return
+    if filename in _sqlite_indexes_ready:
+        return
+    with _id_index_lock:
+        if filename in _sqlite_indexes_ready:
+            return
+        path = _ensure_sqlite_ready(filename)
+        if not (search_index.is_built(search_index.index_path(filename))
+                and daily_totals.is_built(daily_totals.index_path(filename))):
+            _rebuild_from_sqlite(filename)
+        else:
+            # Writes only touch today, in two commits (store, then rollup): a crash between them
+            # leaves today's rollup behind, so recompute it once per process
+            today_str = datetime.now().strftime("%Y-%m-%d")
+            _totals_replace(filename, today_str, sqlite_store.load_rows(today_str, path))
+        _sqlite_indexes_ready.add(filename)
+
+def search_entries(query: str, entry_type: Optional[str] = None, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None, limit: int = 50, filename=EXCEL_FILENAME) -> List[Dict[str, Any]]:
+    """
+    Searches contraparte, patente, chofer/transporte and mercadería of every stored pesada,
+    ignoring case and accents; every word of `query` must match. Returns dicts with tipo, id,
+    fecha, those fields and score, most relevant first.
+    """
+    _ensure_derived_indexes(filename)
+    return search_index.search(search_index.index_path(filename), query, entry_type, start_date, end_date, limit)
+
+# --- Daily Rollup ---
+# daily_totals keeps count/neto/importe per (fecha, tipo, mercadería, contraparte). Each write moves its
+# row out of / into its group; it is rebuilt like the search index.
+
+def _totals_items(rows) -> Iterator[Tuple[Any, Any, Any, Any, Any]]:
+    """(tipo, mercadería, contraparte, neto, importe) of HEADERS-ordered rows."""
+    return ((row[1], row[3], row[2], row[7], row[9]) for row in rows)
+
+def _totals_failed(filename, date_str, error):
+    """Marks the rollup for a full rebuild after a failed update of date_str."""
+    logger.warning(f"Could not update daily rollup for {date_str}: {error}")
+    _totals_frame_changed(filename)
+    try:
+        daily_totals.invalidate(daily_totals.index_path(filename))
+    except Exception:
+        pass
+    _id_index_verified.discard(filename)
+    _sqlite_indexes_ready.discard(filename)
+
+def _totals_change(filename, date_str, removed_row=None, added_row=None):
+    """
+    Moves one HEADERS-ordered row out of (its values before the write) and/or into the rollup of
+    date_str. A failure marks the rollup for a full rebuild.
+    """
+    path = daily_totals.index_path(filename)
+    try:
+        removed = next(_totals_items([removed_row])) if removed_row is not None else None
+        added = next(_totals_items([added_row])) if added_row is not None else None
+        daily_totals.apply_change(path, date_str, removed, added)
+        _totals_frame_changed(filename, date_str)
+    except Exception as e:
+        _totals_failed(filename, date_str, e)
+
+def _totals_replace(filename, date_str, rows):
+    """Recomputes the rollup of one date from all its rows. A failure marks the rollup for a full rebuild."""
+    path = daily_totals.index_path(filename)
+    try:
+        daily_totals.replace_date(path, date_str, _totals_items(rows))
+        _totals_frame_changed(filename, date_str)
+    except Exception as e:
+        _totals_failed(filename, date_str, e)
+
+def _refresh_stale_totals(filename, rows_of):
+    """
+    Recomputes the dates whose smallest/largest neto a write left unknown (daily_totals.stale_dates),
+    from `rows_of(date)` (HEADERS-ordered rows, or None for a date held elsewhere). Runs when the
+    store saves or exports, off the write path; counts and sums were kept exact meanwhile.
+    """
+    path = daily_totals.index_path(filename)
+    try:
+        for date_str in daily_totals.stale_dates(path):
+            rows = rows_of(date_str)
+            if rows is not None:
+                daily_totals.replace_date(path, date_str, _totals_items(rows))
+    except Exception as e:
+        logger.warning(f"Could not recompute the daily rollup extremes of {filename}: {e}")
+
+# The whole rollup is also kept in memory as an analytics.Frame (NumPy columns). Writes only
+# mark their date; the next read re-reads just the marked dates and folds them in.
+_TOTALS_FRAME_MAX_DIRTY = 64  # More marked dates than this: reload the whole frame instead
+
+_totals_frames: Dict[str, Tuple[Optional["analytics.Frame"], set]] = {}  # store -> (frame, dates changed since)
+_totals_frames_lock = threading.Lock()
+
+def _totals_frame_changed(filename, date_str: Optional[str] = None):
+    """Marks one date (or, without date_str, the whole rollup) of the in-memory frame as stale."""
+    _series_cache_changed(filename, date_str)
+    with _totals_frames_lock:
+        cached = _totals_frames.get(filename)
+        if cached is None:
+            return
+        if date_str is None or len(cached[1]) >= _TOTALS_FRAME_MAX_DIRTY:
+            _totals_frames.pop(filename, None)
+        else:
+            cached[1].add(date_str)
+
+def load_totals_frame(filename=EXCEL_FILENAME) -> Optional["analytics.Frame"]:
+    """
+    Returns the whole daily rollup as an analytics.Frame kept in memory, or None when
+    NumPy is not installed or the rollup is unavailable. Do not modify the returned frame.
+    """
+    if not analytics.NUMPY_AVAILABLE:
+        return None
+    try:
+        _ensure_derived_indexes(filename)
+        path = daily_totals.index_path(filename)
+        with _totals_frames_lock:
+            frame, dirty = _totals_frames.get(filename, (None, set()))
+            if frame is None:
+                frame = analytics.Frame.from_totals(daily_totals.load_rows(path))
+            elif dirty:
+                fresh = analytics.Frame.from_totals(daily_totals.load_rows(path, dirty), like=frame)
+                frame = analytics.Frame.concat([frame.take(~frame.date_mask(dirty)), fresh])
+            _totals_frames[filename] = (frame, set())
+            return frame
+    except Exception as e:
+        logger.error(f"Columnar daily rollup unavailable for {filename}: {e}", exc_info=True)
+        return None
+
+# Time series over the rollup. A bucket that lies wholly inside the requested range and ended
+# before today is cached by (store, bucket, start, metric, group, tipo); only a change to one of
+# its dates (a resync or a late journal replay, never a normal write) drops it again.
+SERIES_BUCKETS = ("day", "week", "month")
+SERIES_METRICS = {"neto": "sum_neto", "importe": "sum_importe", "count": "count"}  # metric -> DailyTotal field
+SERIES_GROUPS = ("mercaderia", "contraparte")
+
+_series_cache: "OrderedDict[Tuple[Any, ...], Dict[Optional[str], float]]" = OrderedDict()
+_series_keys: Dict[Tuple[str, str, str], set] = {}  # (store, bucket, start) -> its cached keys
+_series_changes: Dict[str, Dict[Optional[str], int]] = {}  # store -> {date (None: all): change number}
+_series_change_count = 0
+_series_lock = threading.Lock()
+
+def _bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def _next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+def _series_cache_changed(filename, date_str: Optional[str] = None):
+    """Drops the cached buckets containing date_str (every bucket of the store without it)."""
+    global _series_change_count
+    try:
+        day = date.fromisoformat(date_str) if date_str else None
+    except ValueError:
+        day = date_str = None
+    with _series_lock:
+        _series_change_count += 1
+        _series_changes.setdefault(filename, {})[date_str] = _series_change_count
+        if day is None:
+            buckets = [bucket for bucket in _series_keys if bucket[0] == filename]
+        else:
+            buckets = [(filename, bucket, _bucket_start(day, bucket).isoformat()) for bucket in SERIES_BUCKETS]
+        for bucket in buckets:
+            for key in _series_keys.pop(bucket, ()):
+                _series_cache.pop(key, None)
+        window = _balance_windows.get(filename)
+        if window is not None:
+            if day is None:
+                del _balance_windows[filename]
+            else:
+                window.stale.add(date_str)
+
+def _prepare_rollup(filename):
+    """
+    Builds or resyncs the rollup before a caller takes its change mark: a build in the middle of
+    the call counts as a change to every date and would keep the call's results out of the caches.
+    """
+    try:
+        _ensure_derived_indexes(filename)
+    except Exception as e:
+        logger.warning(f"Daily rollup of {filename} not ready: {e}")
+
+def _series_changed_since(filename, mark: int) -> Optional[set]:
+    """Dates of the store changed after change number `mark`, or None if the whole store was. Caller holds _series_lock."""
+    changed = {day for day, number in _series_changes.get(filename, {}).items() if number > mark}
+    return None if None in changed else changed
+
+def _series_cache_put(key: Tuple[Any, ...], values: Dict[Optional[str], float]):
+    """Caches one closed bucket, evicting the least recently used ones. Caller holds _series_lock."""
+    _series_cache[key] = values
+    _series_keys.setdefault(key[:3], set()).add(key)
+    while len(_series_cache) > SERIES_CACHE_MAX_BUCKETS:
+        evicted, _ = _series_cache.popitem(last=False)
+        keys = _series_keys.get(evicted[:3])
+        if keys is not None:
+            keys.discard(evicted)
+            if not keys:
+                del _series_keys[evicted[:3]]
+
+def _compute_series(first: date, last: date, bucket, metric, group_by, entry_type, filename) -> Dict[str, Dict[Optional[str], float]]:
+    """{bucket start: {group label: value}} over the rollup rows of [first, last]."""
+    frame = load_totals_frame(filename)
+    if frame is not None:
+        sums = frame.bucket_sum(bucket, metric, frame.mask(first.isoformat(), last.isoformat(), entry_type), by=group_by)
+        result: Dict[str, Dict[Optional[str], float]] = {}
+        for key, value in sums.items():
+            start, label = key if group_by else (key, None)
+            result.setdefault(start, {})[label] = value
+        return result
+    result = {}
+    field = SERIES_METRICS[metric]
+    for total in load_daily_totals(first.isoformat(), last.isoformat(), filename):
+        if entry_type and total.tipo != entry_type:
+            continue
+        try:
+            start = _bucket_start(date.fromisoformat(total.fecha), bucket).isoformat()
+        except ValueError:
+            continue
+        values = result.setdefault(start, {})
+        label = getattr(total, group_by) if group_by else None
+        values[label] = values.get(label, 0) + (getattr(total, field) or 0)
+    return result
+
+def load_series(start_date: str, end_date: str, bucket: str = "day", metric: str = "neto", group_by: Optional[str] = None,
+                entry_type: Optional[str] = None, filename=EXCEL_FILENAME) -> List[Tuple[str, Optional[str], float]]:
+    """
+    Returns (bucket start, group label, value) rows of `metric` (SERIES_METRICS) summed per `bucket`
+    (day, week starting Monday, or month) and, with `group_by` (mercaderia or contraparte), per group,
+    over the rollup of [start_date, end_date] (YYYY-MM-DD, inclusive), oldest bucket first.
+    Buckets without pesadas are left out. Closed buckets are served from memory.
+    """
+    if bucket not in SERIES_BUCKETS or metric not in SERIES_METRICS or (group_by and group_by not in SERIES_GROUPS):
+        raise ValueError(f"Unsupported series: bucket={bucket}, metric={metric}, group_by={group_by}")
+    first, last = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    _prepare_rollup(filename)
+    today = date.today()
+    found: Dict[str, Dict[Optional[str], float]] = {}
+    runs: List[List[Any]] = []  # [first day, last day, starts of the closed buckets inside] still to compute
+    with _series_lock:
+        mark = _series_change_count
+        start = _bucket_start(first, bucket)
+        while start <= last:
+            following = _next_bucket(start, bucket)
+            closed = start >= first and following <= last + timedelta(days=1) and following <= today
+            key = (filename, bucket, start.isoformat(), metric, group_by, entry_type)
+            if closed and key in _series_cache:
+                _series_cache.move_to_end(key)
+                found[start.isoformat()] = _series_cache[key]
+            else:
+                span_first, span_last = max(start, first), min(following - timedelta(days=1), last)
+                if runs and runs[-1][1] + timedelta(days=1) == span_first:
+                    runs[-1][1] = span_last
+                else:
+                    runs.append([span_first, span_last, []])
+                if closed:
+                    runs[-1][2].append(start.isoformat())
+            start = following
+    for run_first, run_last, closed_starts in runs:
+        computed = _compute_series(run_first, run_last, bucket, metric, group_by, entry_type, filename)
+        found.update(computed)
+        with _series_lock:
+            # A bucket one of whose dates changed meanwhile may hold the old values: leave it out
+            changed = _series_changed_since(filename, mark)
+            if changed is None:
+                continue
+            stale = {_bucket_start(date.fromisoformat(day), bucket).isoformat() for day in changed}
+            for start in closed_starts:
+                if start not in stale:
+                    _series_cache_put((filename, bucket, start, metric, group_by, entry_type), computed.get(start, {}))
+    return [(start, label, value) for start in sorted(found) for label, value in found[start].items()]
+
+# Daily balance (compras - ventas neto) window: one contiguous span of closed days per store whose
+# balances are known. Requests only compute the days outside it, the days marked stale since and today.
+class _BalanceWindow:
+    def __init__(self, first: str, last: str, values: Dict[str, float]):
+        self.first, self.last = first, last
+        self.values = values  # date -> balance; days of the span without pesadas are absent
+        self.stale: set = set()
+
+_balance_windows: Dict[str, _BalanceWindow] = {}
+
+def _compute_balances(first: str, last: str, filename) -> Dict[str, float]:
+    """{date: compras - ventas neto} of the dates with pesadas in [first, last], from the rollup."""
+    balances: Dict[str, float] = {}
+    if first > last:
+        return balances
+    frame = load_totals_frame(filename)
+    if frame is not None:
+        by_day = frame.bucket_sum("day", "neto", frame.mask(first, last), by="tipo")
+        for (date_str, tipo), kilos in by_day.items():
+            balances[date_str] = balances.get(date_str, 0.0) + (kilos if tipo == "Compra" else -kilos)
+        return balances
+    for total in load_daily_totals(first, last, filename):
+        kilos = total.sum_neto
+        balances[total.fecha] = balances.get(total.fecha, 0.0) + (kilos if total.tipo == "Compra" else -kilos)
+    return balances
+
+def load_daily_balances(start_date: str, end_date: str, filename=EXCEL_FILENAME) -> Dict[str, float]:
+    """
+    Returns {date: compras - ventas neto} for the dates with pesadas between start_date and end_date
+    (YYYY-MM-DD, inclusive). Days before today are kept in memory until one of them changes, so a
+    365-day window only recomputes today (and whatever it adds to the cached span). A request that
+    neither overlaps nor adjoins the cached span is computed on its own and replaces it.
+    """
+    if start_date > end_date:
+        return {}
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    closed_end = min(end_date, yesterday)
+    spans, stale, balances = [], set(), {}
+    _prepare_rollup(filename)
+    with _series_lock:
+        mark = _series_change_count
+        window = _balance_windows.get(filename)
+        if window is None or start_date > closed_end or not _touches(window, start_date, closed_end):
+            spans.append((start_date, end_date))
+        else:
+            # The cached span plus the closed days either side of it, then what lies after yesterday
+            if start_date < window.first:
+                spans.append((start_date, _day_before(window.first)))
+            if closed_end > window.last:
+                spans.append((_day_after(window.last), closed_end))
+            if end_date > closed_end:
+                spans.append((_day_after(closed_end), end_date))
+            stale = {day for day in window.stale if start_date <= day <= closed_end}
+            balances = {day: value for day, value in window.values.items()
+                        if start_date <= day <= closed_end and day not in stale}
+    # Spans reach the cached one even when the request does not, so keep only the requested days
+    computed = [(first, last, _compute_balances(first, last, filename)) for first, last in spans]
+    refreshed = {day: _compute_balances(day, day, filename).get(day) for day in stale}
+    for _, _, values in computed:
+        balances.update((day, value) for day, value in values.items() if start_date <= day <= end_date)
+    balances.update((day, value) for day, value in refreshed.items() if value is not None)
+    with _series_lock:
+        changed = _series_changed_since(filename, mark)
+        if changed is not None:
+            window = _balance_windows.get(filename)
+            for first, last, values in computed:
+                last = min(last, yesterday)
+                if first > last:
+                    continue  # Today (or later) is never cached
+                closed = {day: value for day, value in values.items() if day <= last}
+                if window is None or not _touches(window, first, last):
+                    window = _balance_windows[filename] = _BalanceWindow(first, last, closed)
+                else:
+                    window.values.update(closed)
+                    window.first, window.last = min(window.first, first), max(window.last, last)
+            for day, value in refreshed.items():
+                window.values.pop(day, None)
+                if value is not None:
+                    window.values[day] = value
+                window.stale.discard(day)
+            if window is not None:
+                # Days changed while computing are recomputed by the next request
+                window.stale.update(day for day in changed if window.first <= day <= window.last)
+    return balances
+
+def _touches(window: _BalanceWindow, first: str, last: str) -> bool:
+    """True if [first, last] overlaps the window's span or is next to it."""
+    return first <= _day_after(window.last) and last >= _day_before(window.first)
+
+def _day_before(date_str: str) -> str:
+    return (date.fromisoformat(date_str) - timedelta(days=1)).isoformat()
+
+def _day_after(date_str: str) -> str:
+    return (date.fromisoformat(date_str) + timedelta(days=1)).isoformat()
+
+def load_daily_totals(start_date: str, end_date: str, filename=EXCEL_FILENAME) -> List[daily_totals.DailyTotal]:
+    """
+    Returns the rollup rows (fecha, tipo, mercaderia, contraparte, count, sum_neto, sum_importe, min_neto, max_neto)
+    of every date between start_date and end_date (YYYY-MM-DD, inclusive), oldest first.
+    If the rollup is unavailable they are computed from the entries of the range.
+    """
+    if start_date > end_date:
+        return []
+    try:
+        _ensure_derived_indexes(filename)
+        return daily_totals.load_range(daily_totals.index_path(filename), start_date, end_date)
+    except Exception as e:
+        logger.error(f"Daily rollup unavailable for {filename}; aggregating the entries of the range: {e}", exc_info=True)
+    totals = []
+    for date_str, items in itertools.groupby(load_range(start_date, end_date, filename=filename), key=lambda item: item[0]):
+        totals.extend(daily_totals.rollup(date_str, (
+            (tipo, entry.get("mercaderia"), entry.get("proveedor") or entry.get("cliente"), entry.get("neto"), entry.get("importe"))
+            for _, tipo, entry in items
+        )))
+    return totals
+
+# --- SQLite Engine ---
+
+_sqlite_ready = set()  # SQLite files checked for seeding this process
+_sqlite_ready_lock = threading.Lock()
+_export_timers: Dict[str, threading.Timer] = {}  # workbook -> pending scheduled export
+_export_lock = threading.Lock()
+
+def _sqlite_path(filename) -> str:
+    """
+    SQLite file holding the pesadas of a workbook: SQLITE_DB_PATH for EXCEL_FILENAME, otherwise
+    the workbook's name with a '.db' extension (daily_log.xlsx -> daily_log.db).
+    """
+    if os.path.abspath(filename) == os.path.abspath(EXCEL_FILENAME):
+        return sqlite_store.SQLITE_FILENAME
+    return os.path.splitext(filename)[0] + ".db"
+
+def _iter_sheet_rows(sheet) -> Iterator[List[Any]]:
+    """Yields every data row of a dated sheet in HEADERS order."""
+    rows = sheet.iter_rows(values_only=True)
+    headers = list(next(rows, None) or [])
+    if not headers:
+        return
+    # Older sheets lack some columns; map by header name
+    positions = [headers.index(h) if h in headers else None for h in HEADERS]
+    for row in rows:
+        if not row or row[0] is None or row[1] is None:
+            continue
+        yield [row[p] if p is not None and p < len(row) else None for p in positions]
+
+def _iter_workbook_rows(filename) -> Iterator[Tuple[str, List[Any]]]:
+    """Yields (sheet date, row in HEADERS order) for every data row of every dated sheet."""
+    if not os.path.exists(filename):
+        return
+    workbook = openpyxl.load_workbook(filename, read_only=True)
+    try:
+        for sheet_name in workbook.sheetnames:
+            if not sheet_name.startswith("20"):  # Hojas con formato YYYY-MM-DD
+                continue
+            for row in _iter_sheet_rows(workbook[sheet_name]):
+                yield sheet_name, row
+    finally:
+        workbook.close()
+
+def import_workbook(filename=EXCEL_FILENAME) -> int:
+    """Copies every dated sheet of the workbook into the SQLite store. Returns the row count."""
+    path = _sqlite_path(filename)
+    count = sqlite_store.bulk_insert(_iter_workbook_rows(filename), path)
+    logger.info(f"Imported {count} rows from {filename} into {path}")
+    return count
+
+def export_workbook(filename=EXCEL_FILENAME) -> int:
+    """
+    Regenerates the workbook from the SQLite store (one sheet per date). Returns the sheet count.
+    An empty store writes a workbook without dated sheets, so deleted pesadas do not linger in it.
+    """
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    sheet = None
+    for date_str, row in sqlite_store.iter_all_rows(_sqlite_path(filename)):
+        if sheet is None or sheet.title != date_str:
+            sheet = workbook.create_sheet(title=date_str)
+            sheet.append(HEADERS)
+            _apply_sheet_formatting(sheet)
+        sheet.append(row)
+    count = len(workbook.sheetnames)
+    if not count:
+        workbook.create_sheet()  # A workbook needs at least one sheet
+    _save_workbook(workbook, filename)
+    logger.info(f"Exported {count} sheets to {filename}")
+    return count
+
+def _ensure_sqlite_ready(filename) -> str:
+    """On the first use of the workbook's SQLite file, seeds it from the workbook if it is empty. Returns the file."""
+    path = _sqlite_path(filename)
+    if path in _sqlite_ready:
+        return path
+    with _sqlite_ready_lock:
+        if path in _sqlite_ready:
+            return path
+        # Recorded in the store, so a store emptied later by deletes is not seeded again on restart
+        if sqlite_store.get_meta("seeded", path) is None:
+            if sqlite_store.is_empty(path) and os.path.exists(filename):
+                logger.info(f"SQLite store {path} is empty; importing existing workbook {filename}")
+                import_workbook(filename)
+            sqlite_store.set_meta("seeded", filename, path)
+        _sqlite_ready.add(path)
+    return path
+
+def _schedule_export(filename):
+    """Exports the workbook EXCEL_EXPORT_INTERVAL seconds after the first pending write."""
+    with _export_lock:
+        if filename in _export_timers:
+            return
+        timer = _export_timers[filename] = threading.Timer(EXCEL_EXPORT_INTERVAL, _run_scheduled_export, args=(filename,))
+        timer.daemon = True
+        timer.start()
+
+def _run_scheduled_export(filename):
+    with _export_lock:
+        _export_timers.pop(filename, None)
+    path = _sqlite_path(filename)
+    _refresh_stale_totals(filename, lambda date_str: sqlite_store.load_rows(date_str, path))
+    try:
+        export_workbook(filename)
+    except Exception as e:
+        logger.error(f"Scheduled export to {filename} failed: {e}", exc_info=True)
+
+def _sqlite_upsert(entry_id, entry_type, data_row, filename) -> Optional[CommitReceipt]:
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    try:
+        path = _ensure_sqlite_ready(filename)
+        previous_row = sqlite_store.load_row(today_str, entry_id, entry_type, path)
+        # upsert_row reads the row back by (fecha, tipo, id), so the receipt shows what was stored
+        rowid, stored_type, stored_id = sqlite_store.upsert_row(today_str, entry_id, entry_type, data_row, path)
+        version = _note_write(filename, today_str)
+        _search_update(filename, entry_id, entry_type, today_str, data_row)
+        _totals_change(filename, today_str, previous_row, data_row)
+        logger.info(f"Upserted ID {entry_id} (Type: {entry_type}) for {today_str} in SQLite store")
+        _schedule_export(filename)
+        return CommitReceipt(sheet=today_str, row=rowid, version=version, entry_id=stored_id, entry_type=stored_type)
+    except Exception as e:
+        logger.error(f"Failed to upsert data for ID {entry_id} (Type: {entry_type}): {e}", exc_info=True)
+        return None
+
+def _sqlite_delete(entry_id, entry_type, filename):
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    try:
+        path = _ensure_sqlite_ready(filename)
+        deleted_row = sqlite_store.load_row(today_str, entry_id, entry_type, path)
+        if sqlite_store.delete_row(today_str, entry_id, entry_type, path):
+            _note_write(filename, today_str)
+            _search_update(filename, entry_id, entry_type, today_str)
+            _totals_change(filename, today_str, deleted_row, None)
+            logger.info(f"Deleted ID {entry_id} (Type: {entry_type}) for {today_str} from SQLite store")
+            _schedule_export(filename)
+            return True
+        logger.warning(f"Could not find ID {entry_id} (Type: {entry_type}) for {today_str} to delete.")
+    except Exception as e:
+        logger.error(f"Failed to delete data for ID {entry_id} (Type: {entry_type}): {e}", exc_info=True)
+    return False
 
 # --- No main execution block ---
@@ -0,0 +1,251 @@
+"""
+Daily rollup of the pesadas for the dashboard.
+
+Keeps one small row per (fecha, tipo, mercadería, contraparte) with the
+count, total neto, total importe and the smallest/largest neto, in a SQLite
+file next to the workbook (daily_log.xlsx -> daily_log.totals.db). Every
+upsert/delete moves its pesada out of / into its group in one transaction
+(apply_change), so a write costs the same however many pesadas the day has
+and a dashboard query over a year reads a few rows per day instead of every
+pesada. Removing a group's smallest or largest neto leaves that group's
+extremes unknown (reported as None) until replace_date recomputes its date,
+which the store does when it next saves or exports (see stale_dates).
+With the Excel engine it is resynced together with the ID index (see
+daily_excel_logger); `python storage_admin.py reindex` rebuilds it.
+"""
+
+import sqlite3
+import os
+import logging
+from typing import List, Any, Optional, Dict, Iterable, NamedTuple, Tuple
+
+import sqlite_util
+
+logger = logging.getLogger("daily_excel_logger.daily_totals")
+
+# Bumped when the totals table changes; an older file is emptied and rebuilt
+SCHEMA_VERSION = "3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS totals (
+    fecha TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    mercaderia TEXT NOT NULL,  -- '' when the pesada has none
+    contraparte TEXT NOT NULL,  -- Proveedor or cliente; '' when none
+    count INTEGER NOT NULL,
+    sum_neto REAL NOT NULL,
+    sum_importe REAL NOT NULL,
+    min_neto REAL,
+    max_neto REAL,
+    stale INTEGER NOT NULL DEFAULT 0,  -- 1 while min_neto/max_neto wait for replace_date
+    PRIMARY KEY (fecha, tipo, mercaderia, contraparte)
+);
+CREATE INDEX IF NOT EXISTS idx_totals_stale ON totals (fecha) WHERE stale = 1;
+"""
+_META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+_COLUMNS = "fecha, tipo, mercaderia, contraparte, count, sum_neto, sum_importe, min_neto, max_neto"
+# Read side: extremes awaiting a recompute are unknown
+_SELECT = ("fecha, tipo, mercaderia, contraparte, count, sum_neto, sum_importe, "
+           "CASE WHEN stale THEN NULL ELSE min_neto END, CASE WHEN stale THEN NULL ELSE max_neto END")
+
+
+class DailyTotal(NamedTuple):
+    fecha: str
+    tipo: str
+    mercaderia: Optional[str]
+    contraparte: Optional[str]
+    count: int
+    sum_neto: float
+    sum_importe: float
+    min_neto: Optional[float]
+    max_neto: Optional[float]
+
+
+def index_path(workbook_filename: str) -> str:
+    """Returns the rollup file used for a workbook (same name, '.totals.db' extension)."""
+    return os.path.splitext(workbook_filename)[0] + ".totals.db"
+
+
+def _init_schema(conn: sqlite3.Connection, path: str):
+    conn.executescript(_META_SCHEMA)
+    version = conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+    if version is None or version[0] != SCHEMA_VERSION:
+        # Older layout (or a new file): start empty; is_built() is False until the next rebuild
+        conn.execute("DROP TABLE IF EXISTS totals")
+        conn.execute("DELETE FROM meta")
+        conn.execute("INSERT INTO meta (key, value) VALUES ('schema', ?)", (SCHEMA_VERSION,))
+    conn.executescript(_SCHEMA)
+
+
+_connections = sqlite_util.ConnectionPool("daily totals", _init_schema)
+_connect = _connections.connect
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _label(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def _group_key(entry_type: Any, material: Any, party: Any) -> Tuple[str, str, str]:
+    return str(entry_type).strip(), _label(material), _label(party)
+
+
+def rollup(date_str: str, items: Iterable[Tuple[Any, Any, Any, Any, Any]]) -> List[DailyTotal]:
+    """
+    Aggregates one date's (tipo, mercadería, contraparte, neto, importe) items. Groups keep the
+    order in which they first appear; non-numeric neto/importe count as missing.
+    """
+    groups: Dict[Tuple[str, str, str], List[Any]] = {}
+    for entry_type, material, party, neto, importe in items:
+        key = _group_key(entry_type, material, party)
+        group = groups.setdefault(key, [0, 0.0, 0.0, None, None])
+        neto, importe = _number(neto), _number(importe)
+        group[0] += 1
+        if neto is not None:
+            group[1] += neto
+            group[3] = neto if group[3] is None else min(group[3], neto)
+            group[4] = neto if group[4] is None else max(group[4], neto)
+        if importe is not None:
+            group[2] += importe
+    return [
+        DailyTotal(date_str, entry_type, material or None, party or None, *values)
+        for (entry_type, material, party), values in groups.items()
+    ]
+
+
+def replace_date(path: str, date_str: str, items: Iterable[Tuple[Any, Any, Any, Any, Any]]) -> int:
+    """Replaces the rollup of date_str with the aggregate of its (tipo, mercadería, contraparte, neto, importe) items."""
+    totals = rollup(date_str, items)
+    conn = _connect(path)
+    with conn:
+        conn.execute("DELETE FROM totals WHERE fecha = ?", (date_str,))
+        conn.executemany(
+            f"INSERT INTO totals ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(t.fecha, t.tipo, t.mercaderia or "", t.contraparte or "", *t[4:]) for t in totals],
+        )
+    return len(totals)
+
+
+def _remove_item(conn: sqlite3.Connection, date_str: str, item: Tuple[Any, Any, Any, Any, Any]) -> bool:
+    entry_type, material, party, neto, importe = item
+    key = (date_str, *_group_key(entry_type, material, party))
+    row = conn.execute(
+        "SELECT count, min_neto, max_neto FROM totals WHERE fecha = ? AND tipo = ? AND mercaderia = ? AND contraparte = ?", key
+    ).fetchone()
+    if row is None:
+        return False  # Not in the rollup: it was already out of line with the rows
+    if row[0] <= 1:
+        conn.execute("DELETE FROM totals WHERE fecha = ? AND tipo = ? AND mercaderia = ? AND contraparte = ?", key)
+        return True
+    neto, importe = _number(neto), _number(importe)
+    # The next smallest/largest neto of the group is unknown without its rows
+    extreme = neto is not None and neto in (row[1], row[2])
+    conn.execute(
+        "UPDATE totals SET count = count - 1, sum_neto = sum_neto - ?, sum_importe = sum_importe - ?, "
+        "stale = MAX(stale, ?) WHERE fecha = ? AND tipo = ? AND mercaderia = ? AND contraparte = ?",
+        (neto or 0.0, importe or 0.0, int(extreme), *key),
+    )
+    return not extreme
+
+
+def _add_item(conn: sqlite3.Connection, date_str: str, item: Tuple[Any, Any, Any, Any, Any]):
+    entry_type, material, party, neto, importe = item
+    neto, importe = _number(neto), _number(importe)
+    conn.execute(
+        f"INSERT INTO totals ({_COLUMNS}) VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?) "
+        "ON CONFLICT (fecha, tipo, mercaderia, contraparte) DO UPDATE SET count = count + 1, "
+        "sum_neto = sum_neto + excluded.sum_neto, sum_importe = sum_importe + excluded.sum_importe, "
+        "min_neto = COALESCE(MIN(min_neto, excluded.min_neto), min_neto, excluded.min_neto), "
+        "max_neto = COALESCE(MAX(max_neto, excluded.max_neto), max_neto, excluded.max_neto)",
+        (date_str, *_group_key(entry_type, material, party), neto or 0.0, importe or 0.0, neto, neto),
+    )
+
+
+def apply_change(path: str, date_str: str, removed: Optional[Tuple[Any, Any, Any, Any, Any]] = None,
+                 added: Optional[Tuple[Any, Any, Any, Any, Any]] = None) -> bool:
+    """
+    Moves one pesada's (tipo, mercadería, contraparte, neto, importe) out of (`removed`, its values
+    before an update or delete) and/or into (`added`) the rollup of date_str, in one transaction.
+    Returns False if that left some group's extremes stale (see stale_dates).
+    """
+    conn = _connect(path)
+    exact = True
+    with conn:
+        if removed is not None:
+            exact = _remove_item(conn, date_str, removed)
+        if added is not None:
+            _add_item(conn, date_str, added)
+    return exact
+
+
+def stale_dates(path: str) -> List[str]:
+    """Dates with a group whose smallest/largest neto must be recomputed through replace_date."""
+    conn = _connect(path)
+    return [row[0] for row in conn.execute("SELECT DISTINCT fecha FROM totals WHERE stale = 1 ORDER BY fecha")]
+
+
+def load_range(path: str, start_date: str, end_date: str) -> List[DailyTotal]:
+    """Returns the rollup rows of [start_date, end_date], oldest date first, groups in order of appearance."""
+    conn = _connect(path)
+    cursor = conn.execute(
+        f"SELECT {_SELECT} FROM totals WHERE fecha BETWEEN ? AND ? ORDER BY fecha, rowid",
+        (start_date, end_date),
+    )
+    return [DailyTotal(row[0], row[1], row[2] or None, row[3] or None, *row[4:]) for row in cursor]
+
+
+def load_rows(path: str, dates: Optional[Iterable[str]] = None) -> List[Tuple[Any, ...]]:
+    """
+    Raw rollup rows in DailyTotal field order ('' for no mercadería/contraparte) of every date,
+    or of `dates`. Cheaper than load_range for bulk loads such as analytics.Frame.from_totals.
+    """
+    conn = _connect(path)
+    sql = f"SELECT {_SELECT} FROM totals"
+    if dates is None:
+        return conn.execute(sql + " ORDER BY fecha, rowid").fetchall()
+    dates = sorted(set(dates))
+    return conn.execute(
+        sql + f" WHERE fecha IN ({', '.join('?' for _ in dates)}) ORDER BY fecha, rowid", dates
+    ).fetchall() if dates else []
+
+
+def finish_sync(path: str, present_dates: Iterable[str]):
+    """Drops dates that no longer exist and marks the rollup as built."""
+    conn = _connect(path)
+    present = set(present_dates)
+    with conn:
+        for (fecha,) in conn.execute("SELECT DISTINCT fecha FROM totals").fetchall():
+            if fecha not in present:
+                conn.execute("DELETE FROM totals WHERE fecha = ?", (fecha,))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '1')")
+
+
+def is_built(path: str) -> bool:
+    conn = _connect(path)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+    return bool(row) and row[0] == "1"
+
+
+def invalidate(path: str):
+    """Marks the rollup as needing a full rebuild (e.g. after a failed update)."""
+    conn = _connect(path)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '0')")
+
+
+def close(path: Optional[str] = None):
+    """Closes this thread's connection(s). Mainly useful for tools and shutdown."""
+    _connections.close(path)
@@ -0,0 +1,171 @@
+"""
+Bounded worker pools for blocking work called from async endpoints.
+
+Storage (daily_excel_logger), file copies and printing run on the "io" pool;
+PDF rendering (crear_pdf_recibo, generar_planilla) runs on the "cpu" pool, so
+a long planilla never takes the threads that ticket saves and dashboards need.
+Each pool admits at most `max_pending` jobs (queued + running); further
+callers wait without blocking the event loop. `stats()` reports queue depth.
+
+run_io_shared coalesces identical concurrent reads: callers asking for the
+same function, arguments and data generation while one such call is running
+wait for it and get its result instead of queueing their own copy.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable
+
+logger = logging.getLogger("daily_excel_logger.executors")
+
+# Configuration
+IO_POOL_WORKERS = int(os.getenv("IO_POOL_WORKERS", "4"))
+IO_POOL_MAX_PENDING = int(os.getenv("IO_POOL_MAX_PENDING", "64"))
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(min(2, os.cpu_count() or 1))))
+CPU_POOL_MAX_PENDING = int(os.getenv("CPU_POOL_MAX_PENDING", "16"))
+# Jobs slower than this (seconds) are logged
+SLOW_JOB_SECONDS = float(os.getenv("SLOW_JOB_SECONDS", "5"))
+
+
+class _BoundedPool:
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{name}-pool")
+        self.lock = threading.Lock()
+        self.slots = None  # asyncio.Semaphore, created on the running loop
+        self.waiting = 0  # Callers waiting for a free slot
+        self.queued = 0  # Submitted, not started yet
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.peak_depth = 0
+
+    def _run(self, func, args, kwargs):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        started = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            with self.lock:
+                self.failed += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+            if elapsed > SLOW_JOB_SECONDS:
+                logger.warning(f"{self.name} job {getattr(func, '__name__', func)} took {elapsed:.1f}s")
+
+    async def submit(self, func: Callable, *args, **kwargs) -> Any:
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+        with self.lock:
+            self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        try:
+            with self.lock:
+                self.queued += 1
+                self.peak_depth = max(self.peak_depth, self.queued + self.running)
+            loop = asyncio.get_running_loop()
+            call = functools.partial(self._run, func, args, kwargs)
+            return await loop.run_in_executor(self.executor, call)
+        finally:
+            self.slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "waiting": self.waiting,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "peak_depth": self.peak_depth,
+            }
+
+
+class _SingleFlight:
+    """In-flight calls by key; callers of a running key share its future."""
+
+    def __init__(self):
+        self.calls: Dict[Hashable, "asyncio.Future"] = {}
+        self.lock = threading.Lock()  # Only guards the counters; `calls` is touched on the event loop
+        self.started = 0
+        self.joined = 0  # Callers that got another caller's result
+
+    def _done(self, key, future):
+        if self.calls.get(key) is future:
+            del self.calls[key]
+        if not future.cancelled():
+            future.exception()  # Callers still waiting get it; mark it retrieved if they all left
+
+    async def run(self, key: Hashable, pool: _BoundedPool, func: Callable, args, kwargs) -> Any:
+        future = self.calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(pool.submit(func, *args, **kwargs))
+            self.calls[key] = future
+            future.add_done_callback(functools.partial(self._done, key))
+            with self.lock:
+                self.started += 1
+        else:
+            with self.lock:
+                self.joined += 1
+        # A caller that goes away (client disconnect) must not cancel the call the others wait for
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"in_flight": len(self.calls), "started": self.started, "joined": self.joined}
+
+
+_io_pool = _BoundedPool("io", IO_POOL_WORKERS, IO_POOL_MAX_PENDING)
+_cpu_pool = _BoundedPool("cpu", CPU_POOL_WORKERS, CPU_POOL_MAX_PENDING)
+_shared_reads = _SingleFlight()
+
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """Runs a blocking storage/file/print call on the I/O pool and returns its result."""
+    return await _io_pool.submit(func, *args, **kwargs)
+
+
+async def run_io_shared(generation: Hashable, func: Callable, *args, **kwargs) -> Any:
+    """
+    Like run_io for a read-only call, but concurrent callers with the same func, arguments and
+    `generation` share one call and its result, which they must not modify. `generation` must
+    change whenever the data the call reads does (see daily_excel_logger.read_generation), so a
+    caller arriving after a write never gets the result of a call started before it.
+    """
+    key = (func, args, tuple(sorted(kwargs.items())), generation)
+    return await _shared_reads.run(key, _io_pool, func, args, kwargs)
+
+
+async def run_cpu(func: Callable, *args, **kwargs) -> Any:
+    """Runs a CPU-heavy call (PDF rendering) on the CPU pool and returns its result."""
+    return await _cpu_pool.submit(func, *args, **kwargs)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Queue depth and counters of each pool, plus the shared (coalesced) reads."""
+    return {"io": _io_pool.stats(), "cpu": _cpu_pool.stats(), "shared": _shared_reads.stats()}
+
+
+def shutdown(wait: bool = True):
+    """Stops both pools. Pending jobs finish first when `wait` is True."""
+    _cpu_pool.executor.shutdown(wait=wait)
+    _io_pool.executor.shutdown(wait=wait)
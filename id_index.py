@@ -0,0 +1,199 @@
+"""
+Persistent ID index for the Excel storage engine.
+
+Maps every pesada (tipo, id) to the sheet date(s) that hold it, so a record
+from any day can be found without parsing the whole workbook, and the
+highest ID per type is a single query at startup. The index lives in a
+small SQLite file next to the workbook (daily_log.xlsx -> daily_log.index.db)
+and is updated on every upsert/delete. Each indexed sheet keeps a
+fingerprint, so resyncing after an outside edit only rescans the sheets
+that changed; `python storage_admin.py reindex` rescans all of them.
+"""
+
+import sqlite3
+import os
+import logging
+from typing import List, Any, Optional, Dict, Iterable, Tuple
+
+import sqlite_util
+
+logger = logging.getLogger("daily_excel_logger.id_index")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entry_dates (
+    tipo TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    fecha TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 1,  -- Sheet rows holding the key (hand-edited sheets may repeat one)
+    PRIMARY KEY (tipo, id, fecha)
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    fecha TEXT PRIMARY KEY,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def index_path(workbook_filename: str) -> str:
+    """Returns the index file used for a workbook (same name, '.index.db' extension)."""
+    return os.path.splitext(workbook_filename)[0] + ".index.db"
+
+
+def _init_schema(conn: sqlite3.Connection, path: str):
+    conn.executescript(_SCHEMA)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(entry_dates)")]
+    if "rows" not in columns:
+        # Index from before row counts: forget the sheet fingerprints so the next sync rescans every sheet
+        conn.execute("ALTER TABLE entry_dates ADD COLUMN rows INTEGER NOT NULL DEFAULT 1")
+        conn.execute("DELETE FROM sheets")
+        _set_meta(conn, "built", "0")
+
+
+_connections = sqlite_util.ConnectionPool("ID index", _init_schema)
+_connect = _connections.connect
+
+
+def add_entry(path: str, entry_type: str, entry_id: int, date_str: str):
+    """Records that date_str holds the pesada (entry_type, entry_id)."""
+    conn = _connect(path)
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO entry_dates (tipo, id, fecha) VALUES (?, ?, ?)",
+            (entry_type, entry_id, date_str),
+        )
+
+
+def remove_entry(path: str, entry_type: str, entry_id: int, date_str: str):
+    """Forgets one row of the pesada (entry_type, entry_id) on date_str; the entry goes with its last row."""
+    conn = _connect(path)
+    key = (entry_type, entry_id, date_str)
+    with conn:
+        conn.execute("UPDATE entry_dates SET rows = rows - 1 WHERE tipo = ? AND id = ? AND fecha = ?", key)
+        conn.execute("DELETE FROM entry_dates WHERE tipo = ? AND id = ? AND fecha = ? AND rows <= 0", key)
+
+
+def find_dates(path: str, entry_type: str, entry_id: int) -> List[str]:
+    """Returns the dates holding (entry_type, entry_id), oldest first."""
+    conn = _connect(path)
+    cursor = conn.execute(
+        "SELECT fecha FROM entry_dates WHERE tipo = ? AND id = ? ORDER BY fecha",
+        (entry_type, entry_id),
+    )
+    return [row[0] for row in cursor]
+
+
+def max_ids(path: str) -> Dict[str, int]:
+    """Returns the highest indexed ID per entry type."""
+    conn = _connect(path)
+    result = {"Compra": 0, "Venta": 0}
+    for tipo, max_id in conn.execute("SELECT tipo, MAX(id) FROM entry_dates GROUP BY tipo"):
+        if tipo in result and isinstance(max_id, int):
+            result[tipo] = max_id
+    return result
+
+
+def date_counts(path: str, entry_types: Iterable[str], start_date: str, end_date: str) -> List[Tuple[str, int]]:
+    """Returns (fecha, sheet rows of entry_types) for the dates in [start_date, end_date], ascending."""
+    conn = _connect(path)
+    types_sql, params = sqlite_util.type_filter(entry_types)
+    cursor = conn.execute(
+        f"SELECT fecha, SUM(rows) FROM entry_dates WHERE {types_sql} AND fecha BETWEEN ? AND ? "
+        f"GROUP BY fecha ORDER BY fecha",
+        params + [start_date, end_date],
+    )
+    return cursor.fetchall()
+
+
+def has_repeated_keys(path: str, entry_types: Iterable[str], start_date: str, end_date: str) -> bool:
+    """True if some sheet in [start_date, end_date] holds a (tipo, id) of entry_types in more than one row."""
+    conn = _connect(path)
+    types_sql, params = sqlite_util.type_filter(entry_types)
+    row = conn.execute(
+        f"SELECT 1 FROM entry_dates WHERE {types_sql} AND fecha BETWEEN ? AND ? AND rows > 1 LIMIT 1",
+        params + [start_date, end_date],
+    ).fetchone()
+    return row is not None
+
+
+def page_by_id(path: str, entry_types: Iterable[str], start_date: str, end_date: str,
+               descending: bool = False, offset: int = 0, limit: int = -1) -> List[Tuple[str, str, int]]:
+    """
+    Returns one page of (fecha, tipo, id) in [start_date, end_date], ordered by ID (then date).
+    A key repeated within a sheet is listed once (see has_repeated_keys).
+    """
+    conn = _connect(path)
+    types_sql, params = sqlite_util.type_filter(entry_types)
+    direction = "DESC" if descending else "ASC"
+    cursor = conn.execute(
+        f"SELECT fecha, tipo, id FROM entry_dates WHERE {types_sql} AND fecha BETWEEN ? AND ? "
+        f"ORDER BY id {direction}, fecha {direction} LIMIT ? OFFSET ?",
+        params + [start_date, end_date, limit, offset],
+    )
+    return cursor.fetchall()
+
+
+def sheet_fingerprints(path: str) -> Dict[str, Optional[str]]:
+    """Returns the fingerprint recorded for each indexed sheet when it was last scanned."""
+    conn = _connect(path)
+    return {fecha: fingerprint for fecha, fingerprint in conn.execute("SELECT fecha, fingerprint FROM sheets")}
+
+
+def replace_sheet(path: str, date_str: str, fingerprint: Optional[str], rows: Iterable[List[Any]]) -> int:
+    """Replaces the entries of one sheet with its HEADERS-ordered rows. Returns the entry count."""
+    conn = _connect(path)
+    count = 0
+    with conn:
+        conn.execute("DELETE FROM entry_dates WHERE fecha = ?", (date_str,))
+        for row in rows:
+            try:
+                entry_id = int(row[0])
+            except (ValueError, TypeError):
+                continue
+            conn.execute(
+                "INSERT INTO entry_dates (tipo, id, fecha) VALUES (?, ?, ?) "
+                "ON CONFLICT (tipo, id, fecha) DO UPDATE SET rows = rows + 1",
+                (row[1], entry_id, date_str),
+            )
+            count += 1
+        conn.execute("INSERT OR REPLACE INTO sheets (fecha, fingerprint) VALUES (?, ?)", (date_str, fingerprint))
+    return count
+
+
+def finish_sync(path: str, present_dates: Iterable[str], source_sig: Optional[str]):
+    """Drops sheets that no longer exist and records the workbook signature the index now matches."""
+    conn = _connect(path)
+    present = set(present_dates)
+    with conn:
+        for (fecha,) in conn.execute("SELECT DISTINCT fecha FROM entry_dates").fetchall():
+            if fecha not in present:
+                conn.execute("DELETE FROM entry_dates WHERE fecha = ?", (fecha,))
+        for (fecha,) in conn.execute("SELECT fecha FROM sheets").fetchall():
+            if fecha not in present:
+                conn.execute("DELETE FROM sheets WHERE fecha = ?", (fecha,))
+        _set_meta(conn, "built", "1")
+        _set_meta(conn, "source_sig", source_sig)
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: Optional[str]):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def get_meta(path: str, key: str) -> Optional[str]:
+    conn = _connect(path)
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_meta(path: str, key: str, value: Optional[str]):
+    conn = _connect(path)
+    with conn:
+        _set_meta(conn, key, value)
+
+
+def close(path: Optional[str] = None):
+    """Closes this thread's connection(s). Mainly useful for tools and shutdown."""
+    _connections.close(path)
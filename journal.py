@@ -0,0 +1,124 @@
+"""
+Append-only write-ahead journal for the Excel storage engine.
+
+Every upsert/delete is written here as one JSON line, and the file is
+fsync'd before the change is acknowledged. The workbook itself is saved
+later (write-behind); once a save succeeds the journal is truncated. If
+the process dies, or saves keep failing because the file is open in
+Excel, the journal is replayed into the workbook on the next load.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("daily_excel_logger.journal")
+
+
+def journal_path(workbook_filename: str) -> str:
+    """Returns the journal used for a workbook (same name, '.journal.jsonl' extension)."""
+    return os.path.splitext(workbook_filename)[0] + ".journal.jsonl"
+
+
+class Journal:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fh = None
+        self.unsynced = 0
+        self.appended = 0  # Records appended by this process; append() returns their number
+        self.synced_upto = 0  # Records numbered up to this one are on disk
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Writes one record and returns its number. It is durable only after the next sync()."""
+        line = json.dumps({"ts": datetime.now().isoformat(timespec="seconds"), **record}, ensure_ascii=False)
+        with self.lock:
+            if self.fh is None:
+                self.fh = open(self.path, "a", encoding="utf-8")
+            self.fh.write(line + "\n")
+            self.unsynced += 1
+            self.appended += 1
+            return self.appended
+
+    def sync(self):
+        """Flushes and fsyncs the records appended since the last sync."""
+        with self.lock:
+            if self.fh is None or not self.unsynced:
+                return
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+            self.unsynced = 0
+            self.synced_upto = self.appended
+
+    def is_synced(self, number: int) -> bool:
+        """True once the record `number` (as returned by append) is on disk, in the journal or in a saved workbook."""
+        with self.lock:
+            return number <= self.synced_upto
+
+    def read(self) -> List[Dict[str, Any]]:
+        """Returns every complete record, oldest first. A torn last line (crash mid-write) is skipped."""
+        records = []
+        with self.lock:
+            if self.fh is not None:
+                self.fh.flush()
+            if not os.path.exists(self.path):
+                return records
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping unreadable journal line {line_no} in {self.path}")
+        return records
+
+    def mark(self) -> int:
+        """Returns the current end of the journal, to truncate up to once a snapshot taken now is saved."""
+        with self.lock:
+            if self.fh is not None:
+                self.fh.flush()
+                return os.fstat(self.fh.fileno()).st_size
+            return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def truncate(self, upto: Optional[int] = None):
+        """
+        Drops the records saved into the workbook: all of them, or those before the `upto` mark.
+        Records appended after the mark are kept, rewritten through an atomically renamed copy.
+        """
+        with self.lock:
+            if self.fh is None:
+                if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                    return
+                self.fh = open(self.path, "a", encoding="utf-8")
+            self.fh.flush()
+            if upto is None or upto >= os.fstat(self.fh.fileno()).st_size:
+                self.fh.truncate(0)
+                self.fh.flush()
+                os.fsync(self.fh.fileno())
+                self.unsynced = 0
+                self.synced_upto = self.appended  # Dropped records are in the saved workbook
+                return
+            with open(self.path, "rb") as f:
+                f.seek(upto)
+                tail = f.read()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            self.fh.close()
+            self.fh = None
+            os.replace(tmp_path, self.path)
+            self.unsynced = 0
+            self.synced_upto = self.appended
+
+    def close(self):
+        with self.lock:
+            if self.fh is not None:
+                self.fh.close()
+                self.fh = None
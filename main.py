@@ -3,9 +3,12 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from fastapi.responses import FileResponse, JSONResponse
-from typing import Optional, List, Dict, Any
+from fastapi.encoders import jsonable_encoder
+from typing import Optional, List, Dict, Any, Tuple
 from pydantic import BaseModel, Field
 from datetime import datetime, timedelta, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from contextlib import asynccontextmanager
 import pytz
 from starlette.requests import Request
 from starlette.responses import Response
@@ -13,6 +16,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from models import UserInDB, TokenData # Import UserInDB
 # from passlib.context import CryptContext # Import CryptContext
 import json 
+import math
 import os
 import asyncio
 import tempfile
@@ -20,6 +24,10 @@ import re
 import subprocess
 from pdf_generator import crear_pdf_recibo, generar_planilla
 import daily_excel_logger # Import the new logger module
+import executors
+import response_cache
+import storage_writer # Single writer task: all API mutations of the store go through its queue
+from executors import run_io, run_cpu # Blocking storage/print (io) and PDF (cpu) work off the event loop
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -180,7 +188,20 @@ class VentaUpdate(BasePesada):
     incoterm: Optional[str] = None
     remito: Optional[int] = None
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Al arrancar, inicia la tarea única que aplica las escrituras al almacenamiento. Al apagar,
+    aplica las escrituras encoladas y escribe a disco los cambios pendientes; la espera corre
+    en un hilo aparte para no bloquear el event loop.
+    """
+    await storage_writer.writer.start()
+    yield
+    await storage_writer.writer.stop()
+    await asyncio.to_thread(executors.shutdown, True)
+    await asyncio.to_thread(daily_excel_logger.flush)
+
+app = FastAPI(lifespan=lifespan)
 
 # --- Google Drive Configuration ---
 # Configuración de Google Drive (se activa con variable de entorno)
@@ -215,6 +236,32 @@ app.add_middleware(
 # Add the middleware to the app
 app.add_middleware(RateLimitingMiddleware)
 
+
+class DataVersionMiddleware(BaseHTTPMiddleware):
+    """
+    Agrega a las respuestas 200 el ETag/Last-Modified que calculó conditional_get y guarda
+    en response_cache las de las rutas cacheables.
+    """
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        headers = getattr(request.state, "conditional_headers", None)
+        if not headers or response.status_code != 200:
+            return response
+        pending = getattr(request.state, "response_cache_entry", None)
+        length = response.headers.get("content-length")
+        # Solo se leen a memoria los cuerpos de largo conocido que entran en la caché; los
+        # streams (sin Content-Length) y los muy grandes pasan sin tocarse
+        if pending is not None and length is not None and response_cache.cache.fits(int(length)):
+            key, version, includes_today = pending
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            stored = {name: value for name, value in response.headers.items() if name.lower() != "content-length"}
+            response_cache.cache.put(key, version, response.status_code, stored, body, includes_today)
+            response = Response(content=body, status_code=response.status_code, headers=stored)
+        response.headers.update(headers)
+        return response
+
+app.add_middleware(DataVersionMiddleware)
+
 # --- In-memory Storage (DEPRECATED - Data will be read from Excel on demand) ---
 # compra_counter = 0 
 # venta_counter = 0
@@ -335,6 +382,80 @@ def has_role(required_roles: List[str]):
     return role_checker
 
 
+# --- GET condicionales (ETag / Last-Modified) ---
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def conditional_get(scope: str = "store", cache: bool = False):
+    """
+    Dependencia de los GET de lectura (declararla después de has_role): calcula el ETag de la
+    versión de los datos que lee el endpoint y responde 304 sin leer nada si coincide con
+    If-None-Match (o, sin If-None-Match, si no hubo cambios desde If-Modified-Since).
+
+    - scope: 'date' (parámetro `date`, por defecto hoy), 'range' (start_date y end_date;
+      sin ambos, hoy), 'window' (los `days` días, por defecto 5, que terminan en end_date,
+      por defecto hoy) o 'store' (todo el historial)
+    - cache: devuelve la respuesta guardada en response_cache si se armó con la misma versión
+      (el endpoint la devuelve tal cual, sin leer nada); si no, devuelve None y la respuesta
+      del endpoint se guarda para la próxima. Sin cache devuelve siempre None.
+    """
+    async def check(request: Request) -> Optional[Response]:
+        now = datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        params = request.query_params
+        if scope == "date":
+            first = last = params.get("date") or today
+        elif scope == "range":
+            first, last = (params["start_date"], params["end_date"]) if params.get("start_date") and params.get("end_date") else (today, today)
+        elif scope == "window":
+            first, last = _window_bounds(params.get("end_date"), params.get("days"), now.date())
+        else:
+            first = last = None
+        version, modified = await run_io(daily_excel_logger.data_version, first, last)
+        # Sin fechas explícitas "hoy" cambia la respuesta a medianoche: cuenta como un cambio
+        etag = f'"{version}-{today}"'
+        modified = max(modified, now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+        # Last-Modified va en segundos enteros: se redondea hacia arriba solo si ese segundo ya pasó,
+        # así ningún cambio posterior puede quedar dentro de él
+        stamp = math.ceil(modified)
+        headers = {"ETag": etag, "Last-Modified": formatdate(stamp if stamp <= now.timestamp() else modified, usegmt=True),
+                   "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            if _etag_matches(if_none_match, etag):
+                raise HTTPException(status_code=304, headers=headers)
+        elif request.headers.get("if-modified-since"):
+            try:
+                since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+            except (TypeError, ValueError):
+                since = None
+            if since is not None and modified <= since:
+                raise HTTPException(status_code=304, headers=headers)
+        request.state.conditional_headers = headers
+        if cache and response_cache.RESPONSE_CACHE_ENABLED:
+            key = (request.url.path, first, last, tuple(sorted(params.multi_items())))
+            entry = response_cache.cache.get(key, etag)
+            if entry is not None:
+                return Response(content=entry.body, status_code=entry.status_code, headers=entry.headers)
+            request.state.response_cache_entry = (key, etag, last is None or last >= today)
+        return None
+    return check
+
+
+def _window_bounds(end_date: Optional[str], days: Optional[str], today) -> Tuple[str, str]:
+    """Primera y última fecha (YYYY-MM-DD) de los `days` días que terminan en end_date; valores inválidos usan hoy y 5."""
+    try:
+        anchor = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else today
+    except ValueError:
+        anchor = today
+    try:
+        count = max(int(days), 1) if days else 5
+    except ValueError:
+        count = 5
+    return (anchor - timedelta(days=count - 1)).strftime("%Y-%m-%d"), anchor.strftime("%Y-%m-%d")
+
+
 # --- Global Counter Management ---
 COUNTERS_FILE = "counters.json"
 
@@ -391,39 +512,30 @@ counters = load_counters()
 compra_counter = counters["compra_counter"]
 venta_counter = counters["venta_counter"]
 
-# Verificar IDs máximos en el Excel para asegurar que no haya conflictos
+# Reaplicar cambios del journal que no llegaron a guardarse en el Excel (caída del proceso, archivo abierto)
 try:
-    import openpyxl
-    if os.path.exists("daily_log.xlsx"):
-        wb = openpyxl.load_workbook("daily_log.xlsx", read_only=True)
-        max_compra_id = compra_counter
-        max_venta_id = venta_counter
-        
-        # Escanear todas las hojas para encontrar el ID máximo
-        for sheet_name in wb.sheetnames:
-            if sheet_name.startswith("20"):  # Hojas de fechas
-                ws = wb[sheet_name]
-                for row in ws.iter_rows(min_row=2, values_only=True):
-                    if row[0] and row[1]:  # ID y Tipo
-                        entry_id = int(row[0])
-                        entry_type = row[1]
-                        if entry_type == "Compra" and entry_id > max_compra_id:
-                            max_compra_id = entry_id
-                        elif entry_type == "Venta" and entry_id > max_venta_id:
-                            max_venta_id = entry_id
-        
-        wb.close()
-        
-        # Actualizar contadores si encontramos IDs mayores
-        if max_compra_id > compra_counter or max_venta_id > venta_counter:
-            compra_counter = max_compra_id
-            venta_counter = max_venta_id
-            save_counters(compra_counter, venta_counter)
-            print(f"Contadores actualizados desde Excel: Compra={compra_counter}, Venta={venta_counter}")
-        else:
-            print(f"Contadores globales cargados: Compra={compra_counter}, Venta={venta_counter}")
+    replayed = daily_excel_logger.recover()
+    if replayed:
+        print(f"Recuperados {replayed} cambios pendientes desde el journal")
+except Exception as e:
+    print(f"Error recuperando el journal de escrituras: {e}")
+
+# Verificar IDs máximos en el almacenamiento para asegurar que no haya conflictos
+try:
+    stored_max_ids = daily_excel_logger.get_max_ids()
+    max_compra_id = max(compra_counter, stored_max_ids.get("Compra", 0))
+    max_venta_id = max(venta_counter, stored_max_ids.get("Venta", 0))
+
+    # Actualizar contadores si encontramos IDs mayores
+    if max_compra_id > compra_counter or max_venta_id > venta_counter:
+        compra_counter = max_compra_id
+        venta_counter = max_venta_id
+        save_counters(compra_counter, venta_counter)
+        print(f"Contadores actualizados desde el almacenamiento: Compra={compra_counter}, Venta={venta_counter}")
+    else:
+        print(f"Contadores globales cargados: Compra={compra_counter}, Venta={venta_counter}")
 except Exception as e:
-    print(f"Error escaneando IDs del Excel: {e}")
+    print(f"Error escaneando IDs del almacenamiento: {e}")
     print(f"Usando contadores del archivo: Compra={compra_counter}, Venta={venta_counter}")
 
 try:
@@ -551,33 +663,11 @@ def get_daily_backup_folder_for_today() -> str:
 
 def find_entry_by_id(entry_id: int, entry_type: str):
     """
-    Busca un registro por ID en todas las hojas del Excel.
+    Busca un registro por ID en todas las fechas almacenadas (índice persistente de IDs).
     Retorna una tupla (entry_dict, date_str) o (None, None) si no se encuentra.
     """
     try:
-        import openpyxl
-        if not os.path.exists("daily_log.xlsx"):
-            return None, None
-        
-        wb = openpyxl.load_workbook("daily_log.xlsx", read_only=True)
-        
-        # Buscar en todas las hojas de fechas
-        for sheet_name in wb.sheetnames:
-            if sheet_name.startswith("20"):  # Hojas con formato YYYY-MM-DD
-                try:
-                    entries = daily_excel_logger.load_data_by_date(sheet_name)
-                    entries_of_type = entries.get(entry_type, [])
-                    
-                    for entry in entries_of_type:
-                        if int(entry.get("id", -1)) == int(entry_id):
-                            wb.close()
-                            return entry, sheet_name
-                except Exception as e:
-                    print(f"Error buscando en hoja {sheet_name}: {e}")
-                    continue
-        
-        wb.close()
-        return None, None
+        return daily_excel_logger.find_entry_by_id(entry_id, entry_type)
     except Exception as e:
         print(f"Error buscando entry ID {entry_id} tipo {entry_type}: {e}")
         return None, None
@@ -759,6 +849,13 @@ def _format_save_error(e: Exception) -> str:
         pass
     return f"Error al guardar en Excel: {e}"
 
+def _verify_receipt(receipt, entry_id: int, entry_type: str, action: str):
+    """Checks that the commit receipt of an upsert points at a row holding entry_id/entry_type and that the write is committed."""
+    if receipt is None or not receipt.confirms(entry_id, entry_type):
+        logger_msg = f"Post-{action} verification failed: {entry_type} {entry_id} not committed to today's sheet."
+        print(logger_msg)
+        raise HTTPException(status_code=500, detail=logger_msg)
+
 # --- WebSocket Logic ---
 async def notify_clients(data_type: str):
     """Send updates of a specific type to all connected clients."""
@@ -824,6 +921,16 @@ async def get_system_config():
         "server_type": "local" if os_type == "windows" else "remote"
     }
 
+@app.get("/api/system/executors")
+async def get_executor_stats(current_user: UserInDB = Depends(has_role(["admin", "lect"]))):
+    """Returns queue depth and counters of the io/cpu worker pools and the storage writer."""
+    return {**executors.stats(), "writer": storage_writer.writer.stats()}
+
+@app.get("/api/system/cache")
+async def get_response_cache_stats(current_user: UserInDB = Depends(has_role(["admin", "lect"]))):
+    """Returns size and hit/miss counters of the response cache."""
+    return response_cache.cache.stats()
+
 # --- Product Catalog Endpoints ---
 @app.get("/api/productos/compras", response_model=List[str])
 async def get_productos_compras(current_user: UserInDB = Depends(has_role(["admin", "lect"]))):
@@ -836,11 +943,81 @@ async def get_productos_ventas(current_user: UserInDB = Depends(has_role(["admin
     return PRODUCTOS_VENTA
 
 
+# --- Lecturas compartidas ---
+async def _read_shared(func, *args):
+    """
+    run_io para lecturas: las consultas idénticas que llegan juntas (p. ej. todos los tableros
+    refrescando tras un aviso por WebSocket) comparten una sola lectura y su resultado, que no
+    se debe modificar. Una lectura iniciada antes de un guardado no se comparte con las posteriores.
+    """
+    return await executors.run_io_shared(daily_excel_logger.read_generation(), func, *args)
+
+
+# --- Paginación, orden y selección de campos de los listados ---
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+
+def _parse_sort(sort: Optional[str]) -> Tuple[Optional[str], bool]:
+    """'neto' -> ('neto', False), '-neto' -> ('neto', True). 'hora' equivale a 'fecha'."""
+    if not sort:
+        return None, False
+    descending = sort.startswith("-")
+    key = sort.lstrip("+-").strip().lower()
+    key = "fecha" if key == "hora" else key
+    if key not in daily_excel_logger.PAGE_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort debe ser uno de: {', '.join(daily_excel_logger.PAGE_SORTS)} (con '-' delante para orden descendente)")
+    return key, descending
+
+def _parse_fields(fields: Optional[str], allowed) -> Optional[List[str]]:
+    """'id,neto' -> ['id', 'neto']; valida contra los campos del modelo."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(unknown)}")
+    return names
+
+def _validate_page(offset: int, limit: Optional[int]):
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset no puede ser negativo")
+    if limit is not None and not 1 <= limit <= PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit debe estar entre 1 y {PAGE_MAX_LIMIT}")
+
+def _page_response(entries: List[Dict[str, Any]], total: int, offset: int, limit: Optional[int], fields: Optional[List[str]]) -> JSONResponse:
+    """Lista (proyectada a `fields`) con el total en X-Total-Count y el offset de la página siguiente en X-Next-Offset."""
+    if fields:
+        entries = [{name: entry.get(name) for name in fields} for entry in entries]
+    headers = {"X-Total-Count": str(total)}
+    if limit is not None and offset + limit < total:
+        headers["X-Next-Offset"] = str(offset + limit)
+    return JSONResponse(content=jsonable_encoder(entries), headers=headers)
+
+def _is_paged(*params) -> bool:
+    return any(param is not None for param in params)
+
+
 # --- Compras Endpoints ---
 @app.get("/filter_section_dato")
-async def filter_section_dato(section: str, search: str = "", start_date: str = None, end_date: str = None, current_user: UserInDB = Depends(has_role(["admin", "lect"]))):
+async def filter_section_dato(
+    section: str,
+    search: str = "",
+    start_date: str = None,
+    end_date: str = None,
+    offset: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+    _conditional: None = Depends(conditional_get(scope="range"))
+):
     """
     Filtra compras o ventas por rango de fechas (YYYY-MM-DD) y término de búsqueda.
+
+    Opcionales (sin ellos la respuesta es la lista completa, como siempre):
+    - offset, limit: página de resultados; el total va en X-Total-Count y el offset
+      de la página siguiente en X-Next-Offset
+    - sort: id | fecha (fecha y hora de ingreso) | neto | contraparte; '-neto' invierte el orden
+    - fields: campos a devolver, p. ej. fields=id,fecha,neto
     """
     import daily_excel_logger
     from datetime import datetime
@@ -854,53 +1031,88 @@ async def filter_section_dato(section: str, search: str = "", start_date: str =
         end_dt = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
     except Exception:
         return JSONResponse(content={"error": "Formato de fecha inválido"}, status_code=400)
-    resultados = []
-    # Recorrer días en rango
+    # Recorrer las hojas del rango (si no hay rango, usar hoy)
     if start_dt and end_dt:
-        delta = (end_dt - start_dt).days
-        for i in range(delta + 1):
-            fecha_actual = (start_dt + timedelta(days=i)).strftime("%Y-%m-%d")
-            datos = daily_excel_logger.load_data_by_date(fecha_actual)
-            items = datos.get(tipo, [])
-            if search:
-                items = [e for e in items if search.lower() in json.dumps(e, ensure_ascii=False).lower()]
-            resultados.extend(items)
+        desde, hasta = start_dt.strftime("%Y-%m-%d"), end_dt.strftime("%Y-%m-%d")
     else:
-        # Si no hay rango, usar hoy
-        fecha_actual = datetime.now().strftime("%Y-%m-%d")
-        datos = daily_excel_logger.load_data_by_date(fecha_actual)
-        items = datos.get(tipo, [])
-        if search:
-            items = [e for e in items if search.lower() in json.dumps(e, ensure_ascii=False).lower()]
-        resultados.extend(items)
+        desde = hasta = datetime.now().strftime("%Y-%m-%d")
+    if _is_paged(offset, limit, sort, fields):
+        sort_key, descending = _parse_sort(sort)
+        model = Compra if tipo == "Compra" else Venta
+        field_names = _parse_fields(fields, model.__fields__)
+        _validate_page(offset or 0, limit)
+        predicate = _search_predicate(search) if search else None
+        page, total = await run_io(
+            daily_excel_logger.load_page, desde, hasta, tipo, sort_key, descending, offset or 0, limit, predicate
+        )
+        return _page_response([e for _, _, e in page], total, offset or 0, limit, field_names)
+    resultados = await _read_shared(_filter_range, desde, hasta, tipo, search)
     return JSONResponse(content=resultados)
+
+
+# Campos en los que busca `search` en /compras y /ventas
+COMPRA_SEARCH_KEYS = ("proveedor", "mercaderia", "chofer", "patente")
+VENTA_SEARCH_KEYS = ("cliente", "mercaderia", "transporte", "patente")
+
+def _matches_search(entry: Dict[str, Any], term: str, keys) -> bool:
+    """True si `term` (en minúsculas) aparece en alguno de los campos `keys` de la entrada."""
+    return any(term in str(entry.get(key, "")).lower() for key in keys)
+
+def _search_predicate(search: str):
+    """Coincidencia de `search` en cualquier campo de la entrada (sin distinguir mayúsculas)."""
+    search = search.lower()
+    return lambda e: search in json.dumps(e, ensure_ascii=False).lower()
+
+def _filter_range(start: str, end: str, tipo: str, search: str) -> List[Dict[str, Any]]:
+    """Entradas de `tipo` entre start y end (YYYY-MM-DD) que contienen `search`."""
+    matches = _search_predicate(search) if search else None
+    return [
+        e for _, _, e in daily_excel_logger.load_range(start, end, tipo)
+        if matches is None or matches(e)
+    ]
 @app.get("/compras", response_model=List[Compra])
 async def read_compras_entries(
     search: Optional[str] = None,
     date: Optional[str] = None,
-    current_user: UserInDB = Depends(has_role(["admin", "lect"]))
+    offset: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+    cached: Optional[Response] = Depends(conditional_get(scope="date", cache=True))
 ):
     """
     Retrieve compra entries from a specific date sheet in Excel,
     with optional filtering.
+    offset/limit/sort/fields page, order and project the result (see filter_section_dato).
     """
+    if cached is not None:
+        return cached
     # If no date is provided, default to today's date in YYYY-MM-DD format
     target_date_str = date if date else datetime.now().strftime("%Y-%m-%d")
 
+    if _is_paged(offset, limit, sort, fields):
+        sort_key, descending = _parse_sort(sort)
+        field_names = _parse_fields(fields, Compra.__fields__)
+        _validate_page(offset or 0, limit)
+        predicate = None
+        if search:
+            search_term = search.lower()
+            predicate = lambda entry: _matches_search(entry, search_term, COMPRA_SEARCH_KEYS)
+        page, total = await run_io(
+            daily_excel_logger.load_page, target_date_str, target_date_str, "Compra",
+            sort_key, descending, offset or 0, limit, predicate
+        )
+        return _page_response([entry for _, _, entry in page], total, offset or 0, limit, field_names)
+
     # Load data from the specific sheet
-    all_data_for_date = daily_excel_logger.load_data_by_date(target_date_str)
+    all_data_for_date = await _read_shared(daily_excel_logger.load_data_by_date, target_date_str)
     filtered_entries = all_data_for_date.get("Compra", [])
 
     # Filter by search term on the loaded data
     if search:
         search_term = search.lower()
-        filtered_entries = [
-            entry for entry in filtered_entries
-            if search_term in str(entry.get("proveedor", "")).lower() or \
-               search_term in str(entry.get("mercaderia", "")).lower() or \
-               search_term in str(entry.get("chofer", "")).lower() or \
-               search_term in str(entry.get("patente", "")).lower()
-        ]
+        filtered_entries = [entry for entry in filtered_entries if _matches_search(entry, search_term, COMPRA_SEARCH_KEYS)]
         
     return filtered_entries
 
@@ -967,14 +1179,9 @@ async def create_compra_entry(compra_data: Compra, current_user: UserInDB = Depe
         # Convert None to empty string for Excel compatibility
         data_row_cleaned = ["" if v is None else v for v in data_row]
         # Use the integer ID and type for upserting
-        daily_excel_logger.upsert_data(entry_id=new_id, entry_type="Compra", data_row=data_row_cleaned)
-        # Verify write by reloading today's data and checking the ID exists
-        reloaded = daily_excel_logger.load_daily_data()
-        todays_compras = {entry["id"]: entry for entry in reloaded.get("Compra", []) if entry.get("id") is not None}
-        if new_id not in todays_compras:
-            logger_msg = f"Post-upsert verification failed: Compra {new_id} not found in today's sheet."
-            print(logger_msg)
-            raise HTTPException(status_code=500, detail=logger_msg)
+        receipt = await storage_writer.writer.upsert(new_id, "Compra", data_row_cleaned)
+        # Verify write against the commit receipt (written row and journal fsync)
+        _verify_receipt(receipt, new_id, "Compra", "upsert")
     except Exception as e:
         # Log the error and raise an HTTPException with clearer message
         print(f"Error upserting Compra {new_id} to Excel: {e}")
@@ -992,7 +1199,7 @@ async def update_compra_entry(compra_id: int, compra_data: CompraUpdate, current
     if compra_id not in compras_entries:
         # Fallback: intentar cargar la compra del día actual desde Excel
         try:
-            todays = daily_excel_logger.load_daily_data().get("Compra", [])
+            todays = (await run_io(daily_excel_logger.load_daily_data)).get("Compra", [])
             found = next((e for e in todays if int(e.get("id") or -1) == int(compra_id)), None)
             if found:
                 compras_entries[compra_id] = found
@@ -1069,24 +1276,13 @@ async def update_compra_entry(compra_id: int, compra_data: CompraUpdate, current
             merged_data.get("observaciones", "")
         ]
         data_row_cleaned = ["" if v is None else v for v in data_row]
-        daily_excel_logger.upsert_data(entry_id=compra_id, entry_type="Compra", data_row=data_row_cleaned)
+        receipt = await storage_writer.writer.upsert(compra_id, "Compra", data_row_cleaned)
     except Exception as e:
         print(f"Error upserting Compra {compra_id} to Excel: {e}")
         raise HTTPException(status_code=500, detail=_format_save_error(e))
 
-    # Verify write by reloading today's data and checking the ID exists (post-update read-back)
-    try:
-        reloaded = daily_excel_logger.load_daily_data()
-        todays_compras = {entry["id"]: entry for entry in reloaded.get("Compra", []) if entry.get("id") is not None}
-        if compra_id not in todays_compras:
-            logger_msg = f"Post-update verification failed: Compra {compra_id} not found in today's sheet."
-            print(logger_msg)
-            raise HTTPException(status_code=500, detail=logger_msg)
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error verifying updated Compra {compra_id}: {e}")
-        raise HTTPException(status_code=500, detail=_format_save_error(e))
+    # Verify write against the commit receipt (written row and journal fsync)
+    _verify_receipt(receipt, compra_id, "Compra", "update")
 
     await notify_clients("compra")
     return compras_entries[compra_id]
@@ -1100,7 +1296,7 @@ async def delete_compra_entry(compra_id: int, current_user: UserInDB = Depends(h
         raise HTTPException(status_code=404, detail="Compra no encontrada")
     try:
         # Use integer ID and type for deletion
-        daily_excel_logger.delete_data(entry_id=compra_id, entry_type="Compra")
+        await storage_writer.writer.delete(compra_id, "Compra")
     except Exception as e:
         # Log the error and raise an HTTPException
         print(f"Error deleting Compra {compra_id} from Excel: {e}")
@@ -1126,7 +1322,7 @@ async def imprimir_compra_pdf(compra_id: int, copies: int = 2, date: Optional[st
         # Si se proporcionó una fecha, buscar en esa fecha específica
         if date:
             try:
-                entries = daily_excel_logger.load_data_by_date(date)
+                entries = await run_io(daily_excel_logger.load_data_by_date, date)
                 compras_for_date = entries.get("Compra", [])
                 found = next((e for e in compras_for_date if int(e.get("id")) == int(compra_id)), None)
                 if found:
@@ -1137,7 +1333,7 @@ async def imprimir_compra_pdf(compra_id: int, copies: int = 2, date: Optional[st
         
         # Si no se encontró con fecha específica o no se proporcionó fecha, buscar en todas las fechas
         if datos is None:
-            entry, entry_date = find_entry_by_id(compra_id, "Compra")
+            entry, entry_date = await run_io(find_entry_by_id, compra_id, "Compra")
             if entry:
                 datos = [entry]
                 should_upsert = False
@@ -1169,7 +1365,7 @@ async def imprimir_compra_pdf(compra_id: int, copies: int = 2, date: Optional[st
                 entry_dict.get("observaciones", "")
             ]
             data_row_cleaned = ["" if v is None else v for v in data_row]
-            daily_excel_logger.upsert_data(entry_id=compra_id, entry_type="Compra", data_row=data_row_cleaned)
+            await storage_writer.writer.upsert(compra_id, "Compra", data_row_cleaned)
         except Exception as e:
             print(f"Error saving Compra {compra_id} before printing: {e}")
             raise HTTPException(status_code=500, detail=_format_save_error(e))
@@ -1182,14 +1378,14 @@ async def imprimir_compra_pdf(compra_id: int, copies: int = 2, date: Optional[st
         # Generate PDF in pesadas folder
         filename = os.path.join(pesadas_dir, f"ticket_compra_{compra_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
         print(f"DEBUG: Generando PDF con {copies} copias para Compra {compra_id}")
-        crear_pdf_recibo(datos, filename, tipo_recibo="Compra", copies=copies)
+        await run_cpu(crear_pdf_recibo, datos, filename, tipo_recibo="Compra", copies=copies)
         print(f"DEBUG: PDF generado exitosamente: {filename}")
         
         # On Windows, try to print directly
         if platform.system() == "Windows":
             print(f"DEBUG: Intentando imprimir archivo: {filename} con {copies} copias")
             try:
-                _try_print_file_windows(filename, copies=copies)
+                await run_io(_try_print_file_windows, filename, copies=copies)
                 print(f"DEBUG: Archivo enviado a impresora con {copies} copias")
                 return JSONResponse(content={"status": "success", "message": "Ticket guardado en Pesadas e impreso"})
             except Exception as print_error:
@@ -1229,7 +1425,7 @@ async def guardar_compra_pdf(compra_id: int, date: Optional[str] = None, current
         # Si se proporcionó una fecha, buscar en esa fecha específica
         if date:
             try:
-                entries = daily_excel_logger.load_data_by_date(date)
+                entries = await run_io(daily_excel_logger.load_data_by_date, date)
                 compras_for_date = entries.get("Compra", [])
                 found = next((e for e in compras_for_date if int(e.get("id")) == int(compra_id)), None)
                 if found:
@@ -1241,7 +1437,7 @@ async def guardar_compra_pdf(compra_id: int, date: Optional[str] = None, current
         
         # Si no se encontró con fecha específica o no se proporcionó fecha, buscar en todas las fechas
         if datos is None:
-            entry, entry_date = find_entry_by_id(compra_id, "Compra")
+            entry, entry_date = await run_io(find_entry_by_id, compra_id, "Compra")
             if entry:
                 datos = [entry]
                 found_date = entry_date
@@ -1274,7 +1470,7 @@ async def guardar_compra_pdf(compra_id: int, date: Optional[str] = None, current
                 entry_dict.get("observaciones", "")
             ]
             data_row_cleaned = ["" if v is None else v for v in data_row]
-            daily_excel_logger.upsert_data(entry_id=compra_id, entry_type="Compra", data_row=data_row_cleaned)
+            await storage_writer.writer.upsert(compra_id, "Compra", data_row_cleaned)
         except Exception as e:
             print(f"Error saving Compra {compra_id} before generating PDF: {e}")
             raise HTTPException(status_code=500, detail=_format_save_error(e))
@@ -1288,7 +1484,7 @@ async def guardar_compra_pdf(compra_id: int, date: Optional[str] = None, current
     filename = os.path.join(save_dir, f"compra_{compra_id}.pdf")
 
     try:
-        crear_pdf_recibo(datos, filename, tipo_recibo="Compra")
+        await run_cpu(crear_pdf_recibo, datos, filename, tipo_recibo="Compra")
         
         # **NUEVO: Subir a Google Drive si está habilitado (sin bloquear)**
         if ENABLE_GOOGLE_DRIVE and google_drive_helper and google_drive_helper.gdrive_manager:
@@ -1316,29 +1512,45 @@ async def guardar_compra_pdf(compra_id: int, date: Optional[str] = None, current
 async def read_ventas_entries(
     search: Optional[str] = None,
     date: Optional[str] = None,
-    current_user: UserInDB = Depends(has_role(["admin", "lect"]))
+    offset: Optional[int] = None,
+    limit: Optional[int] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+    cached: Optional[Response] = Depends(conditional_get(scope="date", cache=True))
 ):
     """
     Retrieve venta entries from a specific date sheet in Excel,
     with optional filtering.
+    offset/limit/sort/fields page, order and project the result (see filter_section_dato).
     """
+    if cached is not None:
+        return cached
     # If no date is provided, default to today's date in YYYY-MM-DD format
     target_date_str = date if date else datetime.now().strftime("%Y-%m-%d")
 
+    if _is_paged(offset, limit, sort, fields):
+        sort_key, descending = _parse_sort(sort)
+        field_names = _parse_fields(fields, Venta.__fields__)
+        _validate_page(offset or 0, limit)
+        predicate = None
+        if search:
+            search_term = search.lower()
+            predicate = lambda entry: _matches_search(entry, search_term, VENTA_SEARCH_KEYS)
+        page, total = await run_io(
+            daily_excel_logger.load_page, target_date_str, target_date_str, "Venta",
+            sort_key, descending, offset or 0, limit, predicate
+        )
+        return _page_response([entry for _, _, entry in page], total, offset or 0, limit, field_names)
+
     # Load data from the specific sheet
-    all_data_for_date = daily_excel_logger.load_data_by_date(target_date_str)
+    all_data_for_date = await _read_shared(daily_excel_logger.load_data_by_date, target_date_str)
     filtered_entries = all_data_for_date.get("Venta", [])
 
     # Filter by search term on the loaded data
     if search:
         search_term = search.lower()
-        filtered_entries = [
-            entry for entry in filtered_entries
-            if search_term in str(entry.get("cliente", "")).lower() or \
-               search_term in str(entry.get("mercaderia", "")).lower() or \
-               search_term in str(entry.get("transporte", "")).lower() or \
-               search_term in str(entry.get("patente", "")).lower()
-        ]
+        filtered_entries = [entry for entry in filtered_entries if _matches_search(entry, search_term, VENTA_SEARCH_KEYS)]
         
     return filtered_entries
 
@@ -1426,14 +1638,9 @@ async def create_venta_entry(venta_data: Venta, current_user: UserInDB = Depends
         # Convert None to empty string for Excel compatibility
         data_row_cleaned = ["" if v is None else v for v in data_row]
         # Use the integer ID and type for upserting
-        daily_excel_logger.upsert_data(entry_id=new_id, entry_type="Venta", data_row=data_row_cleaned)
-        # Verify write by reloading today's data and checking the ID exists
-        reloaded = daily_excel_logger.load_daily_data()
-        todays_ventas = {entry["id"]: entry for entry in reloaded.get("Venta", []) if entry.get("id") is not None}
-        if new_id not in todays_ventas:
-            logger_msg = f"Post-upsert verification failed: Venta {new_id} not found in today's sheet."
-            print(logger_msg)
-            raise HTTPException(status_code=500, detail=logger_msg)
+        receipt = await storage_writer.writer.upsert(new_id, "Venta", data_row_cleaned)
+        # Verify write against the commit receipt (written row and journal fsync)
+        _verify_receipt(receipt, new_id, "Venta", "upsert")
     except Exception as e:
         # Log the error and raise an HTTPException
         print(f"Error upserting Venta {new_id} to Excel: {e}")
@@ -1451,7 +1658,7 @@ async def update_venta_entry(venta_id: int, venta_data: VentaUpdate, current_use
     if venta_id not in ventas_entries:
         # Fallback: intentar cargar la venta del día actual desde Excel
         try:
-            todays = daily_excel_logger.load_daily_data().get("Venta", [])
+            todays = (await run_io(daily_excel_logger.load_daily_data)).get("Venta", [])
             found = next((e for e in todays if int(e.get("id") or -1) == int(venta_id)), None)
             if found:
                 ventas_entries[venta_id] = found
@@ -1549,24 +1756,13 @@ async def update_venta_entry(venta_id: int, venta_data: VentaUpdate, current_use
             merged_data.get("observaciones", "")
         ]
         data_row_cleaned = ["" if v is None else v for v in data_row]
-        daily_excel_logger.upsert_data(entry_id=venta_id, entry_type="Venta", data_row=data_row_cleaned)
+        receipt = await storage_writer.writer.upsert(venta_id, "Venta", data_row_cleaned)
     except Exception as e:
         print(f"Error upserting Venta {venta_id} to Excel: {e}")
         raise HTTPException(status_code=500, detail=_format_save_error(e))
 
-    # Verify write by reloading today's data and checking the ID exists (post-update read-back)
-    try:
-        reloaded = daily_excel_logger.load_daily_data()
-        todays_ventas = {entry["id"]: entry for entry in reloaded.get("Venta", []) if entry.get("id") is not None}
-        if venta_id not in todays_ventas:
-            logger_msg = f"Post-update verification failed: Venta {venta_id} not found in today's sheet."
-            print(logger_msg)
-            raise HTTPException(status_code=500, detail=logger_msg)
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error verifying updated Venta {venta_id}: {e}")
-        raise HTTPException(status_code=500, detail=_format_save_error(e))
+    # Verify write against the commit receipt (written row and journal fsync)
+    _verify_receipt(receipt, venta_id, "Venta", "update")
 
     await notify_clients("venta")
     return ventas_entries[venta_id]
@@ -1582,7 +1778,7 @@ async def delete_venta_entry(venta_id: int, current_user: UserInDB = Depends(has
     # --- Delete from Excel ---
     try:
         # Use integer ID and type for deletion
-        daily_excel_logger.delete_data(entry_id=venta_id, entry_type="Venta")
+        await storage_writer.writer.delete(venta_id, "Venta")
     except Exception as e:
         # Log the error and raise an HTTPException
         print(f"Error deleting Venta {venta_id} from Excel: {e}")
@@ -1608,7 +1804,7 @@ async def imprimir_venta_pdf(venta_id: int, copies: int = 2, date: Optional[str]
         # Si se proporcionó una fecha, buscar en esa fecha específica
         if date:
             try:
-                entries = daily_excel_logger.load_data_by_date(date)
+                entries = await run_io(daily_excel_logger.load_data_by_date, date)
                 ventas_for_date = entries.get("Venta", [])
                 found = next((e for e in ventas_for_date if int(e.get("id")) == int(venta_id)), None)
                 if found:
@@ -1619,7 +1815,7 @@ async def imprimir_venta_pdf(venta_id: int, copies: int = 2, date: Optional[str]
         
         # Si no se encontró con fecha específica o no se proporcionó fecha, buscar en todas las fechas
         if datos is None:
-            entry, entry_date = find_entry_by_id(venta_id, "Venta")
+            entry, entry_date = await run_io(find_entry_by_id, venta_id, "Venta")
             if entry:
                 datos = [entry]
                 should_upsert = False
@@ -1651,7 +1847,7 @@ async def imprimir_venta_pdf(venta_id: int, copies: int = 2, date: Optional[str]
                 entry_dict.get("observaciones", "")
             ]
             data_row_cleaned = ["" if v is None else v for v in data_row]
-            daily_excel_logger.upsert_data(entry_id=venta_id, entry_type="Venta", data_row=data_row_cleaned)
+            await storage_writer.writer.upsert(venta_id, "Venta", data_row_cleaned)
         except Exception as e:
             print(f"Error saving Venta {venta_id} before printing: {e}")
             raise HTTPException(status_code=500, detail=_format_save_error(e))
@@ -1664,14 +1860,14 @@ async def imprimir_venta_pdf(venta_id: int, copies: int = 2, date: Optional[str]
         # Generate PDF in pesadas folder
         filename = os.path.join(pesadas_dir, f"ticket_venta_{venta_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
         print(f"DEBUG: Generando PDF con {copies} copias para Venta {venta_id}")
-        crear_pdf_recibo(datos, filename, tipo_recibo="Venta", copies=copies)
+        await run_cpu(crear_pdf_recibo, datos, filename, tipo_recibo="Venta", copies=copies)
         print(f"DEBUG: PDF generado exitosamente: {filename}")
         
         # On Windows, try to print directly
         if platform.system() == "Windows":
             print(f"DEBUG: Intentando imprimir archivo: {filename} con {copies} copias")
             try:
-                _try_print_file_windows(filename, copies=copies)
+                await run_io(_try_print_file_windows, filename, copies=copies)
                 print(f"DEBUG: Archivo enviado a impresora con {copies} copias")
                 return JSONResponse(content={"status": "success", "message": "Ticket guardado en Pesadas e impreso"})
             except Exception as print_error:
@@ -1711,7 +1907,7 @@ async def guardar_venta_pdf(venta_id: int, date: Optional[str] = None, current_u
         # Si se proporcionó una fecha, buscar en esa fecha específica
         if date:
             try:
-                entries = daily_excel_logger.load_data_by_date(date)
+                entries = await run_io(daily_excel_logger.load_data_by_date, date)
                 ventas_for_date = entries.get("Venta", [])
                 found = next((e for e in ventas_for_date if int(e.get("id")) == int(venta_id)), None)
                 if found:
@@ -1723,7 +1919,7 @@ async def guardar_venta_pdf(venta_id: int, date: Optional[str] = None, current_u
         
         # Si no se encontró con fecha específica o no se proporcionó fecha, buscar en todas las fechas
         if datos is None:
-            entry, entry_date = find_entry_by_id(venta_id, "Venta")
+            entry, entry_date = await run_io(find_entry_by_id, venta_id, "Venta")
             if entry:
                 datos = [entry]
                 found_date = entry_date
@@ -1756,7 +1952,7 @@ async def guardar_venta_pdf(venta_id: int, date: Optional[str] = None, current_u
                 entry_dict.get("observaciones", "")
             ]
             data_row_cleaned = ["" if v is None else v for v in data_row]
-            daily_excel_logger.upsert_data(entry_id=venta_id, entry_type="Venta", data_row=data_row_cleaned)
+            await storage_writer.writer.upsert(venta_id, "Venta", data_row_cleaned)
         except Exception as e:
             print(f"Error saving Venta {venta_id} before generating PDF: {e}")
             raise HTTPException(status_code=500, detail=_format_save_error(e))
@@ -1770,7 +1966,7 @@ async def guardar_venta_pdf(venta_id: int, date: Optional[str] = None, current_u
     filename = os.path.join(save_dir, f"venta_{venta_id}.pdf")
 
     try:
-        crear_pdf_recibo(datos, filename, tipo_recibo="Venta")
+        await run_cpu(crear_pdf_recibo, datos, filename, tipo_recibo="Venta")
         
         # **NUEVO: Subir a Google Drive si está habilitado (sin bloquear)**
         if ENABLE_GOOGLE_DRIVE and google_drive_helper and google_drive_helper.gdrive_manager:
@@ -1811,14 +2007,14 @@ async def imprimir_planilla_completa(current_user: UserInDB = Depends(has_role([
         filename = os.path.join(planilla_folder, f"planilla_completa_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
         print(f"DEBUG: Generando planilla completa en: {filename}")
         
-        generar_planilla(todos_datos, filename)
+        await run_cpu(generar_planilla, todos_datos, filename)
         print(f"DEBUG: Planilla generada exitosamente")
         
         # On Windows, try to print directly
         if platform.system() == "Windows":
             print(f"DEBUG: Intentando imprimir planilla completa")
             try:
-                _try_print_file_windows(filename, copies=1)
+                await run_io(_try_print_file_windows, filename, copies=1)
                 print(f"DEBUG: Planilla enviada a impresora")
                 return JSONResponse(content={"status": "success", "message": "Planilla guardada en Planilla/ e impresa"})
             except Exception as print_error:
@@ -1857,14 +2053,14 @@ async def imprimir_planilla_compras(current_user: UserInDB = Depends(has_role(["
         filename = os.path.join(planilla_folder, f"planilla_compras_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
         print(f"DEBUG: Generando planilla de compras en: {filename}")
         
-        generar_planilla(compras_data, filename)
+        await run_cpu(generar_planilla, compras_data, filename)
         print(f"DEBUG: Planilla de compras generada exitosamente")
         
         # On Windows, try to print directly
         if platform.system() == "Windows":
             print(f"DEBUG: Intentando imprimir planilla de compras")
             try:
-                _try_print_file_windows(filename, copies=1)
+                await run_io(_try_print_file_windows, filename, copies=1)
                 print(f"DEBUG: Planilla enviada a impresora")
                 return JSONResponse(content={"status": "success", "message": "Planilla de compras guardada en Planilla/ e impresa"})
             except Exception as print_error:
@@ -1903,14 +2099,14 @@ async def imprimir_planilla_ventas(current_user: UserInDB = Depends(has_role(["a
         filename = os.path.join(planilla_folder, f"planilla_ventas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
         print(f"DEBUG: Generando planilla de ventas en: {filename}")
         
-        generar_planilla(ventas_data, filename)
+        await run_cpu(generar_planilla, ventas_data, filename)
         print(f"DEBUG: Planilla de ventas generada exitosamente")
         
         # On Windows, try to print directly
         if platform.system() == "Windows":
             print(f"DEBUG: Intentando imprimir planilla de ventas")
             try:
-                _try_print_file_windows(filename, copies=1)
+                await run_io(_try_print_file_windows, filename, copies=1)
                 print(f"DEBUG: Planilla enviada a impresora")
                 return JSONResponse(content={"status": "success", "message": "Planilla de ventas guardada en Planilla/ e impresa"})
             except Exception as print_error:
@@ -1947,7 +2143,7 @@ async def ver_planilla_completa(current_user: UserInDB = Depends(has_role(["admi
     # Generate PDF in temp directory
     temp_pdf = os.path.join(tempfile.gettempdir(), f"planilla_unificada_{datetime.now().timestamp()}.pdf")
     try:
-        generar_planilla(todos_datos, temp_pdf)
+        await run_cpu(generar_planilla, todos_datos, temp_pdf)
         
     # Stream the file to avoid file locking issues
         def iterfile():
@@ -2000,7 +2196,7 @@ async def descargar_planilla_completa(current_user: UserInDB = Depends(has_role(
         planilla_filepath = os.path.join(planilla_base_folder, desired_filename)
 
         # Generate the PDF at the desired path (overwrites if exists)
-        generar_planilla(todos_datos, planilla_filepath)
+        await run_cpu(generar_planilla, todos_datos, planilla_filepath)
 
         # Stream the generated file with the desired download name
         def iterfile():
@@ -2040,7 +2236,7 @@ async def guardar_planilla_completa(current_user: UserInDB = Depends(has_role(["
         desired_filename = f"planilla-{dia}-{mes}.pdf"
         planilla_filepath = os.path.join(planilla_base_folder, desired_filename)
 
-        generar_planilla(todos_datos, planilla_filepath)
+        await run_cpu(generar_planilla, todos_datos, planilla_filepath)
 
         # **NUEVO: Subir a Google Drive si está habilitado (sin bloquear)**
         if ENABLE_GOOGLE_DRIVE and google_drive_helper and google_drive_helper.gdrive_manager:
@@ -2057,7 +2253,8 @@ async def guardar_planilla_completa(current_user: UserInDB = Depends(has_role(["
 
 @app.get("/descargar/planilla")
 async def descargar_planilla_filtrada(
-    type: str, search: str = "", date: str = "", current_user: UserInDB = Depends(has_role(["admin", "lect"]))
+    type: str, search: str = "", date: str = "", current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+    _conditional: None = Depends(conditional_get(scope="date"))
 ):
     """Descarga la planilla filtrada por tipo (compras/ventas/todo), búsqueda y fecha."""
     from tempfile import gettempdir
@@ -2068,7 +2265,7 @@ async def descargar_planilla_filtrada(
 
     tipo = type.lower()
     fecha_str = date if date else datetime.now().strftime("%Y-%m-%d")
-    all_data = daily_excel_logger.load_data_by_date(fecha_str)
+    all_data = await _read_shared(daily_excel_logger.load_data_by_date, fecha_str)
     datos = []
     if tipo == "compras":
         # Asegurar que cada item tenga la clave 'tipo' requerida por el generador de PDF
@@ -2098,7 +2295,7 @@ async def descargar_planilla_filtrada(
             )]
     # Generar PDF temporal
     temp_pdf = os.path.join(gettempdir(), f"planilla_{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
-    generar_planilla(datos, temp_pdf)
+    await run_cpu(generar_planilla, datos, temp_pdf)
     # Stream para descarga
     def iterfile():
         with open(temp_pdf, 'rb') as f:
@@ -2129,35 +2326,22 @@ class DashboardData(BaseModel):
 async def get_dashboard_data(
     start_date: str,
     end_date: str,
-    current_user: UserInDB = Depends(has_role(["admin", "lect"]))
+    current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+    cached: Optional[Response] = Depends(conditional_get(scope="range", cache=True))
 ):
     """
     Calculates dashboard data for a given date range.
     """
+    if cached is not None:
+        return cached
     try:
         start = datetime.strptime(start_date, "%Y-%m-%d")
         end = datetime.strptime(end_date, "%Y-%m-%d")
-        
-        all_compras = []
-        all_ventas = []
-        
-        current_date = start
-        while current_date <= end:
-            date_str = current_date.strftime("%Y-%m-%d")
-            data_for_date = daily_excel_logger.load_data_by_date(date_str)
-            all_compras.extend(data_for_date.get("Compra", []))
-            all_ventas.extend(data_for_date.get("Venta", []))
-            current_date += timedelta(days=1)
-            
-        total_comprados = sum(item.get("neto", 0) or 0 for item in all_compras)
-        total_vendidos = sum(item.get("neto", 0) or 0 for item in all_ventas)
+
+        total_comprados, total_vendidos, material_summary = await _read_shared(
+            _dashboard_totals, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+        )
         balance = total_comprados - total_vendidos
-        
-        material_summary = {}
-        for item in all_compras:
-            material = item.get("mercaderia", "Desconocido")
-            kilos = item.get("neto", 0) or 0
-            material_summary[material] = material_summary.get(material, 0) + kilos
             
         compras_por_material = [
             MaterialTotal(mercaderia=material, total_kilos=kilos)
@@ -2175,18 +2359,45 @@ async def get_dashboard_data(
         raise HTTPException(status_code=500, detail=f"Error calculating dashboard data: {str(e)}")
 
 
+def _dashboard_totals(start: str, end: str):
+    """Kilos comprados, kilos vendidos y kilos comprados por material entre start y end (YYYY-MM-DD)."""
+    total_comprados = 0
+    total_vendidos = 0
+    material_summary: Dict[str, float] = {}
+    # Una fila por (fecha, tipo, mercadería, contraparte) del resumen diario, no una por pesada;
+    # con NumPy, como columnas en memoria (analytics.Frame)
+    frame = daily_excel_logger.load_totals_frame()
+    if frame is not None:
+        compras = frame.mask(start, end, "Compra")
+        ventas = frame.mask(start, end, "Venta")
+        return frame.sum("neto", compras), frame.sum("neto", ventas), frame.group_sum("mercaderia", "neto", compras)
+    for total in daily_excel_logger.load_daily_totals(start, end):
+        if total.tipo == "Venta":
+            total_vendidos += total.sum_neto
+            continue
+        total_comprados += total.sum_neto
+        material_summary[total.mercaderia] = material_summary.get(total.mercaderia, 0) + total.sum_neto
+    return total_comprados, total_vendidos, material_summary
+
+
 # --- Dashboard: Últimos 5 días ---
 class DailyBalance(BaseModel):
     fecha: str  # YYYY-MM-DD
     balance_neto: float
 
+# Máximo de días de /api/dashboard/balance
+BALANCE_MAX_DAYS = int(os.getenv("BALANCE_MAX_DAYS", "1095"))
+
 
 @app.get("/api/dashboard/last5days", response_model=List[DailyBalance])
-async def get_last_5_days_balance(end_date: Optional[str] = None, current_user: UserInDB = Depends(has_role(["admin", "lect"]))):
+async def get_last_5_days_balance(end_date: Optional[str] = None, current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+                                  cached: Optional[Response] = Depends(conditional_get(scope="window", cache=True))):
     """
     Devuelve el balance neto (Compras - Ventas) de los últimos 5 días, incluido hoy.
     El formato de fecha devuelto es YYYY-MM-DD.
     """
+    if cached is not None:
+        return cached
     try:
         # Si se especifica end_date (YYYY-MM-DD), usarlo como ancla; si no, hoy
         if end_date:
@@ -2196,25 +2407,57 @@ async def get_last_5_days_balance(end_date: Optional[str] = None, current_user:
                 anchor = datetime.now().date()
         else:
             anchor = datetime.now().date()
-        results: List[DailyBalance] = []
-        # Recorremos de más antiguo a más reciente para mostrar cronológicamente
-        for delta in range(4, -1, -1):
-            d = anchor - timedelta(days=delta)
-            date_str = d.strftime("%Y-%m-%d")
-            data_for_date = daily_excel_logger.load_data_by_date(date_str)
-            compras = data_for_date.get("Compra", [])
-            ventas = data_for_date.get("Venta", [])
-            total_compras = sum(item.get("neto", 0) or 0 for item in compras)
-            total_ventas = sum(item.get("neto", 0) or 0 for item in ventas)
-            balance = float(total_compras) - float(total_ventas)
-            results.append(DailyBalance(fecha=date_str, balance_neto=balance))
-
-        return results
+        return await _balance_window(anchor, 5)
     except Exception as e:
         print(f"Error calculating last 5 days balance: {e}")
         raise HTTPException(status_code=500, detail=f"Error calculating last 5 days balance: {str(e)}")
 
 
+@app.get("/api/dashboard/balance", response_model=List[DailyBalance])
+async def get_balance_window(days: int = 5, end_date: Optional[str] = None, current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+                             cached: Optional[Response] = Depends(conditional_get(scope="window", cache=True))):
+    """
+    Devuelve el balance neto (Compras - Ventas) de cada uno de los últimos `days` días
+    hasta end_date inclusive (por defecto hoy), del más antiguo al más reciente.
+    Los días cerrados quedan en memoria; solo se recalcula el día en curso, así
+    90 o 365 días cuestan casi lo mismo que 5.
+
+    - days: 1 a BALANCE_MAX_DAYS (default 5)
+    - end_date: YYYY-MM-DD (opcional)
+    """
+    if cached is not None:
+        return cached
+    if not 1 <= days <= BALANCE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days debe estar entre 1 y {BALANCE_MAX_DAYS}")
+    try:
+        anchor = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else datetime.now().date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+    try:
+        return await _balance_window(anchor, days)
+    except Exception as e:
+        print(f"Error calculating {days} days balance: {e}")
+        raise HTTPException(status_code=500, detail=f"Error calculating balance: {str(e)}")
+
+
+async def _balance_window(anchor, days: int) -> List[DailyBalance]:
+    """Un DailyBalance por día de los `days` días que terminan en anchor, del más antiguo al más reciente (0 sin datos)."""
+    first = anchor - timedelta(days=days - 1)
+    balances = await _read_shared(_daily_balances, first.strftime("%Y-%m-%d"), anchor.strftime("%Y-%m-%d"))
+    results: List[DailyBalance] = []
+    # Recorremos de más antiguo a más reciente para mostrar cronológicamente
+    for delta in range(days - 1, -1, -1):
+        date_str = (anchor - timedelta(days=delta)).strftime("%Y-%m-%d")
+        results.append(DailyBalance(fecha=date_str, balance_neto=balances.get(date_str, 0.0)))
+    return results
+
+
+def _daily_balances(start: str, end: str) -> Dict[str, float]:
+    """Balance neto (compras - ventas) de cada fecha con datos entre start y end (YYYY-MM-DD)."""
+    # Los días ya cerrados salen de la ventana en memoria; solo se recalcula hoy
+    return daily_excel_logger.load_daily_balances(start, end)
+
+
 # --- Dashboard: Últimos movimientos (compras + ventas) ---
 class LastMove(BaseModel):
     id: Optional[int] = None
@@ -2232,11 +2475,14 @@ async def get_last_moves(
     start_date: str,
     end_date: str,
     limit: int = 6,
-    current_user: UserInDB = Depends(has_role(["admin", "lect"]))
+    current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+    cached: Optional[Response] = Depends(conditional_get(scope="range", cache=True))
 ):
     """
     Devuelve una lista combinada de los últimos movimientos (Compras y Ventas)
     dentro del rango [start_date, end_date], ordenados por fecha y hora descendente.
+    Recorre las fechas desde end_date hacia atrás y se detiene al juntar `limit`
+    movimientos, así un rango de un año cuesta lo mismo que uno de un día.
 
     - start_date, end_date: YYYY-MM-DD
     - limit: cantidad máxima de elementos a devolver (default 6)
@@ -2244,69 +2490,13 @@ async def get_last_moves(
     Campos devueltos por ítem (compatibles con el frontend):
     { id, tipo: 'compra'|'venta', fecha: 'YYYY-MM-DD', mercaderia, neto, tercero, proveedor|cliente }
     """
+    if cached is not None:
+        return cached
     try:
         start = datetime.strptime(start_date, "%Y-%m-%d").date()
         end = datetime.strptime(end_date, "%Y-%m-%d").date()
         
-        results: List[Dict[str, Any]] = []
-
-        current = start
-        while current <= end:
-            ymd = current.strftime("%Y-%m-%d")
-            data_for_date = daily_excel_logger.load_data_by_date(ymd)
-
-            # Compras
-            for it in data_for_date.get("Compra", []) or []:
-                # Elegir una hora de referencia para ordenar (preferimos hora_salida si existe, sino ingreso)
-                hora = (it.get("hora_salida") or it.get("hora_ingreso") or "00:00")
-                # Normalizar HH:MM
-                try:
-                    hh, mm = (hora.split(":") + ["0"])[:2]
-                    ts = datetime.strptime(f"{ymd} {int(hh):02d}:{int(mm):02d}", "%Y-%m-%d %H:%M")
-                except Exception:
-                    ts = datetime.strptime(f"{ymd} 00:00", "%Y-%m-%d %H:%M")
-                move = {
-                    "id": it.get("id"),
-                    "tipo": "compra",
-                    "fecha": ymd,
-                    "mercaderia": it.get("mercaderia"),
-                    "neto": float(it.get("neto") or 0),
-                    "tercero": it.get("proveedor") or "",
-                    "proveedor": it.get("proveedor") or "",
-                    # ts interno para ordenar, no se expone
-                    "_ts": ts,
-                }
-                results.append(move)
-
-            # Ventas
-            for it in data_for_date.get("Venta", []) or []:
-                hora = (it.get("hora_salida") or it.get("hora_ingreso") or "00:00")
-                try:
-                    hh, mm = (hora.split(":") + ["0"])[:2]
-                    ts = datetime.strptime(f"{ymd} {int(hh):02d}:{int(mm):02d}", "%Y-%m-%d %H:%M")
-                except Exception:
-                    ts = datetime.strptime(f"{ymd} 00:00", "%Y-%m-%d %H:%M")
-                move = {
-                    "id": it.get("id"),
-                    "tipo": "venta",
-                    "fecha": ymd,
-                    "mercaderia": it.get("mercaderia"),
-                    "neto": float(it.get("neto") or 0),
-                    "tercero": it.get("cliente") or "",
-                    "cliente": it.get("cliente") or "",
-                    "_ts": ts,
-                }
-                results.append(move)
-
-            current += timedelta(days=1)
-
-        # Ordenar por timestamp descendente
-        results.sort(key=lambda x: x.get("_ts") or datetime.min, reverse=True)
-        # Recortar
-        results = results[:limit]
-        # Quitar la clave interna _ts
-        for r in results:
-            r.pop("_ts", None)
+        results = await _read_shared(_collect_moves, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), limit)
 
         # Validación suave de tipos para el response_model
         last_moves = [LastMove(**r) for r in results]
@@ -2319,33 +2509,193 @@ async def get_last_moves(
         raise HTTPException(status_code=500, detail=f"Error obteniendo últimos movimientos: {str(e)}")
 
 
+# --- Búsqueda en todo el historial ---
+class SearchHit(BaseModel):
+    id: int
+    tipo: str  # "compra" | "venta"
+    fecha: str  # YYYY-MM-DD
+    contraparte: Optional[str] = None
+    patente: Optional[str] = None
+    chofer: Optional[str] = None
+    mercaderia: Optional[str] = None
+    relevancia: float
+
+
+@app.get("/api/search", response_model=List[SearchHit])
+async def search_history(
+    q: str,
+    tipo: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 50,
+    current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+    _conditional: None = Depends(conditional_get())
+):
+    """
+    Busca en contraparte, patente, chofer/transporte y mercadería de todas las pesadas,
+    sin distinguir mayúsculas ni acentos ("perez" encuentra "PÉREZ"). Todas las palabras
+    de q deben coincidir; los resultados vienen ordenados por relevancia y luego por fecha.
+
+    - tipo: 'compra' | 'venta' (opcional)
+    - start_date, end_date: YYYY-MM-DD (opcionales)
+    - limit: cantidad máxima de resultados (default 50, máximo 500)
+    """
+    entry_type = None
+    if tipo:
+        entry_type = {"compra": "Compra", "venta": "Venta"}.get(tipo.lower())
+        if entry_type is None:
+            raise HTTPException(status_code=400, detail="tipo debe ser 'compra' o 'venta'")
+    for value in (start_date, end_date):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+    try:
+        hits = await _read_shared(
+            daily_excel_logger.search_entries, q, entry_type, start_date, end_date, max(1, min(limit, 500))
+        )
+        return [
+            SearchHit(
+                id=hit["id"], tipo=hit["tipo"].lower(), fecha=hit["fecha"],
+                contraparte=hit["contraparte"], patente=hit["patente"], chofer=hit["chofer"],
+                mercaderia=hit["mercaderia"], relevancia=round(hit["score"], 4),
+            )
+            for hit in hits
+        ]
+    except Exception as e:
+        print(f"Error en la búsqueda: {e}")
+        raise HTTPException(status_code=500, detail=f"Error en la búsqueda: {str(e)}")
+
+
+def _collect_moves(start: str, end: str, limit: int) -> List[Dict[str, Any]]:
+    """Los `limit` movimientos más recientes entre start y end (YYYY-MM-DD), por fecha y hora de salida/ingreso."""
+    results: List[Dict[str, Any]] = []
+    for ymd, tipo, it in daily_excel_logger.load_latest(start, end, limit):
+        tercero_key = "proveedor" if tipo == "Compra" else "cliente"
+        results.append({
+            "id": it.get("id"),
+            "tipo": tipo.lower(),
+            "fecha": ymd,
+            "mercaderia": it.get("mercaderia"),
+            "neto": float(it.get("neto") or 0),
+            "tercero": it.get(tercero_key) or "",
+            tercero_key: it.get(tercero_key) or "",
+        })
+    return results
+
+
+# --- Analítica: series temporales ---
+class SeriesPoint(BaseModel):
+    periodo: str  # YYYY-MM-DD, primer día del día/semana/mes
+    grupo: Optional[str] = None  # mercadería, proveedor o cliente según group_by
+    valor: float
+
+
+# group_by -> (dimensión del resumen diario, tipo de operación fijo o None)
+SERIES_GROUP_BY = {
+    "mercaderia": ("mercaderia", None),
+    "proveedor": ("contraparte", "Compra"),
+    "cliente": ("contraparte", "Venta"),
+}
+
+
+@app.get("/api/analytics/series", response_model=List[SeriesPoint])
+async def get_analytics_series(
+    start_date: str,
+    end_date: str,
+    bucket: str = "day",
+    metric: str = "neto",
+    group_by: Optional[str] = None,
+    tipo: Optional[str] = None,
+    current_user: UserInDB = Depends(has_role(["admin", "lect"])),
+    _conditional: None = Depends(conditional_get(scope="range"))
+):
+    """
+    Serie temporal de kilos netos, importe o cantidad de pesadas entre start_date y end_date,
+    agrupada por día, semana (desde el lunes) o mes y, opcionalmente, por mercadería,
+    proveedor o cliente. Se calcula desde el resumen diario; los períodos ya cerrados
+    quedan en memoria y no se recalculan.
+
+    - start_date, end_date: YYYY-MM-DD
+    - bucket: 'day' | 'week' | 'month' (default 'day')
+    - metric: 'neto' | 'importe' | 'count' (default 'neto')
+    - group_by: 'mercaderia' | 'proveedor' | 'cliente' (opcional)
+    - tipo: 'compra' | 'venta' (default 'compra'; proveedor implica compras y cliente ventas)
+
+    Devuelve { periodo, grupo, valor } por período y grupo con datos, del más antiguo al más reciente.
+    """
+    if bucket not in daily_excel_logger.SERIES_BUCKETS:
+        raise HTTPException(status_code=400, detail="bucket debe ser 'day', 'week' o 'month'")
+    if metric not in daily_excel_logger.SERIES_METRICS:
+        raise HTTPException(status_code=400, detail="metric debe ser 'neto', 'importe' o 'count'")
+    if group_by and group_by not in SERIES_GROUP_BY:
+        raise HTTPException(status_code=400, detail="group_by debe ser 'mercaderia', 'proveedor' o 'cliente'")
+    entry_type = None
+    if tipo:
+        entry_type = {"compra": "Compra", "venta": "Venta"}.get(tipo.lower())
+        if entry_type is None:
+            raise HTTPException(status_code=400, detail="tipo debe ser 'compra' o 'venta'")
+    dimension, fixed_type = SERIES_GROUP_BY.get(group_by, (None, None))
+    if fixed_type:
+        if entry_type and entry_type != fixed_type:
+            raise HTTPException(status_code=400, detail=f"group_by={group_by} solo admite tipo '{fixed_type.lower()}'")
+        entry_type = fixed_type
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+    try:
+        points = await _read_shared(
+            daily_excel_logger.load_series, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"),
+            bucket, metric, dimension, entry_type or "Compra"
+        )
+        return [SeriesPoint(periodo=periodo, grupo=grupo, valor=valor) for periodo, grupo, valor in points]
+    except Exception as e:
+        print(f"Error calculando la serie {metric} por {bucket}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error calculating analytics series: {str(e)}")
+
+
 # --- Backup Endpoint ---
 @app.get("/backup")
 async def create_backup(current_user: UserInDB = Depends(has_role(["admin", "lect"]))):
     """Create a backup of the daily log Excel file."""
     try:
-        # Ensure the source file exists
-        if not os.path.exists("daily_log.xlsx"):
+        # With the SQLite engine the workbook is an export: refresh it before copying.
+        # With the Excel engine, write any buffered changes first.
+        if daily_excel_logger.STORAGE_ENGINE == "sqlite":
+            await run_io(daily_excel_logger.export_workbook)
+        else:
+            await run_io(daily_excel_logger.flush)
+
+        # Ensure the source file exists (one workbook per month with EXCEL_SHARDING=monthly)
+        source_files = [f for f in await run_io(daily_excel_logger.store_files) if os.path.exists(f)]
+        if not source_files:
             raise HTTPException(status_code=404, detail="daily_log.xlsx not found.")
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"daily_log_backup_{timestamp}.xlsx"
         backup_folder = get_daily_backup_folder_for_today()
-        backup_path = os.path.join(backup_folder, backup_filename)
+        backup_paths = []
 
-        # Copy the file
+        # Copy the file(s)
         import shutil
-        shutil.copy2("daily_log.xlsx", backup_path)
+        for source_file in source_files:
+            stem = os.path.splitext(os.path.basename(source_file))[0]
+            backup_path = os.path.join(backup_folder, f"{stem}_backup_{timestamp}.xlsx")
+            await run_io(shutil.copy2, source_file, backup_path)
+            backup_paths.append(backup_path)
 
         # **NUEVO: Subir a Google Drive si está habilitado (sin bloquear)**
         if ENABLE_GOOGLE_DRIVE and google_drive_helper and google_drive_helper.gdrive_manager:
             try:
                 date_folder = datetime.now().strftime("%d-%m-%Y")
-                google_drive_helper.queue_upload(backup_path, folder_type="backups", subfolder=date_folder)
+                for backup_path in backup_paths:
+                    google_drive_helper.queue_upload(backup_path, folder_type="backups", subfolder=date_folder)
             except Exception as gd_error:
                 print(f"⚠ Error al encolar backup para Google Drive: {gd_error}")
 
-        return {"status": "success", "message": f"Backup created: {os.path.join(backup_folder, backup_filename)}"}
+        return {"status": "success", "message": f"Backup created: {', '.join(backup_paths)}"}
 
     except Exception as e:
         print(f"Error creating backup: {e}")
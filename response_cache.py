@@ -0,0 +1,103 @@
+"""
+In-memory cache of rendered GET responses.
+
+Entries are keyed by (route, normalized query) and remember the data version
+(daily_excel_logger.data_version) of the dates they were built from: a lookup
+under another version is a miss that drops the entry, so a write only
+invalidates the responses covering the dates it touched. Entries that include
+today also expire after RESPONSE_CACHE_TTL seconds, which bounds how long a
+change made outside this process (another tool writing the store) can go
+unnoticed. The cache is an LRU bounded by entry count and total body size.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional
+
+# Configuration
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").strip().lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "64"))
+# Seconds an entry that includes today stays valid (past dates only change through versions)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+
+
+class CachedResponse(NamedTuple):
+    version: str
+    expires: Optional[float]  # time.monotonic() deadline; None = until the version changes
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0  # Entries dropped because their data version changed
+        self.expirations = 0
+        self.evictions = 0
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry.body)
+
+    def get(self, key: Hashable, version: str) -> Optional[CachedResponse]:
+        """The entry of `key` if it was built from `version` and has not expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version != version:
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            elif entry is not None and entry.expires is not None and entry.expires <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def fits(self, size: int) -> bool:
+        """Whether a body of `size` bytes would be stored: one huge response should not flush everything else."""
+        return size <= self.max_bytes // 4
+
+    def put(self, key: Hashable, version: str, status_code: int, headers: Dict[str, str], body: bytes, includes_today: bool):
+        """Stores a response built from `version`; with includes_today it also expires after the TTL."""
+        if not self.fits(len(body)):
+            return
+        expires = time.monotonic() + self.ttl if includes_today else None
+        with self.lock:
+            self._drop(key)
+            self.entries[key] = CachedResponse(version, expires, status_code, headers, body)
+            self.bytes += len(body)
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations, "expirations": self.expirations, "evictions": self.evictions,
+            }
+
+
+cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, int(RESPONSE_CACHE_MAX_MB * 1024 * 1024), RESPONSE_CACHE_TTL)
@@ -0,0 +1,207 @@
+"""
+Full-text search index over the text fields of every stored pesada.
+
+Contraparte, patente, chofer/transporte and mercadería of each pesada are
+indexed in a SQLite FTS5 table kept in a small file next to the workbook
+(daily_log.xlsx -> daily_log.search.db). Text is folded before indexing and
+before searching (lowercase, no accents), so "perez" finds "PÉREZ". With the
+trigram tokenizer (SQLite 3.34+) any substring of 3+ characters is found
+through the index, e.g. "123cd" finds plate "AB 123 CD"; older SQLite builds
+fall back to word-prefix search. The index is updated on every upsert/delete
+and resynced together with the ID index (see daily_excel_logger).
+"""
+
+import sqlite3
+import os
+import re
+import logging
+import unicodedata
+from typing import List, Any, Optional, Dict, Iterable, Tuple
+
+import sqlite_util
+
+logger = logging.getLogger("daily_excel_logger.search_index")
+
+FIELDS = ("contraparte", "patente", "chofer", "mercaderia")
+# bm25 weight per field, in FIELDS order: a plate hit ranks above a product hit
+FIELD_WEIGHTS = (2.0, 3.0, 1.0, 1.0)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    docid INTEGER PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    fecha TEXT NOT NULL,
+    contraparte TEXT,  -- As stored, for display; docs_fts holds the folded text
+    patente TEXT,
+    chofer TEXT,
+    mercaderia TEXT,
+    UNIQUE (tipo, id, fecha)
+);
+CREATE INDEX IF NOT EXISTS idx_docs_fecha ON docs (fecha);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+_FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(contraparte, patente, chofer, mercaderia, tokenize='{}')"
+
+_tokenizers: Dict[str, str] = {}  # path -> "trigram" | "unicode61"
+
+
+def index_path(workbook_filename: str) -> str:
+    """Returns the search index file used for a workbook (same name, '.search.db' extension)."""
+    return os.path.splitext(workbook_filename)[0] + ".search.db"
+
+
+def fold(text: Any) -> str:
+    """Lowercases and strips accents: 'Pérez' -> 'perez'."""
+    if text is None:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+def _document(fields: Dict[str, Any]) -> Tuple[str, ...]:
+    values = {name: fold(fields.get(name)) for name in FIELDS}
+    # Plates are typed with and without separators: index both forms
+    compact = re.sub(r"[\s.\-]", "", values["patente"])
+    if compact != values["patente"]:
+        values["patente"] = f"{values['patente']} {compact}"
+    return tuple(values[name] for name in FIELDS)
+
+
+def _init_schema(conn: sqlite3.Connection, path: str):
+    conn.executescript(_SCHEMA)
+    try:
+        conn.execute(_FTS_SCHEMA.format("trigram"))
+    except sqlite3.OperationalError:
+        # No trigram tokenizer before SQLite 3.34, or an index created by such a build
+        conn.execute(_FTS_SCHEMA.format("unicode61 remove_diacritics 2"))
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'docs_fts'").fetchone()[0]
+    _tokenizers[path] = "trigram" if "trigram" in sql else "unicode61"
+
+
+_connections = sqlite_util.ConnectionPool("search index", _init_schema)
+_connect = _connections.connect
+
+
+def _delete_docs(conn: sqlite3.Connection, where: str, params: Tuple[Any, ...]):
+    docids = [row[0] for row in conn.execute(f"SELECT docid FROM docs WHERE {where}", params)]
+    for docid in docids:
+        conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (docid,))
+        conn.execute("DELETE FROM docs WHERE docid = ?", (docid,))
+
+
+def _insert_doc(conn: sqlite3.Connection, entry_type: str, entry_id: int, date_str: str, fields: Dict[str, Any]):
+    raw = [None if fields.get(name) is None else str(fields.get(name)) for name in FIELDS]
+    cursor = conn.execute(
+        "INSERT INTO docs (tipo, id, fecha, contraparte, patente, chofer, mercaderia) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (entry_type, entry_id, date_str, *raw),
+    )
+    conn.execute(
+        "INSERT INTO docs_fts (rowid, contraparte, patente, chofer, mercaderia) VALUES (?, ?, ?, ?, ?)",
+        (cursor.lastrowid, *_document(fields)),
+    )
+
+
+def upsert(path: str, entry_type: str, entry_id: int, date_str: str, fields: Dict[str, Any]):
+    """Indexes (or re-indexes) the text fields of one pesada."""
+    conn = _connect(path)
+    with conn:
+        _delete_docs(conn, "tipo = ? AND id = ? AND fecha = ?", (entry_type, entry_id, date_str))
+        _insert_doc(conn, entry_type, entry_id, date_str, fields)
+
+
+def remove(path: str, entry_type: str, entry_id: int, date_str: str):
+    """Drops one pesada from the index."""
+    conn = _connect(path)
+    with conn:
+        _delete_docs(conn, "tipo = ? AND id = ? AND fecha = ?", (entry_type, entry_id, date_str))
+
+
+def replace_date(path: str, date_str: str, docs: Iterable[Tuple[str, int, Dict[str, Any]]]) -> int:
+    """Replaces every pesada of date_str with (tipo, id, fields) docs. Returns the doc count."""
+    conn = _connect(path)
+    count = 0
+    with conn:
+        _delete_docs(conn, "fecha = ?", (date_str,))
+        for entry_type, entry_id, fields in docs:
+            # A key repeated within the sheet: the last row wins
+            _delete_docs(conn, "tipo = ? AND id = ? AND fecha = ?", (entry_type, entry_id, date_str))
+            _insert_doc(conn, entry_type, entry_id, date_str, fields)
+            count += 1
+    return count
+
+
+def finish_sync(path: str, present_dates: Iterable[str]):
+    """Drops dates that no longer exist and marks the index as built."""
+    conn = _connect(path)
+    present = set(present_dates)
+    with conn:
+        for (fecha,) in conn.execute("SELECT DISTINCT fecha FROM docs").fetchall():
+            if fecha not in present:
+                _delete_docs(conn, "fecha = ?", (fecha,))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '1')")
+
+
+def is_built(path: str) -> bool:
+    conn = _connect(path)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+    return bool(row) and row[0] == "1"
+
+
+def invalidate(path: str):
+    """Marks the index as needing a full rebuild (e.g. after a failed update)."""
+    conn = _connect(path)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '0')")
+
+
+def search(path: str, query: str, entry_type: Optional[str] = None, start_date: Optional[str] = None,
+           end_date: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Returns the pesadas whose text fields contain every term of `query`, best match first
+    (higher score is better), newest first among equals: dicts with tipo, id, fecha, the
+    indexed fields as stored, and score.
+    """
+    conn = _connect(path)
+    terms = fold(query).split()
+    if not terms:
+        return []
+    trigram = _tokenizers.get(path) == "trigram"
+    # Trigrams need 3+ characters; shorter terms are matched with LIKE on the indexed text
+    indexed = [t for t in terms if len(t) >= 3] if trigram else terms
+    short = [t for t in terms if t not in indexed]
+
+    conditions, params = [], []
+    if indexed:
+        conditions.append("docs_fts MATCH ?")
+        quoted = ['"' + t.replace('"', '""') + '"' for t in indexed]
+        params.append(" AND ".join(quoted if trigram else [q + "*" for q in quoted]))
+    for term in short:
+        conditions.append("(docs_fts.contraparte || ' ' || docs_fts.patente || ' ' || docs_fts.chofer || ' ' || docs_fts.mercaderia) LIKE ?")
+        params.append(f"%{term}%")
+    if entry_type:
+        conditions.append("d.tipo = ?")
+        params.append(entry_type)
+    if start_date:
+        conditions.append("d.fecha >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append("d.fecha <= ?")
+        params.append(end_date)
+    score = f"-bm25(docs_fts, {', '.join(str(w) for w in FIELD_WEIGHTS)})" if indexed else "0.0"
+    sql = (
+        f"SELECT d.tipo, d.id, d.fecha, d.contraparte, d.patente, d.chofer, d.mercaderia, {score} AS score "
+        f"FROM docs_fts JOIN docs d ON d.docid = docs_fts.rowid "
+        f"WHERE {' AND '.join(conditions)} ORDER BY score DESC, d.fecha DESC, d.id DESC LIMIT ?"
+    )
+    params.append(max(1, int(limit)))
+    columns = ("tipo", "id", "fecha") + FIELDS + ("score",)
+    return [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+
+
+def close(path: Optional[str] = None):
+    """Closes this thread's connection(s). Mainly useful for tools and shutdown."""
+    _connections.close(path)
@@ -0,0 +1,248 @@
+"""
+SQLite storage engine for the daily log.
+
+Keeps every pesada in a single `pesadas` table (WAL mode, indexed by
+fecha/tipo/id) so that writes cost the same no matter how many days of
+history exist. Rows are stored and returned in the same column order as
+`daily_excel_logger.HEADERS`; the workbook is only generated as an export.
+"""
+
+import sqlite3
+import os
+import logging
+from typing import List, Any, Optional, Dict, Iterable, Iterator, Tuple
+
+import sqlite_util
+
+logger = logging.getLogger("daily_excel_logger.sqlite_store")
+
+# Configuration
+SQLITE_FILENAME = os.getenv("SQLITE_DB_PATH", "daily_log.db")
+
+# Columns after (fecha, tipo, id), aligned with HEADERS[2:]
+DATA_COLUMNS = [
+    "contraparte", "producto",
+    "peso_bruto", "peso_tara", "merma", "peso_neto",
+    "precio_x_kg", "importe", "chofer_transporte", "patente", "incoterm",
+    "fecha_operacion", "hora_ingreso", "hora_salida", "remito", "observaciones"
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pesadas (
+    fecha TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    contraparte TEXT,
+    producto TEXT,
+    peso_bruto REAL,
+    peso_tara REAL,
+    merma REAL,
+    peso_neto REAL,
+    precio_x_kg REAL,
+    importe REAL,
+    chofer_transporte TEXT,
+    patente TEXT,
+    incoterm TEXT,
+    fecha_operacion TEXT,
+    hora_ingreso TEXT,
+    hora_salida TEXT,
+    remito INTEGER,
+    observaciones TEXT,
+    PRIMARY KEY (fecha, tipo, id)
+);
+CREATE INDEX IF NOT EXISTS idx_pesadas_tipo_id ON pesadas (tipo, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def _init_schema(conn: sqlite3.Connection, path: str):
+    conn.executescript(_SCHEMA)
+    logger.info(f"SQLite store ready: {path}")
+
+
+_connections = sqlite_util.ConnectionPool("SQLite", _init_schema, pragmas=("busy_timeout=10000",))
+_connect = _connections.connect
+
+
+def _row_values(entry_id: Any, data_row: List[Any]) -> List[Any]:
+    """Maps a HEADERS-ordered row to the (id, data columns...) values stored in SQLite."""
+    # Empty strings become NULL, like empty cells in the workbook (keeps aggregates numeric)
+    return [entry_id] + [None if value == "" else value for value in data_row[2:]]
+
+
+def _to_header_row(db_row: Tuple[Any, ...]) -> List[Any]:
+    """Converts a (tipo, id, data columns...) tuple back to HEADERS order."""
+    tipo, entry_id = db_row[0], db_row[1]
+    return [entry_id, tipo] + list(db_row[2:])
+
+
+_SELECT_COLUMNS = "tipo, id, " + ", ".join(DATA_COLUMNS)
+
+
+def upsert_row(date_str: str, entry_id: Any, entry_type: str, data_row: List[Any], path: str = SQLITE_FILENAME) -> Tuple[int, str, Any]:
+    """Inserts or replaces the pesada (date_str, entry_type, entry_id). Returns its (rowid, tipo, id) as stored."""
+    conn = _connect(path)
+    values = _row_values(entry_id, data_row)
+    placeholders = ", ".join("?" for _ in range(len(DATA_COLUMNS) + 3))
+    updates = ", ".join(f"{col} = excluded.{col}" for col in DATA_COLUMNS)
+    with conn:
+        conn.execute(
+            f"INSERT INTO pesadas (fecha, tipo, id, {', '.join(DATA_COLUMNS)}) VALUES ({placeholders}) "
+            f"ON CONFLICT (fecha, tipo, id) DO UPDATE SET {updates}",
+            [date_str, entry_type] + values,
+        )
+        rowid, stored_type, stored_id = conn.execute(
+            "SELECT rowid, tipo, id FROM pesadas WHERE fecha = ? AND tipo = ? AND id = ?",
+            (date_str, entry_type, entry_id),
+        ).fetchone()
+    return rowid, stored_type, stored_id
+
+
+def delete_row(date_str: str, entry_id: Any, entry_type: str, path: str = SQLITE_FILENAME) -> bool:
+    """Deletes the pesada (date_str, entry_type, entry_id). Returns True if a row was removed."""
+    conn = _connect(path)
+    with conn:
+        cursor = conn.execute(
+            "DELETE FROM pesadas WHERE fecha = ? AND tipo = ? AND id = ?",
+            (date_str, entry_type, entry_id),
+        )
+    return cursor.rowcount > 0
+
+
+def load_row(date_str: str, entry_id: Any, entry_type: str, path: str = SQLITE_FILENAME) -> Optional[List[Any]]:
+    """Returns the pesada (date_str, entry_type, entry_id) in HEADERS order, or None if it is not stored."""
+    conn = _connect(path)
+    row = conn.execute(
+        f"SELECT {_SELECT_COLUMNS} FROM pesadas WHERE fecha = ? AND tipo = ? AND id = ?",
+        (date_str, entry_type, entry_id),
+    ).fetchone()
+    return None if row is None else _to_header_row(row)
+
+
+def load_rows(date_str: str, path: str = SQLITE_FILENAME) -> List[List[Any]]:
+    """Returns the rows stored for date_str in HEADERS order, in insertion order."""
+    conn = _connect(path)
+    cursor = conn.execute(
+        f"SELECT {_SELECT_COLUMNS} FROM pesadas WHERE fecha = ? ORDER BY rowid",
+        (date_str,),
+    )
+    return [_to_header_row(row) for row in cursor]
+
+
+def iter_all_rows(path: str = SQLITE_FILENAME) -> Iterator[Tuple[str, List[Any]]]:
+    """Yields (fecha, row) for every stored pesada, grouped by date in ascending order."""
+    conn = _connect(path)
+    cursor = conn.execute(f"SELECT fecha, {_SELECT_COLUMNS} FROM pesadas ORDER BY fecha, rowid")
+    for row in cursor:
+        yield row[0], _to_header_row(row[1:])
+
+
+def list_dates(path: str = SQLITE_FILENAME) -> List[str]:
+    """Returns every date (YYYY-MM-DD) that has at least one pesada, ascending."""
+    conn = _connect(path)
+    return [row[0] for row in conn.execute("SELECT DISTINCT fecha FROM pesadas ORDER BY fecha")]
+
+
+def dates_between(start_date: str, end_date: str, path: str = SQLITE_FILENAME) -> List[str]:
+    """Returns the dates in [start_date, end_date] that have at least one pesada, ascending."""
+    conn = _connect(path)
+    cursor = conn.execute(
+        "SELECT DISTINCT fecha FROM pesadas WHERE fecha BETWEEN ? AND ? ORDER BY fecha",
+        (start_date, end_date),
+    )
+    return [row[0] for row in cursor]
+
+
+def date_counts(entry_types: Iterable[str], start_date: str, end_date: str, path: str = SQLITE_FILENAME) -> List[Tuple[str, int]]:
+    """Returns (fecha, pesadas of entry_types) for the dates in [start_date, end_date], ascending."""
+    conn = _connect(path)
+    types_sql, params = sqlite_util.type_filter(entry_types)
+    cursor = conn.execute(
+        f"SELECT fecha, COUNT(*) FROM pesadas WHERE {types_sql} AND fecha BETWEEN ? AND ? GROUP BY fecha ORDER BY fecha",
+        params + [start_date, end_date],
+    )
+    return cursor.fetchall()
+
+
+# Sort keys accepted by page_keys -> column expression
+PAGE_ORDER_COLUMNS = {"id": "id", "neto": "peso_neto", "contraparte": "contraparte"}
+
+
+def page_keys(entry_types: Iterable[str], start_date: str, end_date: str, sort: str, descending: bool = False,
+              offset: int = 0, limit: int = -1, path: str = SQLITE_FILENAME) -> List[Tuple[str, str, int]]:
+    """
+    Returns one page of (fecha, tipo, id) in [start_date, end_date] ordered by `sort` (a PAGE_ORDER_COLUMNS key),
+    then by fecha, hora_ingreso and id; NULL sort values go last.
+    """
+    conn = _connect(path)
+    types_sql, params = sqlite_util.type_filter(entry_types)
+    column = PAGE_ORDER_COLUMNS[sort]
+    collate = " COLLATE NOCASE" if column == "contraparte" else ""
+    direction = "DESC" if descending else "ASC"
+    cursor = conn.execute(
+        f"SELECT fecha, tipo, id FROM pesadas WHERE {types_sql} AND fecha BETWEEN ? AND ? "
+        f"ORDER BY {column} IS NULL, {column}{collate} {direction}, fecha {direction}, "
+        f"COALESCE(hora_ingreso, '') {direction}, id {direction} LIMIT ? OFFSET ?",
+        params + [start_date, end_date, limit, offset],
+    )
+    return cursor.fetchall()
+
+
+def find_dates(entry_type: str, entry_id: Any, path: str = SQLITE_FILENAME) -> List[str]:
+    """Returns the dates holding the pesada (entry_type, entry_id), oldest first."""
+    conn = _connect(path)
+    cursor = conn.execute(
+        "SELECT fecha FROM pesadas WHERE tipo = ? AND id = ? ORDER BY fecha",
+        (entry_type, entry_id),
+    )
+    return [row[0] for row in cursor]
+
+
+def max_ids(path: str = SQLITE_FILENAME) -> Dict[str, int]:
+    """Returns the highest stored ID per entry type."""
+    conn = _connect(path)
+    result = {"Compra": 0, "Venta": 0}
+    for tipo, max_id in conn.execute("SELECT tipo, MAX(id) FROM pesadas GROUP BY tipo"):
+        if tipo in result and isinstance(max_id, int):
+            result[tipo] = max_id
+    return result
+
+
+def is_empty(path: str = SQLITE_FILENAME) -> bool:
+    """True when the store holds no pesadas yet."""
+    conn = _connect(path)
+    return conn.execute("SELECT 1 FROM pesadas LIMIT 1").fetchone() is None
+
+
+def bulk_insert(rows: Iterator[Tuple[str, List[Any]]], path: str = SQLITE_FILENAME) -> int:
+    """Inserts (fecha, row) pairs in one transaction, replacing duplicates. Returns the row count."""
+    conn = _connect(path)
+    placeholders = ", ".join("?" for _ in range(len(DATA_COLUMNS) + 3))
+    count = 0
+    with conn:
+        for date_str, data_row in rows:
+            conn.execute(
+                f"INSERT OR REPLACE INTO pesadas (fecha, tipo, id, {', '.join(DATA_COLUMNS)}) VALUES ({placeholders})",
+                [date_str, data_row[1]] + _row_values(data_row[0], data_row),
+            )
+            count += 1
+    return count
+
+
+def get_meta(key: str, path: str = SQLITE_FILENAME) -> Optional[str]:
+    conn = _connect(path)
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_meta(key: str, value: Optional[str], path: str = SQLITE_FILENAME):
+    conn = _connect(path)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def close(path: Optional[str] = None):
+    """Closes this thread's connection(s). Mainly useful for tools and shutdown."""
+    _connections.close(path)
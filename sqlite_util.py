@@ -0,0 +1,67 @@
+"""
+Shared SQLite plumbing for the store and its derived indexes.
+
+Every SQLite file (sqlite_store, id_index, search_index, daily_totals) is
+opened the same way: one connection per thread and path, WAL journal with
+synchronous=NORMAL, and the module's schema created once per path on first
+use. ConnectionPool does that; each module keeps one pool and passes in
+its own schema setup.
+"""
+
+import logging
+import sqlite3
+import threading
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("daily_excel_logger.sqlite_util")
+
+
+class ConnectionPool:
+    def __init__(self, label: str, init_schema: Callable[[sqlite3.Connection, str], None],
+                 pragmas: Sequence[str] = ()):
+        """
+        label names the files in log messages; init_schema(conn, path) runs once per path
+        (under a lock, committed afterwards); pragmas are extra PRAGMA statements per connection.
+        """
+        self.label = label
+        self.init_schema = init_schema
+        self.pragmas = tuple(pragmas)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._initialized_paths = set()
+
+    def connect(self, path: str) -> sqlite3.Connection:
+        """Returns this thread's connection to `path`, creating the schema on first use."""
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for pragma in self.pragmas:
+                conn.execute(f"PRAGMA {pragma}")
+            with self._schema_lock:
+                if path not in self._initialized_paths:
+                    self.init_schema(conn, path)
+                    conn.commit()
+                    self._initialized_paths.add(path)
+            connections[path] = conn
+        return conn
+
+    def close(self, path: Optional[str] = None):
+        """Closes this thread's connection(s). Mainly useful for tools and shutdown."""
+        connections = getattr(self._local, "connections", None) or {}
+        for conn_path in list(connections):
+            if path is None or conn_path == path:
+                try:
+                    connections.pop(conn_path).close()
+                except Exception as e:
+                    logger.warning(f"Error closing {self.label} connection {conn_path}: {e}")
+
+
+def type_filter(entry_types: Iterable[str]) -> Tuple[str, List[str]]:
+    """Returns the `tipo IN (...)` condition and its parameters for entry_types."""
+    entry_types = list(entry_types)
+    return f"tipo IN ({', '.join('?' for _ in entry_types)})", entry_types
@@ -0,0 +1,60 @@
+"""
+Herramientas de mantenimiento del almacenamiento de pesadas.
+
+Uso:
+    python storage_admin.py import   # copia daily_log.xlsx al almacén SQLite
+    python storage_admin.py export   # regenera daily_log.xlsx desde el almacén SQLite
+    python storage_admin.py reindex  # reconstruye los índices de IDs y de búsqueda y el resumen diario de daily_log.xlsx
+    python storage_admin.py split    # divide daily_log.xlsx en un libro por mes (EXCEL_SHARDING=monthly)
+"""
+
+import argparse
+import sys
+
+import daily_excel_logger
+
+
+def cmd_import(args):
+    count = daily_excel_logger.import_workbook(args.excel)
+    print(f"✓ {count} registros importados desde {args.excel}")
+
+
+def cmd_export(args):
+    sheets = daily_excel_logger.export_workbook(args.excel)
+    print(f"✓ {sheets} hojas exportadas a {args.excel}")
+
+
+def cmd_reindex(args):
+    sheets = daily_excel_logger.rebuild_id_index(args.excel)
+    print(f"✓ Índices de IDs y de búsqueda y resumen diario reconstruidos ({sheets} hojas/fechas)")
+
+
+def cmd_split(args):
+    if daily_excel_logger.EXCEL_SHARDING != "monthly":
+        print("✗ Configure EXCEL_SHARDING=monthly antes de dividir el libro; si no, el sistema seguiría usando el libro único.")
+        return 1
+    copied = daily_excel_logger.split_workbook(args.excel)
+    if not copied:
+        print(f"✓ Nada para dividir ({args.excel} no existe o no tiene hojas de fechas)")
+        return 0
+    for path, sheets in sorted(copied.items()):
+        print(f"  {path}: {sheets} hojas")
+    print(f"✓ {args.excel} dividido en {len(copied)} libros mensuales")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mantenimiento del almacenamiento de pesadas")
+    parser.add_argument("--excel", default=daily_excel_logger.EXCEL_FILENAME, help="Ruta del libro Excel")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("import", help="Importa el libro Excel al almacén SQLite").set_defaults(func=cmd_import)
+    subparsers.add_parser("export", help="Exporta el almacén SQLite al libro Excel").set_defaults(func=cmd_export)
+    subparsers.add_parser("reindex", help="Reconstruye los índices de IDs y de búsqueda y el resumen diario").set_defaults(func=cmd_reindex)
+    subparsers.add_parser("split", help="Divide el libro Excel en un libro por mes").set_defaults(func=cmd_split)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Single-writer actor for the live store.
+
+Every mutation coming from the API (upserts and deletes) is put on one
+asyncio queue. A single task drains it: whatever has queued up while the
+previous batch was being applied goes to `daily_excel_logger.apply_batch`
+as one batch, on one dedicated writer thread. That way no two requests
+ever mutate the workbook at the same time, a burst of writes costs one
+save, and readers keep using the last committed snapshot (the parsed
+sheet cache, re-filled after each batch) instead of waiting for the writer.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+import daily_excel_logger
+
+logger = logging.getLogger("daily_excel_logger.storage_writer")
+
+# Configuration
+WRITER_MAX_BATCH = int(os.getenv("WRITER_MAX_BATCH", "50"))
+
+
+class StorageWriter:
+    def __init__(self, filename: str = daily_excel_logger.EXCEL_FILENAME, max_batch: int = WRITER_MAX_BATCH):
+        self.filename = filename
+        self.max_batch = max(1, max_batch)
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-writer")
+        self.batches = 0
+        self.ops = 0
+
+    def _ensure_started(self):
+        if self.task is not None and not self.task.done():
+            return
+        loop = asyncio.get_running_loop()
+        if self.queue is None or self.loop is not loop:
+            # A queue only works on the loop it was created for: a new loop (server restarted in
+            # the same process) gets a new one, and whatever the old one held can no longer run
+            self._fail_pending(RuntimeError("Storage writer restarted on a new event loop"))
+            self.queue = asyncio.Queue()
+            self.loop = loop
+        # Same loop: keep the queue, so operations queued while the task was down still get applied
+        self.task = loop.create_task(self._run())
+
+    def _fail_pending(self, error: Exception):
+        while self.queue is not None and not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            if not future.done() and not future.get_loop().is_closed():
+                future.get_loop().call_soon_threadsafe(lambda f=future: f.done() or f.set_result(error))
+
+    async def start(self):
+        self._ensure_started()
+
+    async def stop(self):
+        """Applies whatever is still queued, then stops the writer task."""
+        if self.task is None:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def submit(self, op: Tuple[Any, ...]) -> Any:
+        """Queues one operation and waits until the writer has applied it. Re-raises its error."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((op, future))
+        result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def upsert(self, entry_id: int, entry_type: str, data_row: List[Any]) -> daily_excel_logger.CommitReceipt:
+        return await self.submit(("upsert", entry_id, entry_type, data_row))
+
+    async def delete(self, entry_id: int, entry_type: str) -> bool:
+        return await self.submit(("delete", entry_id, entry_type))
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "batches": self.batches,
+            "ops": self.ops,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            ops = [op for op, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.thread, daily_excel_logger.apply_batch, ops, self.filename)
+            except Exception as e:
+                logger.error(f"Storage writer failed to apply a batch of {len(ops)} op(s): {e}", exc_info=True)
+                results = [e] * len(ops)
+            self.batches += 1
+            self.ops += len(ops)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            # Callers already have their receipts; publish the committed snapshot for readers
+            try:
+                await loop.run_in_executor(self.thread, daily_excel_logger.refresh_snapshot, self.filename)
+            except Exception as e:
+                logger.warning(f"Could not refresh the committed snapshot: {e}")
+            for _ in batch:
+                self.queue.task_done()
+
+
+writer = StorageWriter()
@@ -0,0 +1,540 @@
+"""
+Tests for the Excel storage engine and the caches and indexes built on it.
+"""
+
+import sqlite3
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import openpyxl
+
+import daily_excel_logger
+import id_index
+import journal
+
+
+def _crash(filename, date_str):
+    """Forgets the live workbook without saving it, as if the process had died."""
+    path = daily_excel_logger._shard_path(date_str, filename)
+    with daily_excel_logger._live_lock:
+        state = daily_excel_logger._live_workbooks.pop(path)
+    if state.timer is not None:
+        state.timer.cancel()
+    if state.journal is not None:
+        state.journal.close()
+    daily_excel_logger.clear_cache()
+
+
+def _saved_ids(filename, date_str):
+    workbook = openpyxl.load_workbook(filename, read_only=True)
+    try:
+        return sorted((row[1], row[0]) for row in workbook[date_str].iter_rows(min_row=2, values_only=True) if row[0] is not None)
+    finally:
+        workbook.close()
+
+
+# --- Sheet cache ---
+
+def test_sheet_cache_serves_repeat_reads_until_the_date_changes(store, today, make_row):
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=store)
+    first = daily_excel_logger.load_data_by_date(today, store)
+    assert (store, today) in daily_excel_logger._sheet_cache
+    first["Compra"][0]["neto"] = 0  # Callers get copies: mutating one does not touch the cache
+    assert daily_excel_logger.load_data_by_date(today, store)["Compra"][0]["neto"] == 100.0
+
+    daily_excel_logger.upsert_data(2, "Compra", make_row(2, "Compra", "Beta", "Cobre", 50), filename=store)
+    assert (store, today) not in daily_excel_logger._sheet_cache
+    assert [e["id"] for e in daily_excel_logger.load_data_by_date(today, store)["Compra"]] == [1, 2]
+
+
+def test_sheet_cache_notices_outside_changes_to_the_workbook(store, make_row, write_workbook):
+    past = (date.today() - timedelta(days=3)).isoformat()
+    write_workbook(store, {past: [make_row(1, "Compra", "Acme", "Cobre", 100)]})
+    assert [e["id"] for e in daily_excel_logger.load_data_by_date(past, store)["Compra"]] == [1]
+    assert (store, past) in daily_excel_logger._sheet_cache
+
+    # Edited by hand (e.g. in Excel) while the server runs
+    write_workbook(store, {past: [make_row(1, "Compra", "Acme", "Cobre", 100), make_row(2, "Compra", "Beta", "Bronce", 75)]})
+    assert [e["id"] for e in daily_excel_logger.load_data_by_date(past, store)["Compra"]] == [1, 2]
+
+
+# --- Data versions ---
+
+def test_write_changes_only_the_version_of_its_date(store, today, make_row):
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=store)
+    version, _ = daily_excel_logger.data_version(today, today, store)
+    past_version, _ = daily_excel_logger.data_version(yesterday, yesterday, store)
+    whole, _ = daily_excel_logger.data_version(filename=store)
+    generation = daily_excel_logger.read_generation()
+    assert daily_excel_logger.data_version(today, today, store)[0] == version
+
+    daily_excel_logger.upsert_data(2, "Compra", make_row(2, "Compra", "Beta", "Cobre", 50), filename=store)
+    assert daily_excel_logger.data_version(today, today, store)[0] != version
+    assert daily_excel_logger.data_version(filename=store)[0] != whole
+    assert daily_excel_logger.read_generation() != generation
+    assert daily_excel_logger.data_version(yesterday, yesterday, store)[0] == past_version
+
+
+def test_own_saves_do_not_count_as_outside_changes(store, today, make_row, write_workbook):
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=store)
+    daily_excel_logger.flush(store)
+    generation = daily_excel_logger.read_generation()
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 120), filename=store)
+    version = daily_excel_logger.data_version(today, today, store)[0]
+    daily_excel_logger.flush(store)
+    assert daily_excel_logger.data_version(today, today, store)[0] == version
+    assert daily_excel_logger._file_versions[store][1] == 0
+    assert daily_excel_logger.read_generation()[1] == generation[1]
+
+    # An edit made outside the process does
+    daily_excel_logger.clear_cache()
+    write_workbook(store, {today: [make_row(1, "Compra", "Acme", "Cobre", 90)]})
+    assert daily_excel_logger.data_version(today, today, store)[0] != version
+    assert daily_excel_logger._file_versions[store][1] == 1
+    assert daily_excel_logger.read_generation()[1] == generation[1] + 1
+
+
+# --- Commit receipts ---
+
+def test_receipt_confirms_only_journaled_writes_that_are_synced(store, today, make_row):
+    receipt = daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=store)
+    assert (receipt.sheet, receipt.entry_id, receipt.entry_type) == (today, 1, "Compra")
+    assert receipt.confirms(1, "Compra")
+    assert not receipt.confirms(1, "Venta")
+
+    # Applied to the workbook but not fsync'd yet: not committed
+    state = daily_excel_logger._get_live_workbook(daily_excel_logger._shard_path(today, store), store)
+    row = make_row(2, "Compra", "Beta", "Cobre", 50)
+    with state.lock:
+        record = daily_excel_logger._journal_append(state, "upsert", 2, "Compra", today, row)
+        pending = daily_excel_logger._upsert_in_workbook(state, 2, "Compra", row, today, record)
+        assert not pending.confirms(2, "Compra")
+        daily_excel_logger._journal_sync(state)
+        daily_excel_logger._mark_pending(state)
+    assert pending.confirms(2, "Compra")
+
+
+# --- Journal ---
+
+def test_journal_replays_unsaved_writes_after_a_crash(store, today, make_row):
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=store)
+    daily_excel_logger.flush(store)
+    daily_excel_logger.upsert_data(2, "Compra", make_row(2, "Compra", "Beta", "Cobre", 50), filename=store)
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Bronce", 120), filename=store)
+    daily_excel_logger.delete_data(2, "Compra", filename=store)
+    daily_excel_logger.upsert_data(1, "Venta", make_row(1, "Venta", "Gamma", "Cobre", 30), filename=store)
+    _crash(store, today)
+    assert _saved_ids(store, today) == [("Compra", 1)]
+
+    assert daily_excel_logger.recover(store) == 4
+    data = daily_excel_logger.load_data_by_date(today, store)
+    assert [(e["id"], e["mercaderia"], e["neto"]) for e in data["Compra"]] == [(1, "Bronce", 120.0)]
+    assert [(e["id"], e["cliente"]) for e in data["Venta"]] == [(1, "Gamma")]
+
+    assert daily_excel_logger.flush(store)
+    assert _saved_ids(store, today) == [("Compra", 1), ("Venta", 1)]
+    assert journal.Journal(journal.journal_path(store)).read() == []
+
+
+def test_recover_without_journal_does_not_load_the_workbook(store, today, make_row):
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=store)
+    daily_excel_logger.flush(store)
+    _crash(store, today)
+
+    assert daily_excel_logger.recover(store) == 0
+    assert daily_excel_logger._shard_path(today, store) not in daily_excel_logger._live_workbooks
+
+
+def test_journal_truncate_keeps_records_after_the_mark(tmp_path):
+    log = journal.Journal(str(tmp_path / "daily_log.journal.jsonl"))
+    first = log.append({"op": "upsert", "id": 1})
+    mark = log.mark()
+    second = log.append({"op": "upsert", "id": 2})
+    assert not log.is_synced(first)
+    log.sync()
+    assert log.is_synced(second)
+
+    log.truncate(mark)  # A save of a snapshot taken at `mark` holds record 1 only
+    assert [record["id"] for record in log.read()] == [2]
+    log.truncate()
+    assert log.read() == []
+    log.close()
+
+
+
+# --- Sheet schema migrations ---
+
+def _original_layout(row):
+    """The row as sheets written before 'Incoterm' and 'Remito' existed hold it."""
+    return [value for i, value in enumerate(row) if daily_excel_logger.HEADERS[i] not in ("Incoterm", "Remito")]
+
+
+def _write_original_layout(filename, date_str, rows):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    sheet = workbook.create_sheet(title=date_str)
+    sheet.append(_original_layout(daily_excel_logger.HEADERS))
+    for row in rows:
+        sheet.append(_original_layout(row))
+    workbook.save(filename)
+
+
+def test_sheet_is_migrated_once_and_keeps_its_values(store, today, make_row, monkeypatch):
+    old_row = make_row(1, "Compra", "Acme", "Cobre", 100, plate="AB123CD")
+    old_row[-1] = "primera"
+    _write_original_layout(store, today, [old_row])
+
+    daily_excel_logger.upsert_data(2, "Compra", make_row(2, "Compra", "Beta", "Cobre", 50), filename=store)
+    state = daily_excel_logger._live_workbooks[daily_excel_logger._shard_path(today, store)]
+    assert state.sheet_schemas[today] == daily_excel_logger.SHEET_SCHEMA_VERSION
+    assert [cell.value for cell in state.workbook[today][1]] == daily_excel_logger.HEADERS
+
+    # Later writes to the sheet take the layout for granted
+    def fail(*args, **kwargs):
+        raise AssertionError("sheet migrated twice")
+    monkeypatch.setattr(daily_excel_logger, "_migrate_sheet", fail)
+    daily_excel_logger.upsert_data(3, "Compra", make_row(3, "Compra", "Gamma", "Cobre", 30), filename=store)
+
+    daily_excel_logger.flush(store)
+    daily_excel_logger.clear_cache()
+    first = daily_excel_logger.load_data_by_date(today, store)["Compra"][0]
+    assert (first["id"], first["patente"], first["observaciones"]) == (1, "AB123CD", "primera")
+    assert _saved_ids(store, today) == [("Compra", 1), ("Compra", 2), ("Compra", 3)]
+
+
+def test_migrate_add_incoterm_drops_the_row_index_only_if_id_or_type_moved(store, today, make_row):
+    _write_original_layout(store, today, [make_row(1, "Compra", "Acme", "Cobre", 100, plate="AB123CD")])
+    state = daily_excel_logger._get_live_workbook(daily_excel_logger._shard_path(today, store), store)
+    with state.lock:
+        sheet = state.workbook[today]
+        daily_excel_logger._get_row_index(state, sheet)
+        headers = [cell.value for cell in sheet[1]]
+        daily_excel_logger._migrate_add_incoterm(sheet, headers, state)  # After 'Patente': ID and Type stay put
+        assert [cell.value for cell in sheet[1]][11:13] == ["Patente", "Incoterm"]
+        assert sheet.cell(row=2, column=12).value == "AB123CD"
+        assert daily_excel_logger._find_row_by_id_and_type(state, sheet, 1, "Compra") == 2
+
+        moved = state.workbook.create_sheet(title="2000-01-01")
+        moved.append(["Patente", "Registro ID", "Tipo Operación"])
+        daily_excel_logger._get_row_index(state, moved)
+        daily_excel_logger._migrate_add_incoterm(moved, ["Patente", "Registro ID", "Tipo Operación"], state)
+        assert [cell.value for cell in moved[1]] == ["Patente", "Incoterm", "Registro ID", "Tipo Operación"]
+        assert moved.title not in state.row_indexes
+
+
+# --- Background saves ---
+
+def test_save_caches_todays_sheet_before_serializing(store, today, make_row, monkeypatch):
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=store)
+    assert (store, today) not in daily_excel_logger._sheet_cache
+    serialize = daily_excel_logger._serialize_workbook
+    cached_while_serializing = []
+
+    def spy(workbook):
+        cached_while_serializing.append((store, today) in daily_excel_logger._sheet_cache)
+        return serialize(workbook)
+    monkeypatch.setattr(daily_excel_logger, "_serialize_workbook", spy)
+
+    assert daily_excel_logger.flush(store)
+    assert cached_while_serializing == [True]
+    # Our own save keeps the cached sheet valid
+    assert daily_excel_logger._cache_get(store, today) is not None
+    assert _saved_ids(store, today) == [("Compra", 1)]
+
+
+# --- Range reads ---
+
+def _seed_days(store, write_workbook, make_row):
+    first = date.today() - timedelta(days=10)
+    days = [(first + timedelta(days=n)).isoformat() for n in range(4)]
+    sheets = {
+        days[0]: [make_row(1, "Compra", "A", "Cobre", 10), make_row(1, "Venta", "B", "Cobre", 11), make_row(2, "Compra", "C", "Cobre", 12)],
+        # days[1] has no sheet
+        days[2]: [make_row(3, "Compra", "D", "Bronce", 13), make_row(2, "Venta", "E", "Cobre", 14)],
+        days[3]: [make_row(4, "Compra", "F", "Cobre", 15), make_row(5, "Compra", "G", "Cobre", 16), make_row(3, "Venta", "H", "Cobre", 17),
+                  make_row(6, "Compra", "I", "Bronce", 18)],
+    }
+    write_workbook(store, sheets)
+    return days
+
+
+def _keys(items):
+    return [(date_str, tipo, entry["id"]) for date_str, tipo, entry in items]
+
+
+def test_load_range_reads_dates_in_order(store, write_workbook, make_row):
+    days = _seed_days(store, write_workbook, make_row)
+    items = _keys(daily_excel_logger.load_range(days[0], days[3], filename=store))
+    assert len(items) == 9
+    assert [d for d, _, _ in items] == sorted(d for d, _, _ in items)
+    assert items[:3] == [(days[0], "Compra", 1), (days[0], "Compra", 2), (days[0], "Venta", 1)]
+    assert _keys(daily_excel_logger.load_range(days[1], days[2], "Venta", filename=store)) == [(days[2], "Venta", 2)]
+
+
+# --- Paged reads ---
+
+def test_load_page_offsets_match_the_full_range(store, write_workbook, make_row):
+    days = _seed_days(store, write_workbook, make_row)
+    everything = _keys(daily_excel_logger.load_range(days[0], days[3], filename=store))
+    for offset, limit in [(0, 2), (2, 3), (3, 1), (5, 10), (8, 5), (9, 3), (20, 5)]:
+        page, total = daily_excel_logger.load_page(days[0], days[3], offset=offset, limit=limit, filename=store)
+        assert total == 9
+        assert _keys(page) == everything[offset:offset + limit], (offset, limit)
+
+    page, total = daily_excel_logger.load_page(days[0], days[3], descending=True, offset=1, limit=3, filename=store)
+    assert _keys(page) == list(reversed(everything))[1:4]
+
+    compras = [key for key in everything if key[1] == "Compra"]
+    page, total = daily_excel_logger.load_page(days[0], days[3], "Compra", offset=2, limit=2, filename=store)
+    assert (total, _keys(page)) == (len(compras), compras[2:4])
+
+    page, total = daily_excel_logger.load_page(days[0], days[3], "Compra", sort="id", descending=True, offset=1, limit=2, filename=store)
+    assert total == 6
+    assert [entry["id"] for _, _, entry in page] == [5, 4]
+
+
+def test_load_page_counts_rows_when_a_sheet_repeats_a_key(store, write_workbook, make_row):
+    first = (date.today() - timedelta(days=5)).isoformat()
+    second = (date.today() - timedelta(days=4)).isoformat()
+    write_workbook(store, {
+        # Edited by hand: ID 1 appears twice
+        first: [make_row(1, "Compra", "A", "Cobre", 10), make_row(1, "Compra", "B", "Cobre", 11),
+                make_row(2, "Compra", "C", "Cobre", 12), make_row(3, "Compra", "D", "Cobre", 13)],
+        second: [make_row(4, "Compra", "E", "Cobre", 14), make_row(5, "Compra", "F", "Cobre", 15)],
+    })
+    everything = _keys(daily_excel_logger.load_range(first, second, filename=store))
+    assert len(everything) == 6
+    for offset in range(7):
+        page, total = daily_excel_logger.load_page(first, second, offset=offset, limit=2, filename=store)
+        assert total == 6
+        assert _keys(page) == everything[offset:offset + 2], offset
+
+    # The ID index lists a repeated key once, so sorting by ID scans the range instead
+    page, total = daily_excel_logger.load_page(first, second, sort="id", limit=3, filename=store)
+    assert total == 6
+    assert [entry["id"] for _, _, entry in page] == [1, 1, 2]
+
+
+def test_id_index_counts_rows_per_key(tmp_path):
+    path = str(tmp_path / "daily_log.index.db")
+    rows = [[1, "Compra"], [1, "Compra"], [2, "Compra"], [1, "Venta"]]
+    id_index.replace_sheet(path, "2024-05-02", None, rows)
+    assert id_index.date_counts(path, ("Compra",), "2024-05-01", "2024-05-31") == [("2024-05-02", 3)]
+    assert id_index.has_repeated_keys(path, ("Compra",), "2024-05-01", "2024-05-31")
+    assert not id_index.has_repeated_keys(path, ("Venta",), "2024-05-01", "2024-05-31")
+
+    id_index.remove_entry(path, "Compra", 1, "2024-05-02")  # One of the two rows
+    assert id_index.find_dates(path, "Compra", 1) == ["2024-05-02"]
+    assert not id_index.has_repeated_keys(path, ("Compra",), "2024-05-01", "2024-05-31")
+    id_index.remove_entry(path, "Compra", 1, "2024-05-02")
+    assert id_index.find_dates(path, "Compra", 1) == []
+
+
+def test_id_index_without_row_counts_is_rebuilt(tmp_path):
+    path = str(tmp_path / "daily_log.index.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE entry_dates (tipo TEXT NOT NULL, id INTEGER NOT NULL, fecha TEXT NOT NULL, PRIMARY KEY (tipo, id, fecha));
+        CREATE TABLE sheets (fecha TEXT PRIMARY KEY, fingerprint TEXT);
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        INSERT INTO entry_dates VALUES ('Compra', 1, '2024-05-02');
+        INSERT INTO sheets VALUES ('2024-05-02', 'abc');
+        INSERT INTO meta VALUES ('built', '1');
+    """)
+    conn.close()
+    assert id_index.get_meta(path, "built") == "0"
+    assert id_index.sheet_fingerprints(path) == {}
+    assert id_index.date_counts(path, ("Compra",), "2024-05-01", "2024-05-31") == [("2024-05-02", 1)]
+
+
+# --- Daily rollup ---
+
+def _totals(store, date_str):
+    return {
+        (t.tipo, t.mercaderia, t.contraparte): (t.count, t.sum_neto, t.sum_importe, t.min_neto, t.max_neto)
+        for t in daily_excel_logger.load_daily_totals(date_str, date_str, store)
+    }
+
+
+def test_rollup_follows_upserts_edits_and_deletes(store, today, make_row):
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100, 1000), filename=store)
+    daily_excel_logger.upsert_data(2, "Compra", make_row(2, "Compra", "Acme", "Cobre", 300, 3000), filename=store)
+    daily_excel_logger.upsert_data(3, "Compra", make_row(3, "Compra", "Acme", "Cobre", 200), filename=store)
+    daily_excel_logger.upsert_data(1, "Venta", make_row(1, "Venta", "Beta", "Bronce", 40, 400), filename=store)
+    assert _totals(store, today) == {
+        ("Compra", "Cobre", "Acme"): (3, 600.0, 4000.0, 100.0, 300.0),
+        ("Venta", "Bronce", "Beta"): (1, 40.0, 400.0, 40.0, 40.0),
+    }
+
+    # Moving a row to another group, and clearing a field, update both groups
+    daily_excel_logger.upsert_data(3, "Compra", make_row(3, "Compra", None, "Bronce", 250), filename=store)
+    daily_excel_logger.delete_data(1, "Venta", filename=store)
+    assert _totals(store, today) == {
+        ("Compra", "Cobre", "Acme"): (2, 400.0, 4000.0, 100.0, 300.0),
+        ("Compra", "Bronce", None): (1, 250.0, 0.0, 250.0, 250.0),
+    }
+
+
+def test_rollup_extremes_are_recomputed_on_save(store, today, make_row):
+    for entry_id, neto in [(1, 100), (2, 300), (3, 200)]:
+        daily_excel_logger.upsert_data(entry_id, "Compra", make_row(entry_id, "Compra", "Acme", "Cobre", neto), filename=store)
+    assert _totals(store, today)[("Compra", "Cobre", "Acme")] == (3, 600.0, 0.0, 100.0, 300.0)  # Builds the rollup
+    daily_excel_logger.delete_data(2, "Compra", filename=store)  # Removes the maximum
+    count, sum_neto, _, min_neto, max_neto = _totals(store, today)[("Compra", "Cobre", "Acme")]
+    assert (count, sum_neto) == (2, 300.0)
+    assert (min_neto, max_neto) == (None, None)  # Unknown until the date is recomputed
+
+    daily_excel_logger.flush(store)
+    assert _totals(store, today)[("Compra", "Cobre", "Acme")] == (2, 300.0, 0.0, 100.0, 200.0)
+
+
+# --- Time series ---
+
+_SERIES_DAYS = {
+    "2024-01-30": [("Compra", 1, "Acme", 100), ("Compra", 2, "Beta", 50), ("Venta", 1, "Gamma", 30)],
+    "2024-01-31": [("Compra", 3, "Acme", 20)],
+    "2024-02-01": [("Compra", 4, "Beta", 10)],
+    "2024-02-05": [("Compra", 5, "Acme", 5)],
+}
+
+
+def _seed_series(store, write_workbook, make_row):
+    write_workbook(store, {
+        day: [make_row(entry_id, tipo, party, "Cobre", neto) for tipo, entry_id, party, neto in rows]
+        for day, rows in _SERIES_DAYS.items()
+    })
+
+
+def _count_series_computes(monkeypatch):
+    calls = []
+    compute = daily_excel_logger._compute_series
+
+    def spy(first, last, *args):
+        calls.append((first.isoformat(), last.isoformat()))
+        return compute(first, last, *args)
+    monkeypatch.setattr(daily_excel_logger, "_compute_series", spy)
+    return calls
+
+
+def test_series_buckets_by_day_week_and_month(store, write_workbook, make_row):
+    _seed_series(store, write_workbook, make_row)
+    series = lambda bucket, **kwargs: daily_excel_logger.load_series("2024-01-01", "2024-02-29", bucket, filename=store, **kwargs)
+    assert series("day", entry_type="Compra") == [
+        ("2024-01-30", None, 150.0), ("2024-01-31", None, 20.0), ("2024-02-01", None, 10.0), ("2024-02-05", None, 5.0),
+    ]
+    # Weeks start on Monday: 2024-01-29 holds the last days of January and the first of February
+    assert series("week", entry_type="Compra") == [("2024-01-29", None, 180.0), ("2024-02-05", None, 5.0)]
+    assert series("month", entry_type="Compra") == [("2024-01-01", None, 170.0), ("2024-02-01", None, 15.0)]
+    assert sorted(series("month", metric="count", group_by="contraparte")) == [
+        ("2024-01-01", "Acme", 2.0), ("2024-01-01", "Beta", 1.0), ("2024-01-01", "Gamma", 1.0),
+        ("2024-02-01", "Acme", 1.0), ("2024-02-01", "Beta", 1.0),
+    ]
+
+
+def test_closed_buckets_are_cached_until_one_of_their_dates_changes(store, write_workbook, make_row, monkeypatch):
+    _seed_series(store, write_workbook, make_row)
+    expected = [("2024-01-01", None, 170.0), ("2024-02-01", None, 15.0)]
+    assert daily_excel_logger.load_series("2024-01-01", "2024-02-29", "month", entry_type="Compra", filename=store) == expected
+    calls = _count_series_computes(monkeypatch)
+    assert daily_excel_logger.load_series("2024-01-01", "2024-02-29", "month", entry_type="Compra", filename=store) == expected
+    assert calls == []
+    # A range cutting a month in half computes that part; it is not cached as the whole month
+    assert daily_excel_logger.load_series("2024-01-01", "2024-02-03", "month", entry_type="Compra", filename=store) == [
+        ("2024-01-01", None, 170.0), ("2024-02-01", None, 10.0),
+    ]
+    assert calls == [("2024-02-01", "2024-02-03")]
+
+    # A late write to 2024-02-05 (a journal replayed after a crash) drops February only
+    log = journal.Journal(journal.journal_path(store))
+    log.append({"op": "upsert", "date": "2024-02-05", "id": 6, "tipo": "Compra", "row": make_row(6, "Compra", "Beta", "Cobre", 7)})
+    log.sync()
+    log.close()
+    assert daily_excel_logger.recover(store) == 1
+    del calls[:]
+    assert daily_excel_logger.load_series("2024-01-01", "2024-02-29", "month", entry_type="Compra", filename=store) == [
+        ("2024-01-01", None, 170.0), ("2024-02-01", None, 22.0),
+    ]
+    assert calls == [("2024-02-01", "2024-02-29")]
+
+
+def test_series_without_numpy_match_the_columnar_ones(store, write_workbook, make_row, monkeypatch):
+    _seed_series(store, write_workbook, make_row)
+    args = ("2024-01-01", "2024-02-29", "week", "neto", "contraparte")
+    columnar = daily_excel_logger.load_series(*args, filename=store)
+    monkeypatch.setattr(daily_excel_logger.analytics, "NUMPY_AVAILABLE", False)
+    monkeypatch.setattr(daily_excel_logger, "_series_cache", OrderedDict())
+    monkeypatch.setattr(daily_excel_logger, "_series_keys", {})
+    assert daily_excel_logger.load_totals_frame(store) is None
+    assert sorted(daily_excel_logger.load_series(*args, filename=store)) == sorted(columnar)
+    assert sorted(columnar) == [
+        ("2024-01-29", "Acme", 120.0), ("2024-01-29", "Beta", 60.0), ("2024-01-29", "Gamma", 30.0), ("2024-02-05", "Acme", 5.0),
+    ]
+
+
+# --- Daily balance window ---
+
+def _day(offset):
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+def _seed_balances(store, write_workbook, make_row):
+    """Days -30 to -1 before today: 10 kg bought on each, plus 4 kg sold on the even ones."""
+    sheets = {}
+    for offset in range(-30, 0):
+        rows = [make_row(1, "Compra", "Acme", "Cobre", 10)]
+        if offset % 2 == 0:
+            rows.append(make_row(1, "Venta", "Gamma", "Cobre", 4))
+        sheets[_day(offset)] = rows
+    write_workbook(store, sheets)
+
+
+def _count_balance_computes(monkeypatch):
+    calls = []
+    compute = daily_excel_logger._compute_balances
+
+    def spy(first, last, filename):
+        calls.append((first, last))
+        return compute(first, last, filename)
+    monkeypatch.setattr(daily_excel_logger, "_compute_balances", spy)
+    return calls
+
+
+def test_balance_window_computes_only_what_it_adds(store, write_workbook, make_row, monkeypatch):
+    _seed_balances(store, write_workbook, make_row)
+    calls = _count_balance_computes(monkeypatch)
+    balances = daily_excel_logger.load_daily_balances(_day(-6), _day(-4), store)
+    assert balances == {_day(-6): 6.0, _day(-5): 10.0, _day(-4): 6.0}
+    assert calls == [(_day(-6), _day(-4))]
+
+    # Growing the request on both sides computes the two edges only
+    del calls[:]
+    balances = daily_excel_logger.load_daily_balances(_day(-8), _day(-2), store)
+    assert sorted(balances) == [_day(offset) for offset in range(-8, -1)]
+    assert calls == [(_day(-8), _day(-7)), (_day(-3), _day(-2))]
+
+    # Today is never cached: after the first request that reaches it, it is all that is computed
+    daily_excel_logger.load_daily_balances(_day(-8), _day(0), store)
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 25), filename=store)
+    del calls[:]
+    balances = daily_excel_logger.load_daily_balances(_day(-8), _day(0), store)
+    assert calls == [(_day(0), _day(0))]
+    assert (balances[_day(-1)], balances[_day(0)]) == (10.0, 25.0)
+
+
+def test_balance_request_away_from_the_window_is_computed_on_its_own(store, write_workbook, make_row, monkeypatch):
+    _seed_balances(store, write_workbook, make_row)
+    daily_excel_logger.load_daily_balances(_day(-6), _day(-1), store)
+    calls = _count_balance_computes(monkeypatch)
+    # Not the 20 days between the request and the cached span
+    assert daily_excel_logger.load_daily_balances(_day(-30), _day(-28), store) == {
+        _day(-30): 6.0, _day(-29): 10.0, _day(-28): 6.0,
+    }
+    assert calls == [(_day(-30), _day(-28))]
+
+    # It replaced the cached span
+    del calls[:]
+    daily_excel_logger.load_daily_balances(_day(-30), _day(-28), store)
+    assert calls == []
+    daily_excel_logger.load_daily_balances(_day(-3), _day(-1), store)
+    assert calls == [(_day(-3), _day(-1))]
@@ -0,0 +1,92 @@
+"""
+Tests for the shared (single-flight) reads of the I/O pool.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+import daily_excel_logger
+import executors
+
+
+@pytest.fixture
+def shared_reads(monkeypatch):
+    """A fresh _SingleFlight, so the counters only see this test's calls."""
+    flight = executors._SingleFlight()
+    monkeypatch.setattr(executors, "_shared_reads", flight)
+    return flight
+
+
+@pytest.fixture
+def gated_read():
+    """A read that blocks until released: (read, calls, release). calls lists the arguments of each run."""
+    calls = []
+    release = threading.Event()
+
+    def read(arg):
+        calls.append(arg)
+        assert release.wait(5)
+        return [arg]
+    return read, calls, release
+
+
+async def _until(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_identical_concurrent_reads_share_one_call(shared_reads, gated_read):
+    read, calls, release = gated_read
+
+    async def scenario():
+        tasks = [asyncio.create_task(executors.run_io_shared(1, read, arg)) for arg in ("a", "a", "a", "b")]
+        await _until(lambda: len(calls) == 2)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(scenario())
+    assert sorted(calls) == ["a", "b"]
+    assert results == [["a"], ["a"], ["a"], ["b"]]
+    assert results[0] is results[1] is results[2]  # The same result object: callers must not modify it
+    assert shared_reads.stats() == {"in_flight": 0, "started": 2, "joined": 2}
+
+
+def test_a_write_starts_a_new_generation(shared_reads, gated_read, store, make_row):
+    read, calls, release = gated_read
+
+    async def scenario():
+        before = asyncio.create_task(executors.run_io_shared(daily_excel_logger.read_generation(), read, "a"))
+        await _until(lambda: len(calls) == 1)
+        daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=store)
+        # Arrives while the first read runs, but after the write: it must not get that read's result
+        after = asyncio.create_task(executors.run_io_shared(daily_excel_logger.read_generation(), read, "a"))
+        await _until(lambda: len(calls) == 2)
+        release.set()
+        return await asyncio.gather(before, after)
+
+    first, second = asyncio.run(scenario())
+    assert first == second == ["a"] and first is not second
+    assert shared_reads.stats() == {"in_flight": 0, "started": 2, "joined": 0}
+
+
+def test_cancelling_one_caller_does_not_cancel_the_shared_call(shared_reads, gated_read):
+    read, calls, release = gated_read
+
+    async def scenario():
+        leaving = asyncio.create_task(executors.run_io_shared(1, read, "a"))
+        staying = asyncio.create_task(executors.run_io_shared(1, read, "a"))
+        await _until(lambda: len(calls) == 1)
+        leaving.cancel()  # E.g. its client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        release.set()
+        return await staying
+
+    assert asyncio.run(scenario()) == ["a"]
+    assert calls == ["a"]
+    assert shared_reads.stats() == {"in_flight": 0, "started": 1, "joined": 1}
@@ -0,0 +1,97 @@
+"""
+Tests for the API layer in main.py that do not need the storage: parameter checks and the middleware.
+"""
+
+import asyncio
+from typing import Optional
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.responses import Response
+
+import daily_excel_logger
+import response_cache
+
+
+@pytest.fixture(scope="module")
+def main():
+    """main.py, imported once the storage log is already redirected (importing it reads config.json and users.json)."""
+    import main
+    return main
+
+
+def test_balance_window_rejects_days_out_of_range(main):
+    for days in (0, -1, main.BALANCE_MAX_DAYS + 1):
+        with pytest.raises(HTTPException) as raised:
+            asyncio.run(main.get_balance_window(days=days, end_date=None, current_user=None, cached=None))
+        assert raised.value.status_code == 400
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(main.get_balance_window(days=5, end_date="17/10/2026", current_user=None, cached=None))
+    assert raised.value.status_code == 400
+
+
+# --- Response cache ---
+
+@pytest.fixture
+def cached_app(main, monkeypatch):
+    """
+    An app with main's middleware and conditional_get(cache=True) routes, a fresh cache and a data
+    version set by the test. Returns (client, cache, version, calls): calls counts endpoint runs per route.
+    """
+    cache = response_cache.ResponseCache(max_entries=8, max_bytes=4096, ttl=60)
+    monkeypatch.setattr(response_cache, "cache", cache)
+    version = ["v1"]
+    monkeypatch.setattr(daily_excel_logger, "data_version", lambda first, last: (version[0], 0.0))
+    calls = {"json": 0, "big": 0, "stream": 0}
+    app = FastAPI()
+    app.add_middleware(main.DataVersionMiddleware)
+    cached_get = main.conditional_get(scope="date", cache=True)
+
+    @app.get("/json")
+    async def json_route(cached: Optional[Response] = Depends(cached_get)):
+        if cached is not None:
+            return cached
+        calls["json"] += 1
+        return {"run": calls["json"]}
+
+    @app.get("/big")
+    async def big_route(cached: Optional[Response] = Depends(cached_get)):
+        if cached is not None:
+            return cached
+        calls["big"] += 1
+        return {"run": calls["big"], "filler": "x" * 2048}
+
+    @app.get("/stream")
+    async def stream_route(cached: Optional[Response] = Depends(cached_get)):
+        if cached is not None:
+            return cached
+        calls["stream"] += 1
+        return StreamingResponse(iter([b"%PDF", b"-1.4"]), media_type="application/pdf")
+
+    return TestClient(app), cache, version, calls
+
+
+def test_cached_response_is_returned_without_running_the_endpoint(cached_app):
+    client, cache, version, calls = cached_app
+    first = client.get("/json")
+    second = client.get("/json")
+    assert first.json() == second.json() == {"run": 1}
+    assert calls["json"] == 1
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["content-type"] == "application/json"
+    assert client.get("/json", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    version[0] = "v2"  # A write to the date
+    assert client.get("/json").json() == {"run": 2}
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_streams_and_large_bodies_are_passed_through(cached_app):
+    client, cache, _, calls = cached_app
+    for _ in range(2):
+        assert client.get("/stream").content == b"%PDF-1.4"
+        assert client.get("/big").json()["filler"] == "x" * 2048
+    assert (calls["stream"], calls["big"]) == (2, 2)
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,49 @@
+"""
+Tests for the rendered-response cache: version checks, expiry of today's entries and the size bounds.
+"""
+
+import response_cache
+
+
+def _cache(max_entries=8, max_bytes=1 << 20, ttl=60):
+    return response_cache.ResponseCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+
+def test_entry_is_served_only_for_its_version():
+    cache = _cache()
+    cache.put(("/compras", "2024-05-02"), "v1", 200, {"content-type": "application/json"}, b"[1]", includes_today=False)
+    entry = cache.get(("/compras", "2024-05-02"), "v1")
+    assert (entry.status_code, entry.headers, entry.body) == (200, {"content-type": "application/json"}, b"[1]")
+
+    # A write to the date moved its version: the entry is dropped, not served
+    assert cache.get(("/compras", "2024-05-02"), "v2") is None
+    assert cache.get(("/compras", "2024-05-02"), "v1") is None
+    assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 1, "misses": 2, "invalidations": 1, "expirations": 0, "evictions": 0}
+
+
+def test_entries_that_include_today_expire(monkeypatch):
+    cache = _cache(ttl=30)
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache.put("today", "v1", 200, {}, b"[]", includes_today=True)
+    cache.put("past", "v1", 200, {}, b"[]", includes_today=False)
+    now[0] += 31
+    assert cache.get("today", "v1") is None
+    assert cache.get("past", "v1") is not None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_cache_is_bounded_by_entries_and_bytes():
+    cache = _cache(max_entries=2, max_bytes=40)
+    assert cache.fits(10) and not cache.fits(11)
+    cache.put("huge", "v1", 200, {}, b"x" * 11, includes_today=False)
+    assert cache.get("huge", "v1") is None  # Over a quarter of the budget: never stored
+
+    for key in ("a", "b", "c"):
+        cache.put(key, "v1", 200, {}, b"x" * 10, includes_today=False)
+    assert cache.get("a", "v1") is None  # Least recently used
+    assert cache.get("b", "v1") is not None
+    cache.put("d", "v1", 200, {}, b"x" * 10, includes_today=False)
+    assert cache.get("c", "v1") is None
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["bytes"] == 20
@@ -0,0 +1,93 @@
+"""
+Tests for the full-text search index: folding, the trigram and word-prefix paths, and updates on edit/delete.
+"""
+
+import sqlite3
+
+import pytest
+
+import daily_excel_logger
+import search_index
+
+trigram_only = pytest.mark.skipif(sqlite3.sqlite_version_info < (3, 34), reason="SQLite without the trigram tokenizer")
+
+
+def _index(tmp_path, name="daily_log.search.db"):
+    path = str(tmp_path / name)
+    search_index.upsert(path, "Compra", 1, "2024-05-02", {"contraparte": "PÉREZ Hnos", "patente": "AB 123 CD", "mercaderia": "Cobre"})
+    search_index.upsert(path, "Compra", 2, "2024-05-03", {"contraparte": "Gómez", "chofer": "Iñaki", "mercaderia": "Bronce"})
+    search_index.upsert(path, "Venta", 1, "2024-05-03", {"contraparte": "Perez Metales", "patente": "xy-987-zz", "mercaderia": "Cobre"})
+    return path
+
+
+def _found(path, query, **kwargs):
+    return sorted((hit["tipo"], hit["id"]) for hit in search_index.search(path, query, **kwargs))
+
+
+def test_fold_lowercases_and_strips_accents():
+    assert search_index.fold("PÉREZ Iñaki ") == "perez inaki"
+    assert search_index.fold(None) == ""
+
+
+def test_search_ignores_case_and_accents(tmp_path):
+    path = _index(tmp_path)
+    assert _found(path, "perez") == [("Compra", 1), ("Venta", 1)]
+    assert _found(path, "GOMEZ bronce") == [("Compra", 2)]
+    assert _found(path, "inaki") == [("Compra", 2)]
+    hit = search_index.search(path, "gomez")[0]
+    assert (hit["contraparte"], hit["chofer"]) == ("Gómez", "Iñaki")  # Shown as stored
+    assert _found(path, "perez", entry_type="Venta") == [("Venta", 1)]
+    assert _found(path, "cobre", start_date="2024-05-03") == [("Venta", 1)]
+    assert _found(path, "inexistente") == []
+
+
+@trigram_only
+def test_trigram_finds_substrings_and_compact_plates(tmp_path):
+    path = _index(tmp_path)
+    assert search_index._tokenizers[path] == "trigram"
+    assert _found(path, "rez") == [("Compra", 1), ("Venta", 1)]
+    assert _found(path, "123cd") == [("Compra", 1)]
+    assert _found(path, "xy987") == [("Venta", 1)]
+    assert _found(path, "ab 123") == [("Compra", 1)]
+
+
+@trigram_only
+def test_short_terms_are_matched_with_like(tmp_path):
+    path = _index(tmp_path)
+    # "cd" and "ab" are too short for trigrams: filtered with LIKE on the indexed text
+    assert _found(path, "cd") == [("Compra", 1)]
+    assert _found(path, "perez xy") == [("Venta", 1)]
+    assert all(hit["score"] == 0.0 for hit in search_index.search(path, "go"))
+    assert _found(path, "go") == [("Compra", 2)]
+
+
+def test_word_prefix_fallback_without_trigrams(tmp_path):
+    path = str(tmp_path / "old.search.db")
+    # An index created by a SQLite build without the trigram tokenizer
+    conn = sqlite3.connect(path)
+    conn.execute(search_index._FTS_SCHEMA.format("unicode61 remove_diacritics 2"))
+    conn.commit()
+    conn.close()
+    _index(tmp_path, "old.search.db")
+    assert search_index._tokenizers[path] == "unicode61"
+    assert _found(path, "per") == [("Compra", 1), ("Venta", 1)]
+    assert _found(path, "go") == [("Compra", 2)]
+    assert _found(path, "ab123cd") == [("Compra", 1)]  # The compact plate is indexed as a word
+    assert _found(path, "rez") == []  # Prefixes only
+    assert _found(path, "123cd") == []
+
+
+def test_index_follows_edits_and_deletes(store, make_row):
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "PÉREZ Hnos", "Cobre", 100, plate="AB 123 CD"), filename=store)
+    daily_excel_logger.upsert_data(2, "Compra", make_row(2, "Compra", "Gómez", "Bronce", 50), filename=store)
+    daily_excel_logger.upsert_data(1, "Venta", make_row(1, "Venta", "Perez Metales", "Cobre", 30), filename=store)
+    hits = daily_excel_logger.search_entries("perez", filename=store)
+    assert sorted((hit["tipo"], hit["id"]) for hit in hits) == [("Compra", 1), ("Venta", 1)]
+
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100, plate="AB 123 CD"), filename=store)
+    assert [(hit["tipo"], hit["id"]) for hit in daily_excel_logger.search_entries("perez", filename=store)] == [("Venta", 1)]
+    assert [hit["contraparte"] for hit in daily_excel_logger.search_entries("acme", filename=store)] == ["Acme"]
+
+    daily_excel_logger.delete_data(1, "Venta", filename=store)
+    assert daily_excel_logger.search_entries("perez", filename=store) == []
+    assert [hit["id"] for hit in daily_excel_logger.search_entries("gomez bronce", filename=store)] == [2]
@@ -0,0 +1,101 @@
+"""
+Tests for the SQLite storage engine: writes, reads, paging, first-use seeding and the workbook export.
+"""
+
+import os
+from datetime import date, timedelta
+
+import openpyxl
+
+import daily_excel_logger
+import sqlite_store
+
+
+def _ids(filename, date_str, entry_type="Compra"):
+    return [entry["id"] for entry in daily_excel_logger.load_data_by_date(date_str, filename)[entry_type]]
+
+
+def test_upsert_and_delete_update_the_store(sqlite_store_file, today, make_row):
+    receipt = daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100), filename=sqlite_store_file)
+    daily_excel_logger.upsert_data(2, "Compra", make_row(2, "Compra", "Beta", "Cobre", 50), filename=sqlite_store_file)
+    daily_excel_logger.upsert_data(1, "Venta", make_row(1, "Venta", "Gamma", "Cobre", 30), filename=sqlite_store_file)
+    assert (receipt.sheet, receipt.entry_id, receipt.entry_type) == (today, 1, "Compra")
+
+    daily_excel_logger.upsert_data(1, "Compra", make_row(1, "Compra", "Acme", "Bronce", 120), filename=sqlite_store_file)
+    assert daily_excel_logger.delete_data(2, "Compra", filename=sqlite_store_file)
+    assert not daily_excel_logger.delete_data(2, "Compra", filename=sqlite_store_file)
+
+    data = daily_excel_logger.load_data_by_date(today, sqlite_store_file)
+    assert [(e["id"], e["mercaderia"], e["neto"]) for e in data["Compra"]] == [(1, "Bronce", 120.0)]
+    assert [(e["id"], e["cliente"]) for e in data["Venta"]] == [(1, "Gamma")]
+    assert daily_excel_logger.list_dates(sqlite_store_file) == [today]
+    assert daily_excel_logger.get_max_ids(sqlite_store_file) == {"Compra": 1, "Venta": 1}
+    # The pesadas live in the workbook's own .db, not in the default SQLITE_DB_PATH
+    db_path = os.path.splitext(sqlite_store_file)[0] + ".db"
+    assert daily_excel_logger._sqlite_path(sqlite_store_file) == db_path
+    assert len(sqlite_store.load_rows(today, db_path)) == 2
+
+
+def test_load_page_walks_dates_in_order(sqlite_store_file, make_row, write_workbook):
+    first = date.today() - timedelta(days=10)
+    days = [(first + timedelta(days=n)).isoformat() for n in range(3)]
+    write_workbook(sqlite_store_file, {
+        days[0]: [make_row(1, "Compra", "A", "Cobre", 10), make_row(2, "Compra", "B", "Cobre", 20)],
+        days[1]: [make_row(3, "Compra", "C", "Cobre", 30), make_row(1, "Venta", "D", "Cobre", 5)],
+        days[2]: [make_row(4, "Compra", "E", "Cobre", 40)],
+    })
+
+    pages = [daily_excel_logger.load_page(days[0], days[2], "Compra", offset=offset, limit=2, filename=sqlite_store_file)
+             for offset in (0, 2, 4)]
+    assert [[(d, e["id"]) for d, _, e in page] for page, _ in pages] == [
+        [(days[0], 1), (days[0], 2)], [(days[1], 3), (days[2], 4)], [],
+    ]
+    assert {total for _, total in pages} == {4}
+
+    page, total = daily_excel_logger.load_page(days[0], days[2], sort="neto", descending=True, limit=3, filename=sqlite_store_file)
+    assert total == 5
+    assert [(tipo, e["id"]) for _, tipo, e in page] == [("Compra", 4), ("Compra", 3), ("Compra", 2)]
+
+
+def test_store_is_seeded_from_the_workbook_only_once(sqlite_store_file, today, make_row, write_workbook):
+    past = (date.today() - timedelta(days=3)).isoformat()
+    write_workbook(sqlite_store_file, {past: [make_row(1, "Compra", "Acme", "Cobre", 100)]})
+    assert _ids(sqlite_store_file, past) == [1]
+
+    assert daily_excel_logger.delete_data(1, "Compra", filename=sqlite_store_file) is False  # Only today's sheet is writable
+    path = daily_excel_logger._sqlite_path(sqlite_store_file)
+    sqlite_store.delete_row(past, 1, "Compra", path)
+    assert sqlite_store.is_empty(path)
+
+    # A restart finds an empty store that was seeded before: the workbook is not imported again
+    daily_excel_logger._sqlite_ready.discard(path)
+    daily_excel_logger.clear_cache()
+    assert _ids(sqlite_store_file, past) == []
+    assert sqlite_store.get_meta("seeded", path) == sqlite_store_file
+
+
+def test_export_workbook_writes_one_sheet_per_date(sqlite_store_file, today, make_row, write_workbook):
+    past = (date.today() - timedelta(days=3)).isoformat()
+    write_workbook(sqlite_store_file, {past: [make_row(1, "Compra", "Acme", "Cobre", 100)]})
+    daily_excel_logger.upsert_data(2, "Compra", make_row(2, "Compra", "Beta", "Cobre", 50), filename=sqlite_store_file)
+    daily_excel_logger.upsert_data(1, "Venta", make_row(1, "Venta", "Gamma", "Cobre", 30), filename=sqlite_store_file)
+
+    assert daily_excel_logger.export_workbook(sqlite_store_file) == 2
+    workbook = openpyxl.load_workbook(sqlite_store_file, read_only=True)
+    try:
+        assert workbook.sheetnames == [past, today]
+        rows = {name: [row[:2] for row in workbook[name].iter_rows(min_row=2, values_only=True)] for name in workbook.sheetnames}
+    finally:
+        workbook.close()
+    assert rows == {past: [(1, "Compra")], today: [(2, "Compra"), (1, "Venta")]}
+
+    # Deleting everything exports a workbook without dated sheets
+    path = daily_excel_logger._sqlite_path(sqlite_store_file)
+    for date_str, row in list(sqlite_store.iter_all_rows(path)):
+        sqlite_store.delete_row(date_str, row[0], row[1], path)
+    assert daily_excel_logger.export_workbook(sqlite_store_file) == 0
+    workbook = openpyxl.load_workbook(sqlite_store_file, read_only=True)
+    try:
+        assert not [name for name in workbook.sheetnames if name.startswith("20")]
+    finally:
+        workbook.close()
@@ -0,0 +1,87 @@
+"""
+Tests for the single-writer actor: batching, per-op errors and restarts.
+"""
+
+import asyncio
+
+import pytest
+
+import daily_excel_logger
+import storage_writer
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_writer_applies_concurrent_writes_as_batches(store, today, make_row):
+    async def scenario():
+        writer = storage_writer.StorageWriter(filename=store)
+        await writer.start()
+        try:
+            receipts = await asyncio.gather(*(
+                writer.upsert(n, "Compra", make_row(n, "Compra", f"Proveedor {n}", "Cobre", n * 10)) for n in range(1, 11)
+            ))
+            deleted = await writer.delete(3, "Compra")
+            missing = await writer.delete(99, "Compra")
+        finally:
+            await writer.stop()
+            writer.thread.shutdown()
+        return writer, receipts, deleted, missing
+
+    writer, receipts, deleted, missing = _run(scenario())
+    assert [receipt.entry_id for receipt in receipts] == list(range(1, 11))
+    assert all(receipt.sheet == today and receipt.confirms(receipt.entry_id, "Compra") for receipt in receipts)
+    assert (deleted, missing) == (True, False)
+    assert writer.stats()["ops"] == 12
+    assert writer.stats()["batches"] < 12
+    ids = [entry["id"] for entry in daily_excel_logger.load_data_by_date(today, store)["Compra"]]
+    assert ids == [1, 2] + list(range(4, 11))
+
+
+def test_a_bad_op_fails_alone(store, today, make_row):
+    async def scenario():
+        writer = storage_writer.StorageWriter(filename=store)
+        await writer.start()
+        try:
+            return await asyncio.gather(
+                writer.upsert(1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100)),
+                writer.submit(("archive", 1, "Compra")),
+                writer.upsert(2, "Compra", ["too", "short"]),
+                writer.upsert(3, "Compra", make_row(3, "Compra", "Beta", "Cobre", 50)),
+                return_exceptions=True,
+            )
+        finally:
+            await writer.stop()
+            writer.thread.shutdown()
+
+    good, unknown, invalid, also_good = _run(scenario())
+    assert isinstance(unknown, ValueError) and "archive" in str(unknown)
+    assert isinstance(invalid, ValueError)
+    assert (good.entry_id, also_good.entry_id) == (1, 3)
+    ids = [entry["id"] for entry in daily_excel_logger.load_data_by_date(today, store)["Compra"]]
+    assert ids == [1, 3]
+
+
+def test_restart_keeps_operations_already_queued(store, today, make_row):
+    async def scenario():
+        writer = storage_writer.StorageWriter(filename=store)
+        await writer.start()
+        queue = writer.queue
+        writer.task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await writer.task
+        # Queued while the task is down: the restarted task must still apply it
+        pending = asyncio.get_running_loop().create_future()
+        await writer.queue.put((("upsert", 1, "Compra", make_row(1, "Compra", "Acme", "Cobre", 100)), pending))
+        try:
+            second = await writer.upsert(2, "Compra", make_row(2, "Compra", "Beta", "Cobre", 50))
+            first = await asyncio.wait_for(pending, timeout=30)
+        finally:
+            await writer.stop()
+            writer.thread.shutdown()
+        return writer.queue is queue, first, second
+
+    same_queue, first, second = _run(scenario())
+    assert same_queue
+    assert (first.entry_id, second.entry_id) == (1, 2)